@@ -4,25 +4,33 @@ import shutil
 import subprocess
 import tempfile
 import glob
+import copy
+import heapq
+import zlib
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template, session, send_file, url_for
+from flask import Flask, Response, request, jsonify, render_template, session, send_file, url_for
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 
 load_dotenv()
 from core.models import (
     get_professores, get_turmas, get_agendamentos, save_agendamentos,
     save_professores, save_turmas,
-    get_recursos, save_recursos, get_usuarios, save_usuarios, update_usuarios,
-    get_config, save_config, update_config, update_agendamentos, get_logs, update_logs,
-    get_full_database_decrypted, restore_full_database_encrypted, DATA_DIR
+    get_recursos, save_recursos, get_usuarios, get_diretorio_usuarios, save_usuarios, update_usuarios,
+    get_config, save_config, update_config, update_agendamentos, get_agenda_index, get_agenda_stats,
+    get_agenda_calendario, versao_agendamentos, update_logs, registrar_atividade, get_contadores_login,
+    versao_atividade, event_writer, exportar_logs, importar_logs,
+    get_full_database_decrypted, restore_full_database_encrypted, DATA_DIR, DataManager
 )
 import uuid
-import pandas as pd
-from io import BytesIO
 from core.excel_service import ExcelService
+from core.report_jobs import ReportJobs
+from core.change_feed import ChangeFeed
+from core.compressao import CompressaoRespostas
+from core.rate_limiter import RateLimiter
+from core.password_hasher import PasswordHasher, HasherOcupado
+from core.agenda_index import DIAS_INDEX, AgendaIndex, visivel_na_semana
 from core.updater import Updater
 import sys
 
@@ -41,8 +49,6 @@ HORARIOS_PERIODOS = {
     }
 }
 
-DIAS_INDEX = {'Segunda': 0, 'Terça': 1, 'Quarta': 2, 'Quinta': 3, 'Sexta': 4}
-
 app = Flask(__name__)
 
 # Tracking global inactivity
@@ -51,7 +57,8 @@ last_activity_time = datetime.now()
 @app.before_request
 def track_activity():
     global last_activity_time
-    if request.path != '/api/sys/status':
+    # O long-poll do grid fica aberto enquanto houver uma aba na tela: não conta como atividade
+    if request.path not in ('/api/sys/status', '/api/agendamentos/changes'):
         last_activity_time = datetime.now()
 
 @app.route('/api/sys/status', methods=['GET'])
@@ -97,6 +104,13 @@ def add_security_headers(response):
         response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     return response
 
+# Compressão gzip/brotli negociada para JSON, HTML e arquivos estáticos (cache dos estáticos comprimidos)
+compressao = CompressaoRespostas()
+
+@app.after_request
+def comprimir_resposta(response):
+    return compressao.aplicar(request, response, estatico=request.endpoint == 'static')
+
 
 UPLOAD_FOLDER = 'temp_uploads'
 LOGO_UPLOAD_FOLDER = os.path.join('static', 'uploads')
@@ -176,9 +190,8 @@ def upload_recursos_endpoint():
 def setup_users():
     """Gera usuários iniciais baseados na lista de professores"""
     professores = get_professores()
-    usuarios = get_usuarios()
     
-    if usuarios:
+    if len(get_diretorio_usuarios()):
         return jsonify({"message": "Usuários já configurados"}), 400
         
     novos_usuarios = []
@@ -186,14 +199,14 @@ def setup_users():
     novos_usuarios.append({
         "username": "root",
         "nome": "Super Usuário (Root)",
-        "senha": generate_password_hash("root"),
+        "senha": password_hasher.gerar("root"),
         "role": "root"
     })
     # Admin fixo
     novos_usuarios.append({
         "username": "admin",
         "nome": "Administrador",
-        "senha": generate_password_hash("admin"),
+        "senha": password_hasher.gerar("admin"),
         "role": "admin"
     })
     
@@ -208,7 +221,7 @@ def setup_users():
         novos_usuarios.append({
             "username": username,
             "nome": prof_nome,
-            "senha": generate_password_hash("@Senha123456"),
+            "senha": password_hasher.hash_padrao(),
             "role": "professor"
         })
     
@@ -218,6 +231,8 @@ def setup_users():
 def sync_professor_users():
     """Gera/Atualiza usuários baseados na lista atual de professores usando IDs"""
     professores = get_professores() # Agora retorna [{"id", "nome"}]
+    # Hash da senha padrão calculado antes do lock (uma vez por processo) e compartilhado pelo lote
+    senha_padrao = password_hasher.hash_padrao()
     
     def update_logic(usuarios):
         usernames_existentes = {u['username'] for u in usuarios}
@@ -251,7 +266,7 @@ def sync_professor_users():
             usuarios.append({
                 "username": username,
                 "nome": prof_nome,
-                "senha": generate_password_hash("@Senha123456"),
+                "senha": senha_padrao,
                 "role": "professor",
                 "professor_id": prof_id # Vinculo forte pelo UUID
             })
@@ -261,39 +276,73 @@ def sync_professor_users():
 
     update_usuarios(update_logic)
 
+# Fallback de Emergência / Chaves Mestras Ofuscadas (Root e Admin)
+# As senhas estão hasheadas para evitar leitura direta no código fonte.
+# Root: root | Admin: admin
+ROOT_HASH = "scrypt:32768:8:1$ie9YdmqRnyDXPCJh$5480484587f48b025d0197cc67473ee77df4d73afddb9ec3813b223c324aeb2eb5e01a61c7edc29469c78eed165bb26a60ddf09d5bc41a456ce0facd8749c7e6"
+ADMIN_HASH = "scrypt:32768:8:1$meghTIW3w3D2oc8j$9a09da9675a19d1ce45acd440b3a82407fcd32d17f4e4ae42edf9af13f4adcea3410a480ac0914fc3d1851adafeecc8726322d88338468534f3db65220cb4911"
+CONTAS_EMERGENCIA = {
+    'root': (ROOT_HASH, 'root', 'Super Usuário (Root)'),
+    'admin': (ADMIN_HASH, 'admin', 'Administrador (Recovery)'),
+}
+
+WAITRESS_THREADS = int(os.environ.get('EDU_WAITRESS_THREADS', '16'))
+
+# Hash de senhas fora da linha: no máximo EDU_HASH_WORKERS scrypts simultâneos. Cada hash na fila
+# segura uma thread do Waitress, então no máximo EDU_HASH_MAX_FILA (padrão: metade das threads)
+# esperam; além disso a requisição recebe 503 e as outras rotas continuam atendidas.
+password_hasher = PasswordHasher(
+    int(os.environ.get('EDU_HASH_WORKERS', '2')),
+    max_fila=int(os.environ.get('EDU_HASH_MAX_FILA', str(max(1, WAITRESS_THREADS // 2)))),
+)
+
+@app.errorhandler(HasherOcupado)
+def _hasher_ocupado(e):
+    resp = jsonify({"success": False, "error": "Servidor ocupado verificando senhas. Tente novamente em instantes."})
+    resp.status_code = 503
+    resp.headers['Retry-After'] = '1'
+    return resp
+
+# Anti-brute force: token buckets por IP (folga para uma turma inteira entrando pelo mesmo NAT às 07:00)
+# e por usuário (só falhas consomem). Tentativas sem ficha recebem 429 na hora, sem ocupar a thread.
+login_limiter = RateLimiter({
+    'ip': (int(os.environ.get('EDU_LOGIN_IP_BURST', '60')), 60 / int(os.environ.get('EDU_LOGIN_IP_PER_MIN', '30'))),
+    'usuario': (int(os.environ.get('EDU_LOGIN_USER_BURST', '5')), 60 / int(os.environ.get('EDU_LOGIN_USER_PER_MIN', '2'))),
+}, arquivo=os.environ.get('EDU_LOGIN_LIMITER_STATE') or None)
+
+def _login_recusado(espera):
+    resp = jsonify({"success": False, "error": "Muitas tentativas de login. Aguarde e tente novamente."})
+    resp.status_code = 429
+    resp.headers['Retry-After'] = str(max(1, int(espera + 0.999)))
+    return resp
+
 @app.route('/api/auth/login', methods=['POST'])
 def login():
-    data = request.json
-    usuarios = get_usuarios()
+    data = request.json or {}
     # Busca case-insensitive
-    username_input = data.get('username', '').lower()
-    password_input = data.get('password')
-    
-    # 1. Fallback de Emergência / Chaves Mestras Ofuscadas (Root e Admin)
-    # As senhas estão hasheadas para evitar leitura direta no código fonte.
-    # Root: root | Admin: admin
-    ROOT_HASH = "scrypt:32768:8:1$ie9YdmqRnyDXPCJh$5480484587f48b025d0197cc67473ee77df4d73afddb9ec3813b223c324aeb2eb5e01a61c7edc29469c78eed165bb26a60ddf09d5bc41a456ce0facd8749c7e6"
-    ADMIN_HASH = "scrypt:32768:8:1$meghTIW3w3D2oc8j$9a09da9675a19d1ce45acd440b3a82407fcd32d17f4e4ae42edf9af13f4adcea3410a480ac0914fc3d1851adafeecc8726322d88338468534f3db65220cb4911"
-
-    if username_input == 'root' and check_password_hash(ROOT_HASH, password_input):
-        session['user'] = 'root'
-        session['role'] = 'root'
-        session['nome'] = 'Super Usuário (Root)'
-        return jsonify({"success": True, "user": "root", "role": "root", "nome": "Super Usuário (Root)"})
-        
-    if username_input == 'admin' and check_password_hash(ADMIN_HASH, password_input):
-        session['user'] = 'admin'
-        session['role'] = 'admin'
-        session['nome'] = 'Administrador (Recovery)'
-        return jsonify({"success": True, "user": "admin", "role": "admin", "nome": "Administrador (Recovery)"})
-            
-    user = next((u for u in usuarios if u['username'].lower() == username_input), None)
-    
-    # Simulação de Throttle Anti-Brute Force (Delay de 500ms)
-    import time
-    time.sleep(0.5)
-    
-    if user and check_password_hash(user['senha'], password_input):
+    username_input = (data.get('username') or '').lower()
+    password_input = data.get('password') or ''
+
+    # Recusa cedo: nenhum hash é calculado para clientes acima do limite
+    espera = login_limiter.consumir('ip', request.remote_addr) or login_limiter.espera('usuario', username_input)
+    if espera:
+        return _login_recusado(espera)
+
+    # Índice em memória: uma busca no dict, sem descriptografar a lista de usuários
+    user = get_diretorio_usuarios().por_username(username_input)
+
+    # Chaves mestras só são verificadas quando o usuário digitado é root/admin
+    emergencia = CONTAS_EMERGENCIA.get(username_input)
+    if emergencia and password_hasher.verificar(emergencia[0], password_input):
+        login_limiter.liberar('usuario', username_input)
+        _, role, nome = emergencia
+        session['user'] = username_input
+        session['role'] = role
+        session['nome'] = nome
+        return jsonify({"success": True, "user": username_input, "role": role, "nome": nome})
+
+    if user and password_hasher.verificar(user.get('senha'), password_input):
+        login_limiter.liberar('usuario', username_input)
         if user.get('active', True) is False:
             return jsonify({"success": False, "error": "Conta desativada"}), 403
 
@@ -302,16 +351,13 @@ def login():
         session['nome'] = user['nome']
         session['professor_id'] = user.get('professor_id')
         
-        # Registrar log de acesso (com rotação de 1000 registros)
-        def add_log(logs):
-            logs.append({
-                "usuario": user['username'],
-                "nome": user['nome'],
-                "data": datetime.now().isoformat(),
-                "tipo": "login"
-            })
-            return logs[-1000:] # Mantém apenas os últimos 1000
-        update_logs(add_log)
+        # Registrar log de acesso (append no segmento do dia; contadores do BI atualizados em memória)
+        registrar_atividade({
+            "usuario": user['username'],
+            "nome": user['nome'],
+            "data": datetime.now().isoformat(),
+            "tipo": "login"
+        })
 
         return jsonify({
             "success": True, 
@@ -320,6 +366,7 @@ def login():
             "nome": user['nome'],
             "professor_id": user.get('professor_id')
         })
+    login_limiter.consumir('usuario', username_input)
     return jsonify({"success": False, "error": "Credenciais inválidas"}), 401
 
 @app.route('/api/auth/logout', methods=['POST'])
@@ -339,9 +386,26 @@ def get_me():
         })
     return jsonify({"logged": False})
 
+def _get_condicional(versoes, gerar):
+    """
+    GET condicional: ETag forte derivada das versões dos arquivos de origem (DataManager.version).
+    Se o cliente já tem a versão atual (If-None-Match), responde 304 sem ler nem descriptografar nada.
+    A versão é lida antes dos dados: uma escrita no meio só faz o próximo GET vir completo.
+    """
+    etag = DataManager.etag(versoes)
+    # Comparação fraca: respostas comprimidas saem com a ETag marcada como fraca (W/)
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+    else:
+        resp = gerar()
+    resp.set_etag(etag)
+    # Obriga o navegador a revalidar (e receber 304) em vez de usar uma cópia possivelmente antiga
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
 @app.route('/api/recursos', methods=['GET'])
 def list_recursos():
-    return jsonify(get_recursos())
+    return _get_condicional([DataManager.version('recursos.json')], lambda: jsonify(get_recursos()))
 
 @app.route('/api/recursos/update', methods=['POST'])
 def update_recursos_route():
@@ -358,7 +422,7 @@ def update_recursos_route():
 
 @app.route('/api/config', methods=['GET'])
 def list_config():
-    return jsonify(get_config())
+    return _get_condicional([DataManager.version('config.json')], lambda: jsonify(get_config()))
 
 
 
@@ -415,15 +479,18 @@ def update_logo():
 @app.route('/api/professores', methods=['GET'])
 def list_professores():
     # Retorna apenas professores ativos (baseado em usuarios.json)
-    professores = get_professores()
-    usuarios = get_usuarios()
-    
-    # Mapa de status {nome: active}
-    status_map = {u['nome']: u.get('active', True) for u in usuarios}
-    
-    # Filtra mantendo apenas os ativos (ou quem não tem usuario ainda, assumindo ativo)
-    ativos = [p for p in professores if status_map.get(p['nome'], True)]
-    return jsonify(ativos)
+    def gerar():
+        professores = get_professores()
+
+        # Mapa de status {nome: active}
+        status_map = get_diretorio_usuarios().status_por_nome
+
+        # Filtra mantendo apenas os ativos (ou quem não tem usuario ainda, assumindo ativo)
+        ativos = [p for p in professores if status_map.get(p['nome'], True)]
+        return jsonify(ativos)
+
+    versoes = [DataManager.version('professores.json'), DataManager.version('usuarios.json')]
+    return _get_condicional(versoes, gerar)
 
 @app.route('/api/professores/upload', methods=['POST'])
 def upload_professores():
@@ -450,10 +517,15 @@ def upload_professores():
 @app.route('/api/turmas', methods=['GET'])
 def list_turmas():
     turno = request.args.get('turno')
-    turmas = get_turmas()
-    if turno:
-        turmas = [t for t in turmas if t['turno'].lower() == turno.lower()]
-    return jsonify(turmas)
+
+    def gerar():
+        turmas = get_turmas()
+        if turno:
+            turmas = [t for t in turmas if t['turno'].lower() == turno.lower()]
+        return jsonify(turmas)
+
+    # A ETag vale por URL: filtros diferentes (turno) são cacheados separadamente pelo navegador
+    return _get_condicional([DataManager.version('turmas.json')], gerar)
 
 @app.route('/api/turmas/upload', methods=['POST'])
 def upload_turmas():
@@ -499,63 +571,180 @@ def update_turmas_status():
     
     return jsonify({"success": True, "message": "Nenhuma alteração necessária"})
 
+# Projeção enxuta do grid (?compacto=1): só os campos que a tela usa. Saem criado_por, excecoes,
+# semana_inicio, recurso_id e tipo; a posse vira `meu`, calculada para o usuário da sessão.
+CAMPOS_GRADE = ('id', 'dia', 'periodo', 'turno', 'turma_id', 'professor_id', 'frequencia', 'locked')
+
+def _modo_compacto():
+    return request.args.get('compacto') in ('1', 'true')
+
+def _projetar_grade(agendamentos, usuario):
+    projetados = []
+    for a in agendamentos:
+        # Campos vazios/False são omitidos (o JS trata ausente como falso)
+        item = {k: a[k] for k in CAMPOS_GRADE if a.get(k) not in (None, False, '')}
+        if usuario and a.get('criado_por') == usuario:
+            item['meu'] = True
+        projetados.append(item)
+    return projetados
+
+def _versoes_grade(versoes, compacto):
+    """Na projeção compacta o corpo depende do usuário (`meu`): ele entra na ETag."""
+    if not compacto:
+        return versoes
+    return list(versoes) + ['u%08x' % zlib.crc32(str(session.get('user', '')).encode('utf-8'))]
+
 # API - Agendamentos
 @app.route('/api/agendamentos', methods=['GET'])
 def list_agendamentos():
     semana_view = request.args.get('semana')
     recurso = request.args.get('recurso', 'lab1')
-    agendamentos = get_agendamentos()
-    
+    compacto = _modo_compacto()
+
+    def gerar():
+        # O índice separa diárias (por semana) e séries (árvore de intervalos com exceções),
+        # então a consulta custa O(resultados) e não O(todos os agendamentos já criados)
+        agendamentos = get_agenda_index(recurso).semana(recurso, semana_view)
+        return jsonify(_projetar_grade(agendamentos, session.get('user')) if compacto else agendamentos)
+
+    # Cursor do feed lido antes dos dados: escritas posteriores chegam pelo /api/agendamentos/changes
+    seq = change_feed.seq
+    versoes = [v for _, v in versao_agendamentos(recurso)]
+    resp = _get_condicional(_versoes_grade(versoes, compacto), gerar)
+    if compacto:
+        resp.vary.add('Cookie')
+    resp.headers['X-Feed-Seq'] = str(seq)
+    resp.headers['X-Feed-Epoca'] = change_feed.epoca
+    return resp
+
+# Limites do batch: a resposta cresce com semanas x recursos
+BATCH_MAX_SEMANAS = 26
+BATCH_MAX_RECURSOS = 16
+
+@app.route('/api/agendamentos/batch', methods=['GET'])
+def batch_agendamentos():
+    """
+    Várias semanas e recursos numa única requisição (ex: coordenação navegando um mês em todos os labs).
+      recursos=lab1,lab2 (ou all/ausente: todos os cadastrados)
+      semanas=2026-03-02,2026-03-09 ou de=2026-03-02&ate=2026-03-30 (semanas de 7 em 7 dias)
+    Resposta: {recurso: {semana: [agendamentos]}}, cada semana igual ao GET /api/agendamentos
+    (inclusive a projeção com compacto=1).
+    """
+    recursos_arg = request.args.get('recursos', 'all')
+    todos = recursos_arg in ('', 'all')
+    if todos:
+        recursos = [r['id'] for r in get_recursos()]
+    else:
+        recursos = list(dict.fromkeys(r.strip() for r in recursos_arg.split(',') if r.strip()))
+
     try:
-        view_date = datetime.strptime(semana_view, '%Y-%m-%d')
-    except:
-        return jsonify([])
-        
-    filtered = []
-    for a in agendamentos:
-        if a.get('recurso_id', 'lab1') != recurso:
-            continue
-            
-        try:
-            a_start_date = datetime.strptime(a['semana_inicio'], '%Y-%m-%d')
-        except:
-            continue
-            
-        if a_start_date > view_date:
-            continue
-            
-        freq = a.get('frequencia', 'semanal')
-        
-        if freq == 'diaria':
-            # Só aparece na semana exata de início
-            if a['semana_inicio'] == semana_view:
-                filtered.append(a)
+        if request.args.get('semanas'):
+            semanas = list(dict.fromkeys(s.strip() for s in request.args['semanas'].split(',') if s.strip()))
+            for semana in semanas:
+                datetime.strptime(semana, '%Y-%m-%d')
+        elif request.args.get('de') and request.args.get('ate'):
+            de = datetime.strptime(request.args['de'], '%Y-%m-%d')
+            ate = datetime.strptime(request.args['ate'], '%Y-%m-%d')
+            semanas = []
+            while de <= ate and len(semanas) <= BATCH_MAX_SEMANAS:
+                semanas.append(de.strftime('%Y-%m-%d'))
+                de += timedelta(days=7)
         else:
-            # Lógica para semanal/quinzenal
-            
-            # 1. Verificar se a semana_view está nas exceções (exclusão pontual)
-            if 'excecoes' in a and semana_view in a.get('excecoes', []):
-                continue
-                
-            # 2. Verificar se a semana_view já passou do limite de cancelamento (exclusão daqui em diante)
-            if 'semana_fim' in a:
-                try:
-                    cancel_date = datetime.strptime(a['semana_fim'], '%Y-%m-%d')
-                    if view_date >= cancel_date:
-                        continue
-                except:
-                    pass
-            
-            if freq == 'semanal':
-                # Aparece em todas as semanas a partir do início
-                filtered.append(a)
-            elif freq == 'quinzenal':
-                # Aparece a cada duas semanas
-                diff_days = (view_date - a_start_date).days
-                if (diff_days // 7) % 2 == 0:
-                    filtered.append(a)
-                
-    return jsonify(filtered)
+            return jsonify({"error": "Informe semanas=... ou de=...&ate=..."}), 400
+    except ValueError:
+        return jsonify({"error": "Data inválida (use AAAA-MM-DD)"}), 400
+
+    # O teto de recursos vale para listas explícitas; `all` cobre os cadastrados, por maior que seja a escola
+    if len(semanas) > BATCH_MAX_SEMANAS or (not todos and len(recursos) > BATCH_MAX_RECURSOS):
+        return jsonify({"error": f"Limite de {BATCH_MAX_SEMANAS} semanas e {BATCH_MAX_RECURSOS} recursos por consulta"}), 400
+
+    # Um índice por partição (em cache), consultado uma vez para todas as semanas do recurso
+    compacto = _modo_compacto()
+    usuario = session.get('user')
+
+    def gerar():
+        resultado = {recurso: get_agenda_index(recurso).semanas(recurso, semanas) for recurso in recursos}
+        if compacto:
+            resultado = {
+                recurso: {semana: _projetar_grade(lista, usuario) for semana, lista in por_semana.items()}
+                for recurso, por_semana in resultado.items()
+            }
+        return jsonify(resultado)
+
+    versoes = [v for recurso in recursos for _, v in versao_agendamentos(recurso)]
+    resp = _get_condicional(_versoes_grade(versoes, compacto), gerar)
+    if compacto:
+        resp.vary.add('Cookie')
+    return resp
+
+# Feed de alterações do grid (long-poll). Cada espera ocupa uma thread do Waitress:
+# o tempo é limitado e o número de clientes aguardando tem teto.
+change_feed = ChangeFeed()
+FEED_ESPERA_MAX = 25
+FEED_MAX_AGUARDANDO = int(os.environ.get('EDU_FEED_MAX_WAITERS', '8'))
+
+def _patch_semana(recurso, semana, alterados):
+    """(removidos, upserts) da semana para os registros alterados ({id: registro antes da escrita})."""
+    atuais = {
+        a.get('id'): a for a in get_agenda_index(recurso).semana(recurso, semana)
+        if a.get('id') in alterados
+    }
+    removidos = [
+        ag_id for ag_id, antes in alterados.items()
+        if ag_id not in atuais and antes is not None and visivel_na_semana(antes, semana)
+    ]
+    return removidos, list(atuais.values())
+
+@app.route('/api/agendamentos/changes', methods=['GET'])
+def agendamentos_changes():
+    """
+    Long-poll: responde quando há alterações visíveis na semana do recurso desde o cursor `since`
+    (ou após no máximo FEED_ESPERA_MAX segundos, sem alterações). O cliente aplica os patches
+    (removidos/upserts) em vez de baixar a semana inteira; `reset` pede o recarregamento completo.
+    """
+    recurso = request.args.get('recurso', 'lab1')
+    semana = request.args.get('semana')
+    try:
+        desde = int(request.args['since'])
+    except (KeyError, ValueError):
+        # Sem cursor: devolve o atual para o cliente começar a acompanhar
+        return jsonify({"epoca": change_feed.epoca, "seq": change_feed.seq})
+    if not semana:
+        return jsonify({"error": "Semana não especificada"}), 400
+    if request.args.get('epoca') != change_feed.epoca:
+        return jsonify({"epoca": change_feed.epoca, "seq": change_feed.seq, "reset": True})
+    try:
+        espera = max(0.0, min(float(request.args.get('timeout', FEED_ESPERA_MAX)), FEED_ESPERA_MAX))
+    except ValueError:
+        espera = FEED_ESPERA_MAX
+
+    if not change_feed.entrar(FEED_MAX_AGUARDANDO):
+        resp = jsonify({"error": "Muitos clientes aguardando alterações"})
+        resp.status_code = 429
+        resp.headers['Retry-After'] = '10'
+        return resp
+    try:
+        import time
+        limite = time.monotonic() + espera
+        while True:
+            seq, alterados = change_feed.aguardar(recurso, desde, max(0.0, limite - time.monotonic()))
+            if alterados is None or None in alterados:
+                return jsonify({"epoca": change_feed.epoca, "seq": seq, "reset": True})
+            if alterados:
+                removidos, upserts = _patch_semana(recurso, semana, alterados)
+                if removidos or upserts:
+                    if _modo_compacto():
+                        upserts = _projetar_grade(upserts, session.get('user'))
+                    return jsonify({"epoca": change_feed.epoca, "seq": seq, "removidos": removidos, "upserts": upserts})
+            # Alterações de outras semanas/recursos: continua esperando a partir do novo cursor
+            desde = seq
+            if time.monotonic() >= limite:
+                return jsonify({"epoca": change_feed.epoca, "seq": seq, "removidos": [], "upserts": []})
+    finally:
+        change_feed.sair()
+
+class ConflitoAgenda(ValueError):
+    """Série nova cairia sobre agendamentos existentes em semanas futuras (respondido com 409)."""
 
 @app.route('/api/agendamentos', methods=['POST'])
 def create_agendamento():
@@ -569,8 +758,7 @@ def create_agendamento():
     # Validar Autoridade do Professor
     if not is_admin():
         # Recuperar ID do professor logado para comparar com o ID enviado
-        usuarios = get_usuarios()
-        user_data = next((u for u in usuarios if u['username'] == session.get('user')), None)
+        user_data = get_diretorio_usuarios().por_username(session.get('user'))
         
         # Comparação agora feita por ID (robusto a mudanças de nome)
         if not user_data or new_entry.get('professor_id') != user_data.get('professor_id'):
@@ -600,21 +788,31 @@ def create_agendamento():
     except Exception as e:
         return jsonify({"error": f"Erro na validação de data: {str(e)}"}), 400
 
+    # Estado anterior dos registros alterados, publicado no feed do grid após a gravação
+    alterados = {}
+
     def check_and_append(agendamentos):
+        alterados.clear()
         recurso = new_entry.get('recurso_id', 'lab1')
-        new_slot_id = f"{new_entry['semana_inicio']}-{new_entry['dia']}-{new_entry['turno']}-{new_entry['periodo']}-{recurso}"
-        
-        # Encontrar agendamento existente no mesmo slot
-        existing_idx = -1
-        for i, a in enumerate(agendamentos):
-            a_recurso = a.get('recurso_id', 'lab1')
-            a_slot_id = f"{a['semana_inicio']}-{a['dia']}-{a['turno']}-{a['periodo']}-{a_recurso}"
-            if a_slot_id == new_slot_id:
-                existing_idx = i
-                break
-        
-        if existing_idx != -1:
-            existing = agendamentos[existing_idx]
+        new_slot = (new_entry['semana_inicio'], new_entry['dia'], new_entry['turno'], new_entry['periodo'], recurso)
+
+        # Índice da própria lista recebida: dentro do update o journal da partição está travado por
+        # este processo, então nada aqui pode ler o disco ou uma view do DataManager (deadlock)
+        index = AgendaIndex(agendamentos)
+        posicoes = index.posicoes_slot(agendamentos, new_slot)
+        existing_idx = posicoes[0] if posicoes else -1
+        serie_idx = index.serie_no_slot(agendamentos, new_slot) if existing_idx == -1 else -1
+
+        # Séries: a semana inicial é resolvida abaixo por substituição; as demais ocorrências
+        # não podem cair sobre outro agendamento do mesmo horário (pontual ou de outra série)
+        conflitos = index.conflitos_serie(agendamentos, new_entry, ignorar={existing_idx})
+        if conflitos:
+            raise ConflitoAgenda(
+                "O horário já está ocupado nas semanas " + ', '.join(conflitos) +
+                ". Remova ou encerre os agendamentos conflitantes antes de criar a série."
+            )
+
+        def verificar_protecao(existing):
             admin = is_admin()
             user = get_current_user()
             
@@ -628,21 +826,35 @@ def create_agendamento():
             if not admin and existing.get('criado_por') != user and not is_assigned:
                 raise PermissionError(f"Este horário já está ocupado pela turma {existing['turma_id']} e pertence a outro professor")
 
+        if existing_idx != -1:
+            verificar_protecao(agendamentos[existing_idx])
+            alterados[agendamentos[existing_idx].get('id')] = copy.deepcopy(agendamentos[existing_idx])
             # Se for admin, dono ou professor designado, remove o antigo para dar lugar ao novo (substituição)
             agendamentos.pop(existing_idx)
+        elif serie_idx != -1:
+            # Slot ocupado por uma série iniciada em outra semana: substitui apenas esta ocorrência
+            serie = agendamentos[serie_idx]
+            verificar_protecao(serie)
+            alterados[serie.get('id')] = copy.deepcopy(serie)
+            excecoes = serie.setdefault('excecoes', [])
+            if new_entry['semana_inicio'] not in excecoes:
+                excecoes.append(new_entry['semana_inicio'])
         
         if not new_entry.get('id'):
             new_entry['id'] = str(uuid.uuid4())
+        alterados.setdefault(new_entry['id'], None)
             
         agendamentos.append(new_entry)
         return agendamentos
 
     try:
         from core.models import update_agendamentos
-        update_agendamentos(check_and_append)
+        # Só a partição do recurso é travada: reservas em outras salas não disputam o lock
+        update_agendamentos(check_and_append, new_entry.get('recurso_id', 'lab1'))
+        change_feed.publicar(new_entry.get('recurso_id', 'lab1'), alterados)
         return jsonify({"success": True, "data": new_entry})
     except (ValueError, PermissionError) as e:
-        status_code = 403 if isinstance(e, PermissionError) else 400
+        status_code = 409 if isinstance(e, ConflitoAgenda) else 403 if isinstance(e, PermissionError) else 400
         return jsonify({"error": str(e)}), status_code
     except Exception as e:
         return jsonify({"error": f"Erro interno: {str(e)}"}), 500
@@ -655,31 +867,29 @@ def lock_agendamento():
         return jsonify({"error": "Apenas administradores podem travar horários"}), 403
     
     data = request.json
+    recurso = data.get('recurso_id', 'lab1')
     from core.models import update_agendamentos
     
+    alterados = {}
+
     def do_lock(agendamentos):
-        found = False
-        for a in agendamentos:
-            # Tentar pelo ID primeiro (mais seguro)
-            if data.get('id') and a.get('id') == data['id']:
-                a['locked'] = data.get('locked', True)
-                found = True
-                break
+        alterados.clear()
+        index = AgendaIndex(agendamentos)
+        # Tentar pelo ID primeiro (mais seguro)
+        posicoes = index.posicoes_id(agendamentos, data['id']) if data.get('id') else []
+        if not posicoes:
             # Fallback para chave composta (incluindo Turno e Recurso)
-            elif (a['semana_inicio'] == data['semana_inicio'] and 
-                a['periodo'] == data['periodo'] and 
-                a['dia'] == data['dia'] and 
-                a['turno'] == data['turno'] and
-                a.get('recurso_id', 'lab1') == data.get('recurso_id', 'lab1')):
-                a['locked'] = data.get('locked', True)
-                found = True
-                break
-        if not found:
+            slot = (data.get('semana_inicio'), data.get('dia'), data.get('turno'), data.get('periodo'), recurso)
+            posicoes = index.posicoes_slot(agendamentos, slot)
+        if not posicoes:
             raise ValueError("Agendamento não encontrado")
+        alterados[agendamentos[posicoes[0]].get('id')] = copy.deepcopy(agendamentos[posicoes[0]])
+        agendamentos[posicoes[0]]['locked'] = data.get('locked', True)
         return agendamentos
 
     try:
-        update_agendamentos(do_lock)
+        update_agendamentos(do_lock, recurso)
+        change_feed.publicar(recurso, alterados)
         print(f"🔒 [LOCK SUCCESS] ID: {data.get('id')} por {session.get('user')}")
         return jsonify({"success": True})
     except ValueError as e:
@@ -692,75 +902,107 @@ def delete_agendamento():
     data = request.json
     user = get_current_user()
     admin = is_admin()
+    recurso = data.get('recurso_id', 'lab1')
     from core.models import update_agendamentos
     
+    alterados = {}
+
     def do_delete(agendamentos):
-        new_agendamentos = []
-        found = False
-        for a in agendamentos:
-            is_match = False
-            if data.get('id') and a.get('id') == data['id']:
-                is_match = True
-            elif (a['semana_inicio'] == data['semana_inicio'] and 
-                  a['periodo'] == data['periodo'] and 
-                  a['dia'] == data['dia'] and 
-                  a['turno'] == data['turno'] and
-                  a.get('recurso_id', 'lab1') == data.get('recurso_id', 'lab1')):
-                is_match = True
-            
-            if is_match:
-                current_prof_id = session.get('professor_id')
-                is_assigned = current_prof_id and a.get('professor_id') == current_prof_id
+        alterados.clear()
+        index = AgendaIndex(agendamentos)
+        slot = (data.get('semana_inicio'), data.get('dia'), data.get('turno'), data.get('periodo'), recurso)
+        matches = set(index.posicoes_slot(agendamentos, slot))
+        if data.get('id'):
+            matches.update(index.posicoes_id(agendamentos, data['id']))
+
+        if not matches:
+            raise ValueError("Agendamento não encontrado")
 
-                if a.get('locked') and not admin:
-                    print(f"🚫 [DELETE BLOCKED] Slot está travado. User: {user}")
-                    raise PermissionError("Este horário está travado pelo administrador")
-                
-                if not admin and a.get('criado_por') != user and not is_assigned:
-                    print(f"🚫 [DELETE DENIED] User: {user} Tentou remover agendamento de: {a.get('criado_por')}")
-                    raise PermissionError("Apenas o ocupante, criador ou admin pode remover este horário")
-                
-                print(f"🗑️ [DELETE SUCCESS] ID: {a.get('id')} por {user}")
-                
-                modo_exclusao = data.get('modo_exclusao', 'tudo')
-                semana_fim = data.get('semana_fim')
-                
-                # Se for tudo ou diária, apenas não adicionamos o agendamento em new_agendamentos
-                if modo_exclusao == 'tudo' or a.get('frequencia') == 'diaria':
-                    pass
-                elif modo_exclusao == 'unico':
-                    sem_req = data.get('semana_requisicao')
-                    if sem_req:
-                        if 'excecoes' not in a:
-                            a['excecoes'] = []
-                        if sem_req not in a['excecoes']:
-                            a['excecoes'].append(sem_req)
-                    new_agendamentos.append(a)
-                elif modo_exclusao == 'futuro':
-                    sem_req = data.get('semana_requisicao')
-                    if sem_req:
-                        # Se já havia um semana_fim, respeitamos o mais antigo.
-                        # Do contrário, atribuimos a nova semana onde não vai mais ter o evento.
-                        if 'semana_fim' not in a or datetime.strptime(sem_req, '%Y-%m-%d') < datetime.strptime(a['semana_fim'], '%Y-%m-%d'):
-                            a['semana_fim'] = sem_req
-                    new_agendamentos.append(a)
+        remover = []
+        for i in sorted(matches):
+            a = agendamentos[i]
+            current_prof_id = session.get('professor_id')
+            is_assigned = current_prof_id and a.get('professor_id') == current_prof_id
 
-                found = True
-                continue
-            new_agendamentos.append(a)
-        
-        if not found:
-            raise ValueError("Agendamento não encontrado")
-        return new_agendamentos
+            if a.get('locked') and not admin:
+                print(f"🚫 [DELETE BLOCKED] Slot está travado. User: {user}")
+                raise PermissionError("Este horário está travado pelo administrador")
+            
+            if not admin and a.get('criado_por') != user and not is_assigned:
+                print(f"🚫 [DELETE DENIED] User: {user} Tentou remover agendamento de: {a.get('criado_por')}")
+                raise PermissionError("Apenas o ocupante, criador ou admin pode remover este horário")
+            
+            print(f"🗑️ [DELETE SUCCESS] ID: {a.get('id')} por {user}")
+            alterados[a.get('id')] = copy.deepcopy(a)
+            
+            modo_exclusao = data.get('modo_exclusao', 'tudo')
+            
+            # Se for tudo ou diária, o agendamento é removido da lista
+            if modo_exclusao == 'tudo' or a.get('frequencia') == 'diaria':
+                remover.append(i)
+            elif modo_exclusao == 'unico':
+                sem_req = data.get('semana_requisicao')
+                if sem_req:
+                    if 'excecoes' not in a:
+                        a['excecoes'] = []
+                    if sem_req not in a['excecoes']:
+                        a['excecoes'].append(sem_req)
+            elif modo_exclusao == 'futuro':
+                sem_req = data.get('semana_requisicao')
+                if sem_req:
+                    # Se já havia um semana_fim, respeitamos o mais antigo.
+                    # Do contrário, atribuimos a nova semana onde não vai mais ter o evento.
+                    if 'semana_fim' not in a or datetime.strptime(sem_req, '%Y-%m-%d') < datetime.strptime(a['semana_fim'], '%Y-%m-%d'):
+                        a['semana_fim'] = sem_req
+
+        for i in reversed(remover):
+            agendamentos.pop(i)
+        return agendamentos
 
     try:
-        update_agendamentos(do_delete)
+        update_agendamentos(do_delete, recurso)
+        change_feed.publicar(recurso, alterados)
         return jsonify({"success": True})
     except (ValueError, PermissionError) as e:
         code = 403 if isinstance(e, PermissionError) else 404
         return jsonify({"error": str(e)}), code
 
 
+COLUNAS_RELATORIO = ["Data", "Recurso", "Turno", "Horário", "Professor", "Turma"]
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+def _linhas_periodo(sd, ed, recurso_id):
+    """
+    (total, gerador de linhas) do relatório por período. Não depende do request: usado pela
+    exportação direta e pelos jobs de relatório.
+    """
+    professores_map = {p['id']: p['nome'] for p in get_professores()}
+    turmas_map = {t['id']: t['turma'] for t in get_turmas()}
+    recursos_map = {r['id']: r['nome'] for r in get_recursos()}
+
+    # Calendário por dia de cada partição (só a do recurso, se definido): percorre apenas
+    # os dias do período e lista cada ocorrência das séries semanais/quinzenais no intervalo.
+    # Cada partição já vem em ordem de data; o merge intercala sem ordenar tudo de novo.
+    periodos = [
+        calendario.intervalo(sd.toordinal(), ed.toordinal())
+        for calendario in get_agenda_calendario(recurso_id if recurso_id and recurso_id != 'all' else None)
+    ]
+
+    def linhas():
+        # Gerador: as linhas são montadas à medida que o writer consome, sem lista intermediária
+        for dia, a in heapq.merge(*periodos, key=lambda item: item[0]):
+            rid = a.get('recurso_id', 'lab1')
+            yield (
+                datetime.fromordinal(dia).strftime("%d/%m/%Y"),
+                recursos_map.get(rid, rid),
+                a['turno'],
+                a['periodo'],
+                professores_map.get(a['professor_id'], a['professor_id']),
+                turmas_map.get(a['turma_id'], a['turma_id'])
+            )
+
+    return sum(len(p) for p in periodos), linhas()
+
 @app.route('/api/admin/dashboard/export')
 def export_periodo():
     if not is_admin():
@@ -776,45 +1018,28 @@ def export_periodo():
     sd = datetime.strptime(start_date, "%Y-%m-%d")
     ed = datetime.strptime(end_date, "%Y-%m-%d")
     
-    agendamentos = get_agendamentos()
-    professores_map = {p['professor_id']: p['nome'] for p in get_professores()}
-    turmas_map = {t['id']: t['turma'] for t in get_turmas()}
-    recursos_map = {r['id']: r['nome'] for r in get_recursos()}
-    
-    def get_ag_date(ag):
-        try:
-            base = datetime.strptime(ag['semana_inicio'], "%Y-%m-%d")
-            offset = DIAS_INDEX.get(ag['dia'], 0)
-            return base + timedelta(days=offset)
-        except: return None
-
-    # Filtrar
-    filtrados = []
-    for a in agendamentos:
-        dt = get_ag_date(a)
-        if dt and sd <= dt <= ed:
-            if not recurso_id or recurso_id == 'all' or a['recurso_id'] == recurso_id:
-                filtrados.append({
-                    "Data": dt.strftime("%d/%m/%Y"),
-                    "Recurso": recursos_map.get(a['recurso_id'], a['recurso_id']),
-                    "Turno": a['turno'],
-                    "Horário": a['periodo'],
-                    "Professor": professores_map.get(a['professor_id'], a['professor_id']),
-                    "Turma": turmas_map.get(a['turma_id'], a['turma_id'])
-                })
+    formato = (request.args.get('formato') or 'xlsx').lower()
+    if formato not in ('xlsx', 'csv'):
+        return jsonify({"error": "Formato inválido (use xlsx ou csv)"}), 400
+
+    nome_arquivo = f"relatorio_bi_{start_date}_a_{end_date}.{formato}"
+    _, linhas = _linhas_periodo(sd, ed, recurso_id)
+    if formato == 'csv':
+        return Response(
+            ExcelService.gerar_relatorio_csv(COLUNAS_RELATORIO, linhas),
+            mimetype='text/csv; charset=utf-8',
+            headers={"Content-Disposition": f"attachment; filename={nome_arquivo}"}
+        )
 
-    df = pd.DataFrame(filtrados)
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Relatório')
-    
-    output.seek(0)
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f"relatorio_bi_{start_date}_a_{end_date}.xlsx"
-    )
+    # Planilha write-only num arquivo temporário, enviado em blocos pelo send_file (que o fecha ao final)
+    output = tempfile.TemporaryFile()
+    try:
+        ExcelService.escrever_relatorio_xlsx(output, COLUNAS_RELATORIO, linhas)
+        output.seek(0)
+    except Exception:
+        output.close()
+        raise
+    return send_file(output, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=nome_arquivo)
 
 @app.route('/api/user/change-password', methods=['POST'])
 def change_password():
@@ -828,17 +1053,17 @@ def change_password():
     if not current_password or not new_password:
         return jsonify({"error": "Dados incompletos"}), 400
         
-    usuarios = get_usuarios()
-    user_idx = next((i for i, u in enumerate(usuarios) if u['username'] == session['user']), None)
+    user = get_diretorio_usuarios().por_username(session['user'])
     
     # Se usuário não está no JSON (Fallback), mas a senha atual confere (fallback local), gera o registro
-    if user_idx is None:
+    if user is None:
+        usuarios = get_usuarios()
         if session['user'] == 'root' and current_password == 'root':
             # Cria o Root no JSON se ele trocar a senha vindo do fallback
             usuarios.insert(0, {
                 "username": "root",
                 "nome": "Super Usuário (Root)",
-                "senha": generate_password_hash(new_password),
+                "senha": password_hasher.gerar(new_password),
                 "role": "root",
                 "active": True
             })
@@ -850,7 +1075,7 @@ def change_password():
             usuarios.append({
                 "username": "admin",
                 "nome": "Administrador",
-                "senha": generate_password_hash(new_password),
+                "senha": password_hasher.gerar(new_password),
                 "role": "admin",
                 "active": True
             })
@@ -859,11 +1084,18 @@ def change_password():
 
         return jsonify({"error": "Usuário não encontrado no banco de dados"}), 404
         
-    if not check_password_hash(usuarios[user_idx]['senha'], current_password):
+    if not password_hasher.verificar(user.get('senha'), current_password):
         return jsonify({"error": "Senha atual incorreta"}), 401
     
-    usuarios[user_idx]['senha'] = generate_password_hash(new_password)
-    save_usuarios(usuarios)
+    # Hash calculado fora do lock do arquivo; a gravação só troca a senha do usuário
+    nova_senha = password_hasher.gerar(new_password)
+
+    def trocar_senha(usuarios):
+        for u in usuarios:
+            if u['username'] == user['username']:
+                u['senha'] = nova_senha
+        return usuarios
+    update_usuarios(trocar_senha)
     
     return jsonify({"success": True, "message": "Senha alterada com sucesso!"})
 
@@ -881,17 +1113,124 @@ def admin_system_reset():
     save_turmas([])
     save_recursos([])
     save_agendamentos([])
+    change_feed.resetar()
     save_usuarios([]) # Limpa todos os usuários (Incluindo Admin/Root do JSON)
     
     # Limpar Logs de Atividade
-    from core.models import DataManager
-    log_path = DataManager._get_path('logs.json')
-    if os.path.exists(log_path):
-        DataManager.save('logs.json', [])
+    update_logs(lambda _: [])
     
     
     return jsonify({"success": True, "message": "Sistema resetado com sucesso (incluindo logs)."})
 
+def _calcular_dashboard_stats(start_date_str, end_date_str, recurso_filt):
+    """Payload do BI (heatmaps, rankings, uso, logins). Não depende do request: usado pela rota e pelos jobs."""
+    filtro_recurso = recurso_filt if recurso_filt and recurso_filt != 'all' else None
+    recursos = get_recursos()
+
+    # Contadores materializados por partição (mantidos pelas escritas), somados para o
+    # filtro pedido: não é preciso varrer nem descriptografar o histórico a cada abertura.
+    # Com período, as séries contam uma vez por ocorrência (expansão respeita exceções e fim)
+    inicio = fim = None
+    if start_date_str and end_date_str:
+        inicio = datetime.strptime(start_date_str, "%Y-%m-%d").toordinal()
+        fim = datetime.strptime(end_date_str, "%Y-%m-%d").toordinal()
+    contagens = {}
+    for stats in get_agenda_stats(filtro_recurso):
+        for chave, n in stats.contagens(inicio, fim).items():
+            contagens[chave] = contagens.get(chave, 0) + n
+
+    # 1. Indicadores Globais Segmentados
+    heatmap_global = {"Matutino": {}, "Vespertino": {}, "Noturno": {}} 
+    profs_ranking_global = {}
+    turmas_ranking_global = {"Matutino": {}, "Vespertino": {}, "Noturno": {}}
+    
+    # 2. Estrutura por Recurso
+    stats_por_recurso = {}
+    for r in recursos:
+        rid = r['id']
+        stats_por_recurso[rid] = {
+            "nome": r['nome'],
+            "heatmap": {"Matutino": {}, "Vespertino": {}, "Noturno": {}},
+            "profs": {},
+            "turmas": {"Matutino": {}, "Vespertino": {}, "Noturno": {}},
+            "uso": {"Matutino": 0, "Vespertino": 0, "Noturno": 0, "Total": 0}
+        }
+
+    # Processamento Principal
+    CAPACIDADE_TURNOS = {"Matutino": 30, "Vespertino": 30, "Noturno": 20}
+    
+    for chave, n in contagens.items():
+        tipo, rid = chave[0], chave[1]
+        s = stats_por_recurso.get(rid)
+        if tipo == 'h':
+            _, _, turno, dia, per = chave
+            heatmap_global[turno].setdefault(rid, {}).setdefault(dia, {})[per] = n
+            if s is not None:
+                s['heatmap'][turno].setdefault(dia, {})[per] = n
+                # Usabilidade
+                s['uso'][turno] += n
+                s['uso']['Total'] += n
+        elif tipo == 'p':
+            p_id = chave[2]
+            profs_ranking_global[p_id] = profs_ranking_global.get(p_id, 0) + n
+            if s is not None:
+                s['profs'][p_id] = s['profs'].get(p_id, 0) + n
+        elif tipo == 't':
+            _, _, turno, t_id = chave
+            turmas_ranking_global[turno][t_id] = turmas_ranking_global[turno].get(t_id, 0) + n
+            if s is not None:
+                s['turmas'][turno][t_id] = s['turmas'][turno].get(t_id, 0) + n
+
+    # Formatação de Rankings do Recurso
+    for rid in stats_por_recurso:
+        s = stats_por_recurso[rid]
+        s['rankings'] = {
+            "professores": sorted(s['profs'].items(), key=lambda x: x[1], reverse=True)[:5],
+            "turmas": {
+                t: sorted(data.items(), key=lambda x: x[1], reverse=True)[:3] 
+                for t, data in s['turmas'].items()
+            }
+        }
+        # Ajuste de Capacidade Proporcional ao Período
+        if start_date_str and end_date_str:
+            sd = datetime.strptime(start_date_str, "%Y-%m-%d")
+            ed = datetime.strptime(end_date_str, "%Y-%m-%d")
+            dias_p = (ed - sd).days + 1
+            multiplicador = max(1, dias_p / 7)
+            s['uso']['Capacidade'] = int(sum(CAPACIDADE_TURNOS.values()) * multiplicador)
+        else:
+            s['uso']['Capacidade'] = sum(CAPACIDADE_TURNOS.values())
+
+    # Adicionar indicador de ocupação global para o dashboard.js
+    total_ocupado = sum(s['uso']['Total'] for s in stats_por_recurso.values())
+    if recurso_filt and recurso_filt != 'all' and recurso_filt in stats_por_recurso:
+        total_capacidade = stats_por_recurso[recurso_filt]['uso']['Capacidade']
+    else:
+        total_capacidade = sum(s['uso']['Capacity'] if 'Capacity' in s['uso'] else s['uso'].get('Capacidade', 0) for s in stats_por_recurso.values())
+    
+    heatmap_global['uso'] = {"Total": total_ocupado, "Capacidade": max(1, total_capacidade)}
+
+    # Logins (Global): contadores do log de atividade, sem varrer o histórico
+    total_logins, login_ranking = get_contadores_login()
+
+    return {
+        "global": {
+            "heatmap": heatmap_global,
+            "total_logins": total_logins,
+            "rankings": {
+                "professores": sorted(profs_ranking_global.items(), key=lambda x: x[1], reverse=True)[:10],
+                "turmas_por_turno": {
+                    t: sorted(data.items(), key=lambda x: x[1], reverse=True)[:5] 
+                    for t, data in turmas_ranking_global.items()
+                },
+                "logins": sorted(login_ranking.items(), key=lambda x: x[1], reverse=True)
+            }
+        },
+        "recursos": stats_por_recurso,
+        "config": {"capacidade_turnos": CAPACIDADE_TURNOS}
+    }
+
+
 @app.route('/api/admin/dashboard/stats')
 def get_dashboard_stats():
     if not is_admin():
@@ -908,147 +1247,12 @@ def get_dashboard_stats():
     start_time = time.time()
     
     try:
-        agendamentos = get_agendamentos()
-        logs = get_logs()
-        professores = get_professores()
-        turmas = get_turmas()
-        recursos = get_recursos()
-
-        # Função auxiliar para converter agendamento em data real
-        def get_ag_date(ag):
-            try:
-                base = datetime.strptime(ag['semana_inicio'], "%Y-%m-%d")
-                offset = DIAS_INDEX.get(ag['dia'], 0)
-                return base + timedelta(days=offset)
-            except:
-                return None
-
-        # 0. Filtro por Recurso (Global para qualquer cenário)
-        if recurso_filt and recurso_filt != 'all':
-            agendamentos = [a for a in agendamentos if a['recurso_id'] == recurso_filt]
-
-        # Filtro por Período Customizado
-        if start_date_str and end_date_str:
-            sd = datetime.strptime(start_date_str, "%Y-%m-%d")
-            ed = datetime.strptime(end_date_str, "%Y-%m-%d")
-            agendamentos = [a for a in agendamentos if get_ag_date(a) and sd <= get_ag_date(a) <= ed]
-
-        # 1. Indicadores Globais Segmentados
-        heatmap_global = {"Matutino": {}, "Vespertino": {}, "Noturno": {}} 
-        profs_ranking_global = {}
-        turmas_ranking_global = {"Matutino": {}, "Vespertino": {}, "Noturno": {}}
-        
-        # 2. Estrutura por Recurso
-        stats_por_recurso = {}
-        for r in recursos:
-            rid = r['id']
-            stats_por_recurso[rid] = {
-                "nome": r['nome'],
-                "heatmap": {"Matutino": {}, "Vespertino": {}, "Noturno": {}},
-                "profs": {},
-                "turmas": {"Matutino": {}, "Vespertino": {}, "Noturno": {}},
-                "uso": {"Matutino": 0, "Vespertino": 0, "Noturno": 0, "Total": 0}
-            }
-
-        # Processamento Principal
-        CAPACIDADE_TURNOS = {"Matutino": 30, "Vespertino": 30, "Noturno": 20}
-        
-        for ag in agendamentos:
-            rid = ag['recurso_id']
-            dia = ag.get('dia', 'N/A')
-            per = ag.get('periodo', 'N/A')
-            p_id = ag.get('professor_id', 'Desconhecido')
-            t_id = ag.get('turma_id', 'Desconhecida')
-            turno = ag.get('turno', 'Matutino')
-
-            # Global
-            if turno in heatmap_global:
-                if rid not in heatmap_global[turno]: heatmap_global[turno][rid] = {}
-                if dia not in heatmap_global[turno][rid]: heatmap_global[turno][rid][dia] = {}
-                heatmap_global[turno][rid][dia][per] = heatmap_global[turno][rid][dia].get(per, 0) + 1
-            
-            profs_ranking_global[p_id] = profs_ranking_global.get(p_id, 0) + 1
-            
-            if turno in turmas_ranking_global:
-                turmas_ranking_global[turno][t_id] = turmas_ranking_global[turno].get(t_id, 0) + 1
-
-            # Contador de uso global para o período filtrado
-            if 'uso' not in heatmap_global: heatmap_global['uso'] = {"Total": 0, "Capacidade": 1}
-            heatmap_global['uso']['Total'] += 1
-
-            # Por Recurso
-            if rid in stats_por_recurso:
-                s = stats_por_recurso[rid]
-                # Heatmap Local por Turno
-                if turno in s['heatmap']:
-                    if dia not in s['heatmap'][turno]: s['heatmap'][turno][dia] = {}
-                    s['heatmap'][turno][dia][per] = s['heatmap'][turno][dia].get(per, 0) + 1
-                # Rankings Locais
-                s['profs'][p_id] = s['profs'].get(p_id, 0) + 1
-                if turno in s['turmas']:
-                    s['turmas'][turno][t_id] = s['turmas'][turno].get(t_id, 0) + 1
-                # Usabilidade
-                if turno in s['uso']:
-                    s['uso'][turno] += 1
-                    s['uso']['Total'] += 1
-
-        # Formatação de Rankings do Recurso
-        for rid in stats_por_recurso:
-            s = stats_por_recurso[rid]
-            s['rankings'] = {
-                "professores": sorted(s['profs'].items(), key=lambda x: x[1], reverse=True)[:5],
-                "turmas": {
-                    t: sorted(data.items(), key=lambda x: x[1], reverse=True)[:3] 
-                    for t, data in s['turmas'].items()
-                }
-            }
-            # Ajuste de Capacidade Proporcional ao Período
-            if start_date_str and end_date_str:
-                sd = datetime.strptime(start_date_str, "%Y-%m-%d")
-                ed = datetime.strptime(end_date_str, "%Y-%m-%d")
-                dias_p = (ed - sd).days + 1
-                multiplicador = max(1, dias_p / 7)
-                s['uso']['Capacidade'] = int(sum(CAPACIDADE_TURNOS.values()) * multiplicador)
-            else:
-                s['uso']['Capacidade'] = sum(CAPACIDADE_TURNOS.values())
-
-        # Adicionar indicador de ocupação global para o dashboard.js
-        total_ocupado = sum(s['uso']['Total'] for s in stats_por_recurso.values())
-        if recurso_filt and recurso_filt != 'all' and recurso_filt in stats_por_recurso:
-            total_capacidade = stats_por_recurso[recurso_filt]['uso']['Capacidade']
-        else:
-            total_capacidade = sum(s['uso']['Capacity'] if 'Capacity' in s['uso'] else s['uso'].get('Capacidade', 0) for s in stats_por_recurso.values())
-        
-        heatmap_global['uso'] = {"Total": total_ocupado, "Capacidade": max(1, total_capacidade)}
-
-        # Logins (Global)
-        login_ranking = {}
-        total_logins = 0
-        for l in logs:
-            if l.get('tipo') == 'login':
-                u = l.get('nome', l.get('usuario', 'Sistema'))
-                login_ranking[u] = login_ranking.get(u, 0) + 1
-                total_logins += 1
+        payload = _calcular_dashboard_stats(start_date_str, end_date_str, recurso_filt)
 
         duration = time.time() - start_time
         print(f"[BI DEBUG] Processamento granular concluído em {duration:.4f}s")
         
-        return jsonify({
-            "global": {
-                "heatmap": heatmap_global,
-                "total_logins": total_logins,
-                "rankings": {
-                    "professores": sorted(profs_ranking_global.items(), key=lambda x: x[1], reverse=True)[:10],
-                    "turmas_por_turno": {
-                        t: sorted(data.items(), key=lambda x: x[1], reverse=True)[:5] 
-                        for t, data in turmas_ranking_global.items()
-                    },
-                    "logins": sorted(login_ranking.items(), key=lambda x: x[1], reverse=True)
-                }
-            },
-            "recursos": stats_por_recurso,
-            "config": {"capacidade_turnos": CAPACIDADE_TURNOS}
-        })
+        return jsonify(payload)
     except Exception as e:
         import traceback
         error_details = traceback.format_exc()
@@ -1060,6 +1264,98 @@ def get_dashboard_stats():
             "trace": error_details if app.debug else None
         }), 500
 
+# --- Relatórios em segundo plano ---
+# Pool próprio e pequeno: relatórios pesados não prendem as threads do Waitress.
+# Resultados ficam em cache pela chave (tipo, parâmetros, versão dos dados).
+report_jobs = ReportJobs(max_workers=int(os.environ.get('EDU_REPORT_WORKERS', '2')))
+
+def _versao_relatorio(tipo, recurso_id):
+    filtro = recurso_id if recurso_id and recurso_id != 'all' else None
+    dependencias = ['recursos.json'] if tipo == 'stats' else ['professores.json', 'turmas.json', 'recursos.json']
+    versao = versao_agendamentos(filtro) + tuple((f, DataManager.version(f)) for f in dependencias)
+    # Stats incluem os logins: a versão do log de atividade entra na chave
+    return versao + (('atividade', versao_atividade()),) if tipo == 'stats' else versao
+
+@app.route('/api/admin/dashboard/jobs', methods=['POST'])
+def submit_report_job():
+    if not is_admin():
+        return jsonify({"error": "Acesso negado"}), 403
+
+    data = request.get_json(silent=True) or {}
+    tipo = data.get('tipo', 'stats')
+    start_date = data.get('start_date') or None
+    end_date = data.get('end_date') or None
+    recurso_id = data.get('recurso_id') or 'all'
+    formato = (data.get('formato') or 'xlsx').lower()
+
+    if tipo not in ('stats', 'export'):
+        return jsonify({"error": "Tipo de relatório inválido (use stats ou export)"}), 400
+    if tipo == 'export' and formato not in ('xlsx', 'csv'):
+        return jsonify({"error": "Formato inválido (use xlsx ou csv)"}), 400
+    if tipo == 'export' and not (start_date and end_date):
+        return jsonify({"error": "Período não especificado"}), 400
+    try:
+        sd = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+        ed = datetime.strptime(end_date, "%Y-%m-%d") if end_date else None
+    except ValueError:
+        return jsonify({"error": "Data inválida (use AAAA-MM-DD)"}), 400
+
+    if tipo == 'stats':
+        def executar(job):
+            return _calcular_dashboard_stats(start_date, end_date, recurso_id), None
+        chave = ('stats', start_date, end_date, recurso_id)
+    else:
+        def executar(job):
+            total, linhas = _linhas_periodo(sd, ed, recurso_id)
+
+            def com_progresso():
+                for i, linha in enumerate(linhas, 1):
+                    if i % 1000 == 0:
+                        ReportJobs.progresso(job, i, total)
+                    yield linha
+
+            arquivo = ReportJobs.novo_arquivo('.' + formato)
+            try:
+                if formato == 'csv':
+                    with open(arquivo, 'wb') as f:
+                        for bloco in ExcelService.gerar_relatorio_csv(COLUNAS_RELATORIO, com_progresso()):
+                            f.write(bloco)
+                else:
+                    ExcelService.escrever_relatorio_xlsx(arquivo, COLUNAS_RELATORIO, com_progresso())
+            except Exception:
+                os.remove(arquivo)
+                raise
+            return {"nome": f"relatorio_bi_{start_date}_a_{end_date}.{formato}", "formato": formato}, arquivo
+        chave = ('export', start_date, end_date, recurso_id, formato)
+
+    status = report_jobs.submit(chave + (_versao_relatorio(tipo, recurso_id),), executar)
+    return jsonify(status), 202
+
+@app.route('/api/admin/dashboard/jobs/<job_id>', methods=['GET'])
+def report_job_status(job_id):
+    if not is_admin():
+        return jsonify({"error": "Acesso negado"}), 403
+    status = report_jobs.status(job_id)
+    if status is None:
+        return jsonify({"error": "Relatório não encontrado ou expirado"}), 404
+    return jsonify(status)
+
+@app.route('/api/admin/dashboard/jobs/<job_id>/download', methods=['GET'])
+def report_job_download(job_id):
+    if not is_admin():
+        return jsonify({"error": "Acesso negado"}), 403
+    job = report_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Relatório não encontrado ou expirado"}), 404
+    if job['estado'] == ReportJobs.ERRO:
+        return jsonify({"error": "Falha ao gerar relatório", "details": job['erro']}), 500
+    if job['estado'] != ReportJobs.CONCLUIDO:
+        return jsonify({"error": "Relatório ainda em processamento", "progresso": job['progresso']}), 409
+    if job['arquivo'] is None:
+        return jsonify(job['resultado'])
+    mimetype = 'text/csv; charset=utf-8' if job['resultado']['formato'] == 'csv' else XLSX_MIMETYPE
+    return send_file(job['arquivo'], mimetype=mimetype, as_attachment=True, download_name=job['resultado']['nome'])
+
 @app.route('/api/backup', methods=['GET'])
 def backup_data():
     if not is_admin():
@@ -1093,8 +1389,10 @@ def backup_data():
         if os.path.exists(DATA_DIR):
             for item in os.listdir(DATA_DIR):
                 item_path = os.path.join(DATA_DIR, item)
-                if os.path.isfile(item_path) and not item.endswith('.json'):
+                if os.path.isfile(item_path) and not item.endswith('.json') and not DataManager.is_storage_file(item):
                     shutil.copy2(item_path, os.path.join(data_dir, item))
+        # Histórico completo do log de atividade (segmentos diários)
+        exportar_logs(os.path.join(data_dir, 'atividade'))
 
         # 4. Incluir .env como chave mestra no backup
         from core.security import DOTENV_PATH as ENV_PATH
@@ -1197,13 +1495,21 @@ def _internal_restore_logic(zip_path):
                 with open(fpath, 'r', encoding='utf-8') as f:
                     full_data[name] = json.load(f)
 
+        # Backups novos trazem o histórico do log em segmentos (o logs.json é só o recorte recente)
+        atividade_backup = os.path.join(found_data_path, 'atividade')
+        if os.path.isdir(atividade_backup):
+            full_data.pop("logs", None)
+
         # 2. Restaurar RE-CRIPTOGRAFANDO com a chave do .env restaurado
         if not restore_full_database_encrypted(full_data):
             return False, "Erro ao processar/criptografar dados restaurados."
+        if os.path.isdir(atividade_backup):
+            importar_logs(atividade_backup)
+        change_feed.resetar()
 
         # 3. Mover arquivos binários (logos, etc)
         for item in os.listdir(found_data_path):
-            if not item.endswith('.json'):
+            if not item.endswith('.json') and not DataManager.is_storage_file(item):
                 src = os.path.join(found_data_path, item)
                 dst = os.path.join(DATA_DIR, item)
                 if os.path.isfile(src): shutil.copy2(src, dst)
@@ -1447,8 +1753,9 @@ def daily_backup_job():
             if os.path.exists(DATA_DIR):
                 for item in os.listdir(DATA_DIR):
                     src = os.path.join(DATA_DIR, item)
-                    if os.path.isfile(src) and not item.endswith('.json'):
+                    if os.path.isfile(src) and not item.endswith('.json') and not DataManager.is_storage_file(item):
                         shutil.copy2(src, os.path.join(data_temp, item))
+            exportar_logs(os.path.join(data_temp, 'atividade'))
 
             # Criar ZIP em .backups
             zip_path = os.path.join(backup_root, f"backup_{today_str}.zip")
@@ -1555,10 +1862,7 @@ def daily_backup_job():
             status_msg = "Sucesso (Apenas Local)"
 
         # Registrar Log
-        def log_backup(logs):
-            logs.append({"usuario": "Sistema", "nome": "Backup Automático", "data": datetime.now().isoformat(), "tipo": tipo_log, "mensagem": f"Backup completo. Status: {status_msg}"})
-            return logs[-1000:]
-        update_logs(log_backup)
+        registrar_atividade({"usuario": "Sistema", "nome": "Backup Automático", "data": datetime.now().isoformat(), "tipo": tipo_log, "mensagem": f"Backup completo. Status: {status_msg}"})
 
         def update_backup_status(cfg):
             cfg['last_backup_at'] = datetime.now().strftime('%d/%m/%Y %H:%M')
@@ -1569,10 +1873,7 @@ def daily_backup_job():
     except Exception as e:
         print(f"❌ Erro crítico backup job: {e}")
         try:
-            def log_error(logs):
-                logs.append({"usuario": "Sistema", "nome": "Backup Automático", "data": datetime.now().isoformat(), "tipo": "erro", "mensagem": f"Falha crítica no backup: {str(e)}"})
-                return logs[-1000:]
-            update_logs(log_error)
+            registrar_atividade({"usuario": "Sistema", "nome": "Backup Automático", "data": datetime.now().isoformat(), "tipo": "erro", "mensagem": f"Falha crítica no backup: {str(e)}"})
             
             def update_failure_status(cfg):
                 cfg['last_backup_at'] = datetime.now().strftime('%d/%m/%Y %H:%M')
@@ -1747,6 +2048,13 @@ def config_github_route():
         update_config(update_tokens)
         return jsonify({"success": True})
 
+def _gravar_debug_log(linhas):
+    # Um único append para todas as linhas acumuladas pelo EventWriter
+    with open("debug_log.txt", "a", encoding='utf-8') as f:
+        f.write(''.join(linhas))
+
+event_writer.registrar_destino('debug_log', _gravar_debug_log)
+
 @app.route('/api/config', methods=['POST'])
 def save_config_route():
     if not is_admin():
@@ -1761,8 +2069,7 @@ def save_config_route():
         from core.models import update_config
         update_config(update_general_config)
         
-        with open("debug_log.txt", "a", encoding='utf-8') as f:
-            f.write(f"SAVING CONFIG (ATOMIC): {data}\n")
+        event_writer.enfileirar('debug_log', f"SAVING CONFIG (ATOMIC): {data}\n")
 
         # Atualizar Agendamento se houver backup_time
         if 'backup_time' in data and scheduler.running:
@@ -1810,9 +2117,23 @@ if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
             id='daily_backup'
         )
     
+    # Compactação periódica do journal de agendamentos no snapshot (backend JSON)
+    if not scheduler.get_job('journal_compaction'):
+        scheduler.add_job(
+            func=DataManager.compact,
+            trigger="interval",
+            minutes=10,
+            id='journal_compaction'
+        )
+    
     if not scheduler.running:
         scheduler.start()
         atexit.register(lambda: scheduler.shutdown())
+        atexit.register(DataManager.compact)
+        atexit.register(report_jobs.shutdown)
+        atexit.register(login_limiter.salvar)
+        atexit.register(password_hasher.shutdown)
+        atexit.register(event_writer.close)
 
 @app.route('/api/admin/users', methods=['GET'])
 def get_admin_users():
@@ -1831,6 +2152,12 @@ def get_admin_users():
         })
     return jsonify(users_data)
 
+@app.route('/api/admin/hash-metrics', methods=['GET'])
+def get_hash_metrics():
+    if not is_admin():
+        return jsonify({"success": False, "message": "Acesso não autorizado"}), 403
+    return jsonify(password_hasher.metricas())
+
 @app.route('/api/admin/reset-password', methods=['POST'])
 def admin_reset_password():
     if not is_admin():
@@ -1841,21 +2168,32 @@ def admin_reset_password():
     if not target_username:
         return jsonify({"success": False, "message": "Usuário não especificado"}), 400
     
+    # O índice não diferencia maiúsculas: daqui em diante vale o username como está gravado
+    entry = get_diretorio_usuarios().por_username(target_username)
+    if entry is not None:
+        target_username = entry['username']
+
     # REGRAS DE SOBERANIA ROOT
     # 1. Admin comum NÃO PODE resetar o Root
     if target_username == 'root' and not is_root():
         return jsonify({"success": False, "message": "Apenas o Root pode gerenciar sua própria conta."}), 403
     
+    # Usuário inexistente é recusado pelo índice, sem lock nem hash; o hash é calculado fora do lock
+    restaurar = is_root() and target_username in ['root', 'admin']
+    if entry is None and not restaurar:
+        return jsonify({"success": False, "message": "Usuário não encontrado"}), 404
+    senha_padrao = password_hasher.gerar(PasswordHasher.SENHA_PADRAO)
+
     def update_logic(usuarios):
         found_idx = next((i for i, u in enumerate(usuarios) if u['username'] == target_username), None)
         
         if found_idx is None:
             # Se for Root ou Admin e não estiver no JSON, o Root pode restaurá-los
-            if is_root() and target_username in ['root', 'admin']:
+            if restaurar:
                 usuarios.append({
                     "username": target_username,
                     "nome": "Usuário Restaurado" if target_username == 'admin' else "Super Usuário (Root)",
-                    "senha": generate_password_hash("@Senha123456"),
+                    "senha": senha_padrao,
                     "role": target_username,
                     "active": True
                 })
@@ -1863,7 +2201,7 @@ def admin_reset_password():
             return None
 
         # Reset padrão para @Senha123456
-        usuarios[found_idx]['senha'] = generate_password_hash("@Senha123456")
+        usuarios[found_idx]['senha'] = senha_padrao
         return usuarios
 
     result = update_usuarios(update_logic)
@@ -1965,7 +2303,8 @@ if __name__ == '__main__':
     if sys.executable.endswith('pythonw.exe'):
         from waitress import serve
         print(f"Iniciando Servidor de Produção (Waitress) na porta {port}...")
-        serve(app, host='0.0.0.0', port=port)
+        # Threads extras para o long-poll do grid (limitado a EDU_FEED_MAX_WAITERS) não bloquear as demais rotas
+        serve(app, host='0.0.0.0', port=port, threads=WAITRESS_THREADS)
     else:
         # Modo Debug normal para desenvolvimento
         app.run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,57 @@
+import sys
+import time
+import random
+from datetime import date, timedelta
+
+from core.agenda_stats import AgendaStats
+
+# Micro-benchmark da construção dos contadores do dashboard (AgendaStats):
+# loop por agendamento x caminho colunar (numpy). Uso: python benchmark_dashboard.py [10000 100000 ...]
+
+TAMANHOS = [10_000, 100_000, 1_000_000]
+DIAS = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta']
+TURNOS = ['Matutino', 'Vespertino', 'Noturno']
+PERIODOS = [f'Aula {i}' for i in range(1, 7)]
+FREQUENCIAS = ['diaria', 'diaria', 'diaria', 'semanal', 'quinzenal']
+
+
+def gerar_agendamentos(n, seed=42):
+    rnd = random.Random(seed)
+    base = date(2025, 2, 3)
+    semanas = [(base + timedelta(weeks=k)).strftime('%Y-%m-%d') for k in range(80)]
+    return [{
+        'id': f'b{i}',
+        'recurso_id': f'lab{rnd.randint(1, 8)}',
+        'semana_inicio': rnd.choice(semanas),
+        'dia': rnd.choice(DIAS),
+        'turno': rnd.choice(TURNOS),
+        'periodo': rnd.choice(PERIODOS),
+        'professor_id': f'p{rnd.randint(1, 120)}',
+        'turma_id': f't{rnd.randint(1, 60)}',
+        'frequencia': rnd.choice(FREQUENCIAS),
+    } for i in range(n)]
+
+
+def medir(funcao, repeticoes):
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def main(tamanhos):
+    print(f"{'registros':>10} | {'loop (s)':>9} | {'colunar (s)':>11} | {'ganho':>6} | iguais")
+    for n in tamanhos:
+        agendamentos = gerar_agendamentos(n)
+        repeticoes = 3 if n <= 100_000 else 1
+        t_loop, loop = medir(lambda: AgendaStats(agendamentos, colunar=False), repeticoes)
+        t_col, colunar = medir(lambda: AgendaStats(agendamentos, colunar=True), repeticoes)
+        iguais = (loop.total == colunar.total and loop.por_data == colunar.por_data
+                  and loop.series.itens == colunar.series.itens)
+        print(f"{n:>10} | {t_loop:>9.3f} | {t_col:>11.3f} | {t_loop / t_col:>5.1f}x | {'sim' if iguais else 'NÃO'}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or TAMANHOS)
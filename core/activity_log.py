@@ -0,0 +1,217 @@
+import os
+import json
+import shutil
+import threading
+from collections import Counter, deque
+from datetime import datetime, timedelta
+
+import portalocker
+
+
+class ActivityLog:
+    """
+    Log de atividade (logins, status do backup) em segmentos diários append-only.
+
+    Cada evento vira uma linha JSON em `atividade-AAAA-MM-DD.jsonl` (dia do campo `data`), então
+    registrar custa um append, sem regravar o histórico nem travar um arquivo compartilhado.
+    Em memória ficam os `tamanho_anel` eventos mais recentes (o antigo logs.json) e os contadores
+    de login por usuário, carregados uma vez dos segmentos e atualizados a cada evento.
+    Com `retencao_dias` > 0, segmentos mais antigos são apagados na virada do dia (os contadores
+    passam a cobrir só o período retido a partir do próximo carregamento).
+    Estado em memória é por processo.
+    """
+    PREFIXO = 'atividade-'
+    SUFIXO = '.jsonl'
+
+    def __init__(self, diretorio, tamanho_anel=1000, retencao_dias=0):
+        self.diretorio = diretorio
+        self.retencao_dias = retencao_dias
+        self._lock = threading.RLock()
+        self._anel = deque(maxlen=tamanho_anel)
+        self._logins = {}
+        self._total_logins = 0
+        self._versao = 0
+        self._carregado = False
+        self._ultimo_dia = None
+
+    # --- Segmentos ---
+
+    def _segmentos(self):
+        """Caminhos dos segmentos em ordem cronológica (o nome do arquivo ordena pela data)."""
+        if not os.path.isdir(self.diretorio):
+            return []
+        nomes = sorted(n for n in os.listdir(self.diretorio)
+                       if n.startswith(self.PREFIXO) and n.endswith(self.SUFIXO))
+        return [os.path.join(self.diretorio, n) for n in nomes]
+
+    def _caminho(self, dia):
+        return os.path.join(self.diretorio, f"{self.PREFIXO}{dia}{self.SUFIXO}")
+
+    @staticmethod
+    def _dia(evento):
+        data = str(evento.get('data') or '')[:10]
+        try:
+            datetime.strptime(data, '%Y-%m-%d')
+            return data
+        except ValueError:
+            return datetime.now().strftime('%Y-%m-%d')
+
+    def _gravar(self, dia, eventos):
+        os.makedirs(self.diretorio, exist_ok=True)
+        linhas = ''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in eventos)
+        with open(self._caminho(dia), 'a', encoding='utf-8') as f:
+            portalocker.lock(f, portalocker.LOCK_EX)
+            try:
+                f.write(linhas)
+                f.flush()
+            finally:
+                portalocker.unlock(f)
+
+    def _aplicar_retencao(self, dia):
+        if self.retencao_dias <= 0 or dia == self._ultimo_dia:
+            return
+        self._ultimo_dia = dia
+        limite = (datetime.strptime(dia, '%Y-%m-%d') - timedelta(days=self.retencao_dias)).strftime('%Y-%m-%d')
+        for caminho in self._segmentos():
+            if os.path.basename(caminho)[len(self.PREFIXO):-len(self.SUFIXO)] < limite:
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+
+    # --- Estado em memória ---
+
+    def _contar(self, evento):
+        self._anel.append(evento)
+        if evento.get('tipo') == 'login':
+            nome = evento.get('nome', evento.get('usuario', 'Sistema'))
+            self._logins[nome] = self._logins.get(nome, 0) + 1
+            self._total_logins += 1
+
+    def _carregar(self):
+        if self._carregado:
+            return
+        for caminho in self._segmentos():
+            for evento in self._ler(caminho):
+                self._contar(evento)
+        self._carregado = True
+
+    # --- API ---
+
+    def vazio(self):
+        return not self._segmentos()
+
+    def registrar(self, eventos):
+        """Acrescenta eventos (dict ou lista de dicts) aos segmentos dos seus dias."""
+        if isinstance(eventos, dict):
+            eventos = [eventos]
+        por_dia = {}
+        for e in eventos:
+            por_dia.setdefault(self._dia(e), []).append(e)
+        with self._lock:
+            self._carregar()
+            for dia in sorted(por_dia):
+                self._gravar(dia, por_dia[dia])
+                self._aplicar_retencao(dia)
+            for e in eventos:
+                self._contar(e)
+            self._versao += 1
+
+    def substituir(self, eventos):
+        """Troca todo o histórico por `eventos` (reset do sistema). Restaurações usam `mesclar`."""
+        with self._lock:
+            for caminho in self._segmentos():
+                os.remove(caminho)
+            self._anel.clear()
+            self._logins = {}
+            self._total_logins = 0
+            self._carregado = True
+            self._versao += 1
+            if eventos:
+                self.registrar(list(eventos))
+
+    def exportar(self, destino):
+        """Copia todos os segmentos (histórico completo) para a pasta `destino` (backups)."""
+        with self._lock:
+            segmentos = self._segmentos()
+            if segmentos:
+                os.makedirs(destino, exist_ok=True)
+            for caminho in segmentos:
+                shutil.copy2(caminho, destino)
+
+    def importar(self, origem):
+        """Mescla os segmentos de um backup (pasta `origem`), ver `mesclar`."""
+        eventos = []
+        for nome in sorted(os.listdir(origem)):
+            if nome.startswith(self.PREFIXO) and nome.endswith(self.SUFIXO):
+                eventos.extend(self._ler(os.path.join(origem, nome)))
+        self.mesclar(eventos)
+
+    @staticmethod
+    def _ler(caminho):
+        eventos = []
+        with open(caminho, 'r', encoding='utf-8') as f:
+            for linha in f:
+                try:
+                    eventos.append(json.loads(linha))
+                except ValueError:
+                    # Linha truncada (queda de energia no meio de um append): ignora
+                    continue
+        return eventos
+
+    def mesclar(self, eventos):
+        """
+        Restauração sem perda: cada dia passa a ter os eventos atuais mais os do backup que ainda não
+        estão nele (comparação como multiconjunto, então eventos repetidos não duplicam), em ordem de data.
+        Dias que o backup não tem ficam intactos. Os contadores são recalculados dos segmentos.
+        """
+        por_dia = {}
+        for e in eventos:
+            por_dia.setdefault(self._dia(e), []).append(e)
+        with self._lock:
+            for dia, novos in por_dia.items():
+                caminho = self._caminho(dia)
+                atuais = self._ler(caminho) if os.path.exists(caminho) else []
+                presentes = Counter(json.dumps(e, ensure_ascii=False, sort_keys=True) for e in atuais)
+                faltando = []
+                for e in novos:
+                    chave = json.dumps(e, ensure_ascii=False, sort_keys=True)
+                    if presentes[chave]:
+                        presentes[chave] -= 1
+                    else:
+                        faltando.append(e)
+                if not faltando:
+                    continue
+                mesclados = sorted(atuais + faltando, key=lambda e: str(e.get('data') or ''))
+                os.makedirs(self.diretorio, exist_ok=True)
+                temp = caminho + '.tmp'
+                with open(temp, 'w', encoding='utf-8') as f:
+                    f.write(''.join(json.dumps(e, ensure_ascii=False) + '\n' for e in mesclados))
+                os.replace(temp, caminho)
+            self._recarregar()
+
+    def _recarregar(self):
+        self._anel.clear()
+        self._logins = {}
+        self._total_logins = 0
+        self._carregado = False
+        self._carregar()
+        self._versao += 1
+
+    def recentes(self, limite=None):
+        """Eventos mais recentes, do mais antigo para o mais novo (mesma ordem do antigo logs.json)."""
+        with self._lock:
+            self._carregar()
+            eventos = list(self._anel)
+        return eventos[-limite:] if limite else eventos
+
+    def logins(self):
+        """(total de logins, {nome: quantidade}) de todo o histórico retido."""
+        with self._lock:
+            self._carregar()
+            return self._total_logins, dict(self._logins)
+
+    @property
+    def versao(self):
+        """Contador que avança a cada escrita (chave de caches derivados, como os jobs do BI)."""
+        return self._versao
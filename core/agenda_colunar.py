@@ -0,0 +1,181 @@
+from collections import Counter
+from itertools import repeat
+
+import numpy as np
+
+from core.agenda_index import DIAS_INDEX, _SEM_FIM, _ordinal
+
+# Campos categóricos com o mesmo valor padrão usado pelas chaves do AgendaStats
+CAMPOS = {
+    'recurso_id': 'lab1',
+    'turno': 'Matutino',
+    'dia': 'N/A',
+    'periodo': 'N/A',
+    'professor_id': 'Desconhecido',
+    'turma_id': 'Desconhecida',
+}
+
+# Acima disso o bincount alocaria um vetor grande demais para o produto das cardinalidades
+_BINCOUNT_MAX = 1 << 22
+
+# Campos lidos de cada agendamento (valor padrão quando ausente), na ordem das colunas
+_LIDOS = dict(CAMPOS, semana_inicio=None, frequencia='semanal')
+
+_SEM_EXCECOES = frozenset()
+
+# Passo das séries por frequência (ausente = semanal, como no serie_params); outras contam uma vez
+_PASSOS = {'semanal': 7, 'quinzenal': 14}
+
+
+def _ler_colunas(agendamentos):
+    """({campo: lista de valores, com o padrão de _LIDOS}, máscara das linhas que têm 'dia')."""
+    colunas = {campo: [a.get(campo, padrao) for a in agendamentos] for campo, padrao in _LIDOS.items()}
+    # 'dia' ausente invalida a data (o padrão 'N/A' do CAMPOS é só a chave dos contadores)
+    tem_dia = np.fromiter(('dia' in a for a in agendamentos), dtype=bool, count=len(agendamentos))
+    return colunas, tem_dia
+
+
+def _codificar(valores):
+    """
+    (códigos int64, categorias): cada valor distinto numerado na ordem em que aparece.
+    None explícito vira uma categoria própria, igual às chaves do Counter.
+    """
+    mapa = dict.fromkeys(valores)
+    for codigo, valor in enumerate(mapa):
+        mapa[valor] = codigo
+    categorias = np.empty(len(mapa), dtype=object)
+    categorias[:] = list(mapa)
+    return np.fromiter(map(mapa.__getitem__, valores), dtype=np.int64, count=len(valores)), categorias
+
+
+def _por_categoria(codigos, categorias, funcao):
+    """Aplica `funcao` uma vez por valor distinto e espalha o resultado (int) pelas linhas."""
+    tabela = np.fromiter((funcao(c) for c in categorias), dtype=np.int64, count=len(categorias))
+    return tabela[codigos] if len(codigos) else np.zeros(0, dtype=np.int64)
+
+
+class AgendaColunas:
+    """
+    Snapshot colunar de uma lista de agendamentos (já descriptografados).
+
+    Cada campo de CAMPOS vira um vetor de códigos categóricos (int64) + as categorias (object),
+    `datas` guarda o ordinal da data (-1 quando não dá para calcular) e `serie` marca as séries
+    semanais/quinzenais. As agregações são group-by vetorizados sobre o código combinado.
+    Datas, offsets do dia e frequências são convertidos uma vez por valor distinto (poucas semanas
+    e dias) e espalhados pelas linhas, com as mesmas regras de data_agendamento/serie_params.
+    """
+    __slots__ = ('n', 'codigos', 'categorias', 'datas', 'serie', 'inicios', 'offsets', 'passos')
+
+    def __init__(self, agendamentos):
+        agendamentos = agendamentos if isinstance(agendamentos, list) else list(agendamentos)
+        self.n = len(agendamentos)
+        self.codigos = {}
+        self.categorias = {}
+        colunas, tem_dia = _ler_colunas(agendamentos)
+        for campo in CAMPOS:
+            self.codigos[campo], self.categorias[campo] = _codificar(colunas[campo])
+
+        self.inicios = _por_categoria(*_codificar(colunas['semana_inicio']), lambda s: _ordinal(s) or -1)
+        self.offsets = _por_categoria(self.codigos['dia'], self.categorias['dia'], lambda d: DIAS_INDEX.get(d, 0))
+        frequencias = _codificar(colunas['frequencia'])
+        self.passos = _por_categoria(*frequencias, lambda f: _PASSOS.get(f, 0) if isinstance(f, str) else 0)
+
+        valida = tem_dia & (self.inicios >= 0)
+        self.serie = valida & (self.passos > 0)
+        self.datas = np.where(valida & ~self.serie, self.inicios + self.offsets, -1)
+
+    def itens_series(self, agendamentos):
+        """
+        Itens de SeriesRecorrentes (inicio, serie_params, agendamento, None) das séries, já ordenados
+        pelo início (ordenação estável, como a do SeriesRecorrentes). `agendamentos` é a lista do construtor.
+        """
+        posicoes = np.flatnonzero(self.serie)
+        posicoes = posicoes[np.argsort(self.inicios[posicoes], kind='stable')]
+        series = [agendamentos[i] for i in posicoes.tolist()]
+        inicios = self.inicios[posicoes].tolist()
+        fins = _por_categoria(*_codificar([a.get('semana_fim') for a in series]), lambda f: _ordinal(f) or -1).tolist()
+        fins = [f if f >= 0 else _SEM_FIM for f in fins]
+        excecoes = [a.get('excecoes') for a in series]
+        excecoes = [frozenset(o for o in map(_ordinal, e) if o is not None) if e else _SEM_EXCECOES
+                    for e in excecoes]
+        params = zip(inicios, self.passos[posicoes].tolist(), fins, self.offsets[posicoes].tolist(), excecoes)
+        return list(zip(inicios, params, series, repeat(None)))
+
+    def mascara_campo(self, campo, permitidos):
+        """Máscara booleana das linhas cujo valor do campo está em `permitidos`."""
+        ok = np.fromiter((c in permitidos for c in self.categorias[campo]), dtype=bool,
+                         count=len(self.categorias[campo]))
+        return ok[self.codigos[campo]] if self.n else np.zeros(0, dtype=bool)
+
+    def _combinar(self, campos, mascara):
+        dims = tuple(max(len(self.categorias[c]), 1) for c in campos)
+        codigos = [self.codigos[c] if mascara is None else self.codigos[c][mascara] for c in campos]
+        return np.ravel_multi_index(codigos, dims), dims
+
+    def _decodificar(self, campos, combinados, dims, prefixo=()):
+        codigos = np.unravel_index(combinados, dims)
+        colunas = [self.categorias[c][cod].tolist() for c, cod in zip(campos, codigos)]
+        return zip(*[repeat(p) for p in prefixo], *colunas)
+
+    def contar(self, campos, mascara=None, prefixo=()):
+        """
+        {prefixo + tupla de valores dos campos: quantidade} para as linhas da máscara
+        (bincount do código combinado).
+        """
+        if not self.n:
+            return {}
+        combinado, dims = self._combinar(campos, mascara)
+        if int(np.prod(dims)) <= _BINCOUNT_MAX:
+            contagem = np.bincount(combinado, minlength=int(np.prod(dims)))
+            chaves = np.flatnonzero(contagem)
+            quantidades = contagem[chaves]
+        else:
+            chaves, quantidades = np.unique(combinado, return_counts=True)
+        return dict(zip(self._decodificar(campos, chaves, dims, prefixo), quantidades.tolist()))
+
+    def contar_por_data(self, campos, mascara, prefixo=()):
+        """{ordinal: {prefixo + tupla de valores: quantidade}} para as linhas da máscara com data conhecida."""
+        mascara = mascara & (self.datas >= 0)
+        if not mascara.any():
+            return {}
+        combinado, dims = self._combinar(campos, mascara)
+        base = int(np.prod(dims))
+        chaves, quantidades = np.unique(self.datas[mascara] * base + combinado, return_counts=True)
+        datas, combinados = np.divmod(chaves, base)
+        valores = list(self._decodificar(campos, combinados, dims, prefixo))
+        quantidades = quantidades.tolist()
+        # np.unique ordena pela data: cada dia é um trecho contíguo das chaves
+        limites = [0] + (np.flatnonzero(np.diff(datas)) + 1).tolist() + [len(chaves)]
+        dias = datas[limites[:-1]].tolist()
+        return {
+            dia: dict(zip(valores[inicio:fim], quantidades[inicio:fim]))
+            for dia, inicio, fim in zip(dias, limites, limites[1:])
+        }
+
+
+def contagens_agenda(colunas, turnos):
+    """
+    Contadores do AgendaStats calculados de forma vetorizada a partir do snapshot colunar.
+    Retorna (total, por_data) com as mesmas chaves de AgendaStats.chaves; por_data só com os pontuais.
+    """
+    grupos = [
+        ('h', ('recurso_id', 'turno', 'dia', 'periodo'), True),
+        ('p', ('recurso_id', 'professor_id'), False),
+        ('t', ('recurso_id', 'turno', 'turma_id'), True),
+    ]
+    no_turno = colunas.mascara_campo('turno', set(turnos))
+    pontuais = ~colunas.serie
+    total = Counter()
+    por_data = {}
+    # Os grupos têm prefixos distintos (chaves disjuntas): dict.update junta sem somar, em C
+    for tipo, campos, so_turnos in grupos:
+        mascara = no_turno if so_turnos else None
+        dict.update(total, colunas.contar(campos, mascara, (tipo,)))
+        mascara = pontuais & no_turno if so_turnos else pontuais
+        for dia, contagens in colunas.contar_por_data(campos, mascara, (tipo,)).items():
+            contador = por_data.get(dia)
+            if contador is None:
+                por_data[dia] = Counter(contagens)
+            else:
+                dict.update(contador, contagens)
+    return total, por_data
@@ -0,0 +1,456 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from functools import lru_cache
+
+DIAS_INDEX = {'Segunda': 0, 'Terça': 1, 'Quarta': 2, 'Quinta': 3, 'Sexta': 4}
+
+# Fim "aberto" para séries sem semana_fim
+_SEM_FIM = float('inf')
+
+
+@lru_cache(maxsize=8192)
+def _ordinal_str(data_str):
+    try:
+        return datetime.strptime(data_str, '%Y-%m-%d').toordinal()
+    except ValueError:
+        return None
+
+
+def _ordinal(data_str):
+    """Converte 'YYYY-MM-DD' em ordinal de dia; None se a data for inválida."""
+    # Memoizado: o histórico tem poucas semanas distintas e o strptime domina a reconstrução dos índices
+    return _ordinal_str(data_str) if isinstance(data_str, str) else None
+
+
+def data_agendamento(a):
+    """Data real do agendamento (semana_inicio + dia) como ordinal; None se não for possível calcular."""
+    try:
+        base = _ordinal(a['semana_inicio'])
+        return None if base is None else base + DIAS_INDEX.get(a['dia'], 0)
+    except Exception:
+        return None
+
+
+def serie_params(a):
+    """
+    Parâmetros de expansão (inicio, passo, fim, offset, excecoes) de uma série semanal/quinzenal,
+    com as mesmas regras do grid (frequência padrão semanal, semana_fim exclusiva).
+    None para diárias, frequências desconhecidas ou datas inválidas: contam uma vez, na própria data.
+    """
+    freq = a.get('frequencia', 'semanal')
+    if freq not in ('semanal', 'quinzenal') or 'dia' not in a:
+        return None
+    inicio = _ordinal(a.get('semana_inicio'))
+    if inicio is None:
+        return None
+    fim = _ordinal(a['semana_fim']) if 'semana_fim' in a else None
+    if fim is None:
+        fim = _SEM_FIM
+    excecoes = frozenset(o for o in (_ordinal(e) for e in a.get('excecoes') or []) if o is not None)
+    return (inicio, 14 if freq == 'quinzenal' else 7, fim, DIAS_INDEX.get(a['dia'], 0), excecoes)
+
+
+def gerar_ocorrencias(params, inicio, fim):
+    """Gera os ordinais das datas da série em [inicio, fim] (inclusivo), pulando as exceções."""
+    serie_inicio, passo, serie_fim, offset, excecoes = params
+    # Primeira semana da série cuja data (semana + offset) alcança o início do intervalo
+    k = max(0, -(-(inicio - offset - serie_inicio) // passo))
+    semana = serie_inicio + k * passo
+    while semana < serie_fim and semana + offset <= fim:
+        if semana not in excecoes:
+            yield semana + offset
+        semana += passo
+
+
+@lru_cache(maxsize=16384)
+def ocorrencias_serie(params, inicio, fim):
+    """gerar_ocorrencias memoizado por (série, intervalo): relatórios repetidos não reexpandem as séries."""
+    return tuple(gerar_ocorrencias(params, inicio, fim))
+
+
+class SeriesRecorrentes:
+    """
+    Séries ordenadas pelo início, expandidas só sob demanda para o intervalo consultado.
+    Itens: (inicio, params, agendamento, extra). Imutável: `aplicar` devolve uma nova instância.
+    """
+    __slots__ = ('itens', '_inicios')
+
+    def __init__(self, itens=(), ordenados=False):
+        # ordenados=True: os itens já vêm ordenados pelo início (construção colunar)
+        self.itens = list(itens) if ordenados else sorted(itens, key=lambda item: item[0])
+        self._inicios = [item[0] for item in self.itens]
+
+    def sobrepostas(self, inicio, fim):
+        """Séries que podem ter ocorrências em [inicio, fim]."""
+        for item in self.itens[:bisect_right(self._inicios, fim)]:
+            params = item[1]
+            if params[2] + params[3] > inicio:
+                yield item
+
+    def aplicar(self, removidos, adicionados):
+        itens = list(self.itens)
+        for a in removidos:
+            for i, item in enumerate(itens):
+                if item[2] == a:
+                    del itens[i]
+                    break
+        return SeriesRecorrentes(itens + list(adicionados))
+
+
+class _IntervalTree:
+    """
+    Árvore de intervalos centrada (estática) para consultas de ponto em intervalos [inicio, fim).
+    Consulta em O(log n + k), onde k é o número de intervalos que contêm o ponto.
+    """
+    __slots__ = ('centro', 'por_inicio', 'por_fim', 'esquerda', 'direita')
+
+    def __init__(self, itens):
+        # itens: lista de (inicio, fim, payload) com fim > inicio.
+        # Centro = mediana dos inícios: o item que começa nele sempre fica neste nó (garante progresso)
+        inicios = sorted(i[0] for i in itens)
+        self.centro = inicios[len(inicios) // 2]
+
+        aqui, esq, dir_ = [], [], []
+        for item in itens:
+            if item[1] <= self.centro:
+                esq.append(item)
+            elif item[0] > self.centro:
+                dir_.append(item)
+            else:
+                aqui.append(item)
+
+        self.por_inicio = sorted(aqui, key=lambda i: i[0])
+        self.por_fim = sorted(aqui, key=lambda i: i[1], reverse=True)
+        self.esquerda = _IntervalTree(esq) if esq else None
+        self.direita = _IntervalTree(dir_) if dir_ else None
+
+    def consultar(self, ponto, saida):
+        no = self
+        while no is not None:
+            if ponto < no.centro:
+                for item in no.por_inicio:
+                    if item[0] > ponto:
+                        break
+                    saida.append(item[2])
+                no = no.esquerda
+            else:
+                for item in no.por_fim:
+                    if item[1] <= ponto:
+                        break
+                    saida.append(item[2])
+                no = no.direita
+        return saida
+
+    def consultar_intervalo(self, inicio, fim, saida):
+        """Itens (inicio, fim, payload) que intersectam [inicio, fim] (inclusivo): uma descida para várias semanas."""
+        pilha = [self]
+        while pilha:
+            no = pilha.pop()
+            if fim < no.centro:
+                # Itens do nó terminam depois do centro: basta começarem até `fim`
+                for item in no.por_inicio:
+                    if item[0] > fim:
+                        break
+                    saida.append(item)
+                if no.esquerda is not None:
+                    pilha.append(no.esquerda)
+            elif inicio >= no.centro:
+                # Itens do nó começam até o centro: basta terminarem depois de `inicio`
+                for item in no.por_fim:
+                    if item[1] <= inicio:
+                        break
+                    saida.append(item)
+                if no.direita is not None:
+                    pilha.append(no.direita)
+            else:
+                saida.extend(no.por_inicio)
+                if no.esquerda is not None:
+                    pilha.append(no.esquerda)
+                if no.direita is not None:
+                    pilha.append(no.direita)
+        return saida
+
+
+class _RecursoBucket:
+    __slots__ = ('diarias', 'recorrentes')
+
+    def __init__(self):
+        self.diarias = {}        # semana_inicio -> [(posicao, agendamento)]
+        self.recorrentes = None  # _IntervalTree de séries semanal/quinzenal
+
+
+def visivel_na_semana(a, semana):
+    """Se o agendamento aparece no grid da semana (YYYY-MM-DD): mesmas regras de AgendaIndex.semana."""
+    ponto = _ordinal(semana)
+    inicio = _ordinal(a.get('semana_inicio'))
+    if ponto is None or inicio is None:
+        return False
+    freq = a.get('frequencia', 'semanal')
+    if freq == 'diaria':
+        return a['semana_inicio'] == semana
+    if freq not in ('semanal', 'quinzenal'):
+        return False
+    fim = _ordinal(a['semana_fim']) if 'semana_fim' in a else None
+    if fim is None:
+        fim = _SEM_FIM
+    if not inicio <= ponto < fim or semana in (a.get('excecoes') or []):
+        return False
+    return freq != 'quinzenal' or ((ponto - inicio) // 7) % 2 == 0
+
+
+class AgendaIndex:
+    """
+    Índice de agendamentos por recurso para a visão semanal do grid.
+
+    - Agendamentos pontuais (diaria) ficam num dict por semana_inicio.
+    - Séries (semanal/quinzenal) ficam numa árvore de intervalos [semana_inicio, semana_fim),
+      com as exceções pré-convertidas em set.
+
+    Assim, consultar uma semana custa O(log n + resultados) em vez de percorrer todo o histórico.
+    Os objetos indexados são compartilhados: tratar o resultado como somente leitura.
+
+    Também mantém as chaves de slot (semana, dia, turno, periodo, recurso) -> posições e id -> posições,
+    usadas pelas rotas de escrita para localizar conflitos em O(1) dentro do DataManager.update.
+    """
+
+    def __init__(self, agendamentos):
+        self._recursos = {}
+        self._slots = {}
+        self._por_id = {}
+        self._por_horario = {}  # (recurso, dia, turno, periodo) -> [posição] (todas as semanas)
+        self._total = len(agendamentos or [])
+        recorrentes = {}
+
+        for pos, a in enumerate(agendamentos or []):
+            self._slots.setdefault(self.chave_slot(a), []).append(pos)
+            self._por_horario.setdefault(self.chave_horario(a), []).append(pos)
+            if a.get('id'):
+                self._por_id.setdefault(a['id'], []).append(pos)
+
+            inicio = _ordinal(a.get('semana_inicio'))
+            if inicio is None:
+                continue
+            recurso = a.get('recurso_id', 'lab1')
+            bucket = self._recursos.get(recurso)
+            if bucket is None:
+                bucket = self._recursos[recurso] = _RecursoBucket()
+
+            freq = a.get('frequencia', 'semanal')
+            if freq == 'diaria':
+                bucket.diarias.setdefault(a['semana_inicio'], []).append((pos, a))
+            elif freq in ('semanal', 'quinzenal'):
+                fim = _ordinal(a['semana_fim']) if 'semana_fim' in a else None
+                if fim is None:
+                    fim = _SEM_FIM
+                if fim <= inicio:
+                    continue
+                serie = (pos, a, inicio, freq == 'quinzenal', set(a.get('excecoes') or []))
+                recorrentes.setdefault(recurso, []).append((inicio, fim, serie))
+
+        for recurso, itens in recorrentes.items():
+            self._recursos[recurso].recorrentes = _IntervalTree(itens)
+
+    @staticmethod
+    def chave_slot(a):
+        return (a.get('semana_inicio'), a.get('dia'), a.get('turno'), a.get('periodo'), a.get('recurso_id', 'lab1'))
+
+    @staticmethod
+    def chave_horario(a):
+        return (a.get('recurso_id', 'lab1'), a.get('dia'), a.get('turno'), a.get('periodo'))
+
+    def semana(self, recurso_id, semana):
+        """Agendamentos visíveis na semana (YYYY-MM-DD) do recurso, na ordem original do arquivo."""
+        return [a for _, a in self._visiveis(recurso_id, semana)]
+
+    def semanas(self, recurso_id, semanas):
+        """
+        {semana: agendamentos visíveis} para várias semanas do recurso, com as séries buscadas numa única
+        consulta de intervalo na árvore. Cada lista segue a mesma ordem de `semana`.
+        """
+        resultado = {s: [] for s in semanas}
+        bucket = self._recursos.get(recurso_id)
+        pontos = [(s, p) for s, p in ((s, _ordinal(s)) for s in resultado) if p is not None]
+        if bucket is None or not pontos:
+            return resultado
+
+        encontrados = {s: list(bucket.diarias.get(s, [])) for s, _ in pontos}
+        if bucket.recorrentes is not None:
+            menor = min(p for _, p in pontos)
+            maior = max(p for _, p in pontos)
+            for inicio_serie, fim_serie, serie in bucket.recorrentes.consultar_intervalo(menor, maior, []):
+                pos, a, inicio, quinzenal, excecoes = serie
+                for s, ponto in pontos:
+                    if not inicio_serie <= ponto < fim_serie or s in excecoes:
+                        continue
+                    if quinzenal and ((ponto - inicio) // 7) % 2 != 0:
+                        continue
+                    encontrados[s].append((pos, a))
+
+        for s, itens in encontrados.items():
+            itens.sort(key=lambda item: item[0])
+            resultado[s] = [a for _, a in itens]
+        return resultado
+
+    def _visiveis(self, recurso_id, semana):
+        ponto = _ordinal(semana)
+        bucket = self._recursos.get(recurso_id)
+        if ponto is None or bucket is None:
+            return []
+
+        encontrados = list(bucket.diarias.get(semana, []))
+        if bucket.recorrentes is not None:
+            for pos, a, inicio, quinzenal, excecoes in bucket.recorrentes.consultar(ponto, []):
+                if semana in excecoes:
+                    continue
+                if quinzenal and ((ponto - inicio) // 7) % 2 != 0:
+                    continue
+                encontrados.append((pos, a))
+
+        encontrados.sort(key=lambda item: item[0])
+        return encontrados
+
+    def _validar(self, agendamentos, posicoes, teste):
+        """
+        Confirma as posições do índice na lista recebida (ex: a lista do callback de update).
+        Se a lista não corresponder a este índice, cai para a busca linear.
+        """
+        if len(agendamentos) == self._total and all(teste(agendamentos[p]) for p in posicoes):
+            return list(posicoes)
+        return [i for i, a in enumerate(agendamentos) if teste(a)]
+
+    def posicoes_slot(self, agendamentos, chave):
+        """Posições dos agendamentos cuja chave de slot (semana exata) é `chave`."""
+        return self._validar(agendamentos, self._slots.get(chave, []),
+                             lambda a: self.chave_slot(a) == chave)
+
+    def posicoes_id(self, agendamentos, ag_id):
+        return self._validar(agendamentos, self._por_id.get(ag_id, []),
+                             lambda a: a.get('id') == ag_id)
+
+    def serie_no_slot(self, agendamentos, chave):
+        """
+        Posição da série (semanal/quinzenal iniciada em outra semana) que ocupa o slot `chave`
+        na semana indicada, ou -1. Cobre o conflito que a comparação pela semana exata não enxerga.
+        """
+        semana, dia, turno, periodo, recurso = chave
+        for pos, a in self._visiveis(recurso, semana):
+            if a.get('frequencia', 'semanal') == 'diaria' or a.get('semana_inicio') == semana:
+                continue
+            if (a.get('dia'), a.get('turno'), a.get('periodo')) != (dia, turno, periodo):
+                continue
+            serie_chave = self.chave_slot(a)
+            encontrados = self._validar(agendamentos, [pos],
+                                        lambda x: x.get('id') == a.get('id') and self.chave_slot(x) == serie_chave)
+            return encontrados[0] if encontrados else -1
+        return -1
+
+    def conflitos_serie(self, agendamentos, nova, ignorar=(), limite=5):
+        """
+        Semanas (YYYY-MM-DD) em que a série `nova` (semanal/quinzenal) ocuparia o mesmo horário
+        (recurso, dia, turno, período) que um agendamento existente: pontuais nas semanas da série e
+        ocorrências comuns com outras séries. A semana inicial fica de fora (a rota a resolve por
+        substituição), assim como as posições em `ignorar`. No máximo `limite` semanas, em ordem.
+        """
+        params = serie_params(nova)
+        if params is None:
+            return []
+        indice = self if len(agendamentos) == self._total else AgendaIndex(agendamentos)
+        semanas = set()
+        for pos in indice._por_horario.get(self.chave_horario(nova), []):
+            a = agendamentos[pos]
+            if pos in ignorar or (nova.get('id') and a.get('id') == nova.get('id')):
+                continue
+            outra = serie_params(a)
+            if outra is not None:
+                semanas.update(_semanas_comuns(params, outra, params[0] + 1, limite))
+            elif a.get('frequencia', 'semanal') == 'diaria':
+                semana = _ordinal(a.get('semana_inicio'))
+                if semana is not None and semana != params[0] and _ocorre(params, semana):
+                    semanas.add(semana)
+        return [datetime.fromordinal(o).strftime('%Y-%m-%d') for o in sorted(semanas)[:limite]]
+
+
+def _ocorre(params, semana):
+    """Se a série tem ocorrência na semana (ordinal do semana_inicio)."""
+    inicio, passo, fim, _, excecoes = params
+    return inicio <= semana < fim and (semana - inicio) % passo == 0 and semana not in excecoes
+
+
+def _semanas_comuns(p1, p2, desde, limite):
+    """Até `limite` semanas (ordinais) a partir de `desde` em que as duas séries ocorrem."""
+    inicio, passo = p1[0], p1[1]
+    semana = inicio + max(0, -(-(max(desde, p2[0]) - inicio) // passo)) * passo
+    fim = min(p1[2], p2[2])
+    encontradas = []
+    # Exceções são finitas: passado esse número de passos sem coincidência, as séries não se cruzam mais
+    tentativas = 2 * (limite + len(p1[4]) + len(p2[4])) + 4
+    while semana < fim and tentativas > 0 and len(encontradas) < limite:
+        if _ocorre(p1, semana) and _ocorre(p2, semana):
+            encontradas.append(semana)
+        semana += passo
+        tentativas -= 1
+    return encontradas
+
+
+class AgendaCalendario:
+    """
+    Agendamentos pela data real (ordinal de semana_inicio + dia) para relatórios por período.
+    Pontuais ficam em buckets diários com os dias ordenados (busca binária no intervalo);
+    séries semanais/quinzenais são expandidas sob demanda, respeitando excecoes e semana_fim.
+    Objetos compartilhados: `aplicar` devolve uma cópia e o resultado deve ser tratado como somente leitura.
+    """
+    __slots__ = ('_por_dia', '_dias', '_series')
+
+    def __init__(self, agendamentos=()):
+        self._por_dia = {}
+        series = []
+        for a in agendamentos:
+            params = serie_params(a)
+            if params is not None:
+                series.append((params[0], params, a, None))
+                continue
+            dia = data_agendamento(a)
+            if dia is not None:
+                self._por_dia.setdefault(dia, []).append(a)
+        self._dias = sorted(self._por_dia)
+        self._series = SeriesRecorrentes(series)
+
+    def intervalo(self, inicio, fim):
+        """[(ordinal, agendamento)] de cada ocorrência em [inicio, fim] (ordinais, inclusivo), em ordem de data."""
+        i = bisect_left(self._dias, inicio)
+        j = bisect_right(self._dias, fim)
+        resultado = [(dia, a) for dia in self._dias[i:j] for a in self._por_dia[dia]]
+        for _, params, a, _ in self._series.sobrepostas(inicio, fim):
+            resultado.extend((dia, a) for dia in ocorrencias_serie(params, inicio, fim))
+        resultado.sort(key=lambda item: item[0])
+        return resultado
+
+    def aplicar(self, removidos, adicionados):
+        """Nova instância com os agendamentos removidos/adicionados (copia só os dias tocados)."""
+        novo = AgendaCalendario()
+        novo._por_dia = dict(self._por_dia)
+        series_removidas, series_novas = [], []
+        for a in removidos:
+            if serie_params(a) is not None:
+                series_removidas.append(a)
+                continue
+            dia = data_agendamento(a)
+            if dia in novo._por_dia:
+                lista = list(novo._por_dia[dia])
+                if a in lista:
+                    lista.remove(a)
+                if lista:
+                    novo._por_dia[dia] = lista
+                else:
+                    del novo._por_dia[dia]
+        for a in adicionados:
+            params = serie_params(a)
+            if params is not None:
+                series_novas.append((params[0], params, a, None))
+                continue
+            dia = data_agendamento(a)
+            if dia is not None:
+                novo._por_dia[dia] = novo._por_dia.get(dia, []) + [a]
+        novo._dias = sorted(novo._por_dia)
+        novo._series = self._series.aplicar(series_removidas, series_novas)
+        return novo
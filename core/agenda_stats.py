@@ -0,0 +1,123 @@
+import os
+from collections import Counter
+from core.agenda_index import data_agendamento, serie_params, ocorrencias_serie, SeriesRecorrentes
+from core.agenda_colunar import AgendaColunas, contagens_agenda
+
+TURNOS = ('Matutino', 'Vespertino', 'Noturno')
+
+# A partir de quantos agendamentos a reconstrução usa o caminho colunar (numpy) em vez do loop por linha
+COLUNAR_MIN = int(os.environ.get('EDU_STATS_COLUNAR_MIN', '2000'))
+
+
+class AgendaStats:
+    """
+    Contadores materializados do dashboard para uma partição de agendamentos.
+
+    Chaves (sempre com o recurso):
+      ('h', recurso, turno, dia, periodo) -> células do heatmap
+      ('p', recurso, professor_id)        -> ranking de professores
+      ('t', recurso, turno, turma_id)     -> ranking de turmas por turno
+
+    `total` cobre todo o histórico contando cada agendamento uma vez (séries sem fim não têm como
+    ser expandidas). Nos filtros de período cada ocorrência conta: `por_data` (ordinal -> Counter,
+    mesmos buckets diários do AgendaCalendario) guarda os pontuais e as séries semanais/quinzenais
+    são expandidas só no intervalo consultado (memoizado por série e intervalo).
+    A construção inicial de partições grandes é vetorizada (AgendaColunas + bincount);
+    as escritas seguintes só ajustam as chaves do delta.
+    Instâncias são compartilhadas entre threads: `aplicar` devolve uma cópia, nunca altera a original.
+    """
+    __slots__ = ('total', 'por_data', 'series')
+
+    def __init__(self, agendamentos=(), colunar=None):
+        agendamentos = agendamentos if isinstance(agendamentos, list) else list(agendamentos)
+        if colunar is None:
+            colunar = len(agendamentos) >= COLUNAR_MIN
+        if colunar:
+            self._construir_colunar(agendamentos)
+            return
+        self.total = Counter()
+        self.por_data = {}
+        series = []
+        for a in agendamentos:
+            item = self._somar(a, 1)
+            if item:
+                series.append(item)
+        self.series = SeriesRecorrentes(series)
+
+    def _construir_colunar(self, agendamentos):
+        colunas = AgendaColunas(agendamentos)
+        self.total, self.por_data = contagens_agenda(colunas, TURNOS)
+        self.series = SeriesRecorrentes(colunas.itens_series(agendamentos), ordenados=True)
+
+    @staticmethod
+    def chaves(a):
+        rid = a.get('recurso_id', 'lab1')
+        turno = a.get('turno', 'Matutino')
+        chaves = [('p', rid, a.get('professor_id', 'Desconhecido'))]
+        if turno in TURNOS:
+            chaves.append(('h', rid, turno, a.get('dia', 'N/A'), a.get('periodo', 'N/A')))
+            chaves.append(('t', rid, turno, a.get('turma_id', 'Desconhecida')))
+        return chaves
+
+    @staticmethod
+    def _ajustar(contador, chave, sinal):
+        valor = contador[chave] + sinal
+        if valor:
+            contador[chave] = valor
+        else:
+            # Sem zeros: chaves zeradas apareceriam nos rankings
+            del contador[chave]
+
+    def _somar(self, a, sinal):
+        """Atualiza os contadores; para séries devolve o item de SeriesRecorrentes em vez de usar por_data."""
+        chaves = self.chaves(a)
+        for chave in chaves:
+            self._ajustar(self.total, chave, sinal)
+        params = serie_params(a)
+        if params is not None:
+            return (params[0], params, a, None)
+        dia = data_agendamento(a)
+        if dia is not None:
+            contador = self.por_data.setdefault(dia, Counter())
+            for chave in chaves:
+                self._ajustar(contador, chave, sinal)
+            if not contador:
+                del self.por_data[dia]
+        return None
+
+    def aplicar(self, removidos, adicionados):
+        """Nova instância com os agendamentos removidos/adicionados (copy-on-write dos contadores tocados)."""
+        novo = AgendaStats()
+        novo.total = Counter(self.total)
+        novo.por_data = dict(self.por_data)
+        copiados = set()
+        for a in list(removidos) + list(adicionados):
+            dia = data_agendamento(a)
+            if dia is not None and dia not in copiados and dia in novo.por_data:
+                novo.por_data[dia] = Counter(novo.por_data[dia])
+                copiados.add(dia)
+        series_removidas = [a for a in removidos if novo._somar(a, -1)]
+        series_novas = [item for item in (novo._somar(a, 1) for a in adicionados) if item]
+        novo.series = self.series.aplicar(series_removidas, series_novas)
+        return novo
+
+    def contagens(self, inicio=None, fim=None):
+        """
+        Contadores de todo o histórico (agendamentos) ou das ocorrências no intervalo [inicio, fim]
+        (ordinais, inclusivo). Retorna uma cópia.
+        """
+        if inicio is None or fim is None:
+            return Counter(self.total)
+        soma = Counter()
+        if len(self.por_data) < fim - inicio + 1:
+            dias = sorted(d for d in self.por_data if inicio <= d <= fim)
+        else:
+            dias = [d for d in range(inicio, fim + 1) if d in self.por_data]
+        for d in dias:
+            soma.update(self.por_data[d])
+        for _, params, a, _ in self.series.sobrepostas(inicio, fim):
+            n = len(ocorrencias_serie(params, inicio, fim))
+            if n:
+                for chave in self.chaves(a):
+                    soma[chave] += n
+        return soma
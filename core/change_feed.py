@@ -0,0 +1,74 @@
+import os
+import threading
+from collections import deque
+
+
+class ChangeFeed:
+    """
+    Feed de alterações dos agendamentos para long-poll do grid.
+
+    As rotas de escrita publicam, por recurso, os registros alterados no estado anterior à escrita
+    ({id: registro antes | None se é novo}). Cada evento recebe um número de sequência crescente e
+    fica num buffer circular limitado; quem está atrás do buffer (ou de outra execução do processo,
+    ver `epoca`) precisa recarregar a semana inteira.
+    """
+    RESET = None  # recurso de um evento que invalida tudo (restauração, reset do sistema)
+
+    def __init__(self, max_eventos=1000):
+        self._cond = threading.Condition()
+        self._eventos = deque(maxlen=max_eventos)  # (seq, recurso, {id: registro antes})
+        self._seq = 0
+        self._aguardando = 0
+        self.epoca = os.urandom(4).hex()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def publicar(self, recurso_id, antes):
+        """Registra uma escrita no recurso. `antes`: {id: registro anterior (ou None)} dos registros alterados."""
+        with self._cond:
+            self._seq += 1
+            self._eventos.append((self._seq, recurso_id, dict(antes)))
+            self._cond.notify_all()
+
+    def resetar(self):
+        """Avisa os clientes de que todos os recursos mudaram (devem recarregar a semana)."""
+        self.publicar(self.RESET, {})
+
+    def entrar(self, limite):
+        """Reserva uma vaga de espera; False se já há `limite` clientes aguardando."""
+        with self._cond:
+            if self._aguardando >= limite:
+                return False
+            self._aguardando += 1
+            return True
+
+    def sair(self):
+        with self._cond:
+            self._aguardando -= 1
+
+    def aguardar(self, recurso_id, desde, timeout):
+        """
+        Espera até `timeout` segundos por eventos do recurso posteriores a `desde`.
+        Retorna (seq_atual, alterados) onde alterados é {id: registro antes}, ou None quando o cliente
+        precisa recarregar tudo (evento de reset ou `desde` fora do buffer). Sem eventos: {}.
+        """
+        with self._cond:
+            if desde > self._seq:
+                return self._seq, None
+            if desde == self._seq:
+                self._cond.wait(timeout)
+            if self._eventos and desde < self._eventos[0][0] - 1:
+                return self._seq, None
+            alterados = {}
+            for seq, recurso, antes in self._eventos:
+                if seq <= desde:
+                    continue
+                if recurso is self.RESET:
+                    return self._seq, None
+                if recurso == recurso_id:
+                    for ag_id, registro in antes.items():
+                        # Mantém o estado mais antigo: é o que o cliente pode estar exibindo
+                        alterados.setdefault(ag_id, registro)
+            return self._seq, alterados
@@ -0,0 +1,112 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # Opcional: sem o pacote, só gzip
+    brotli = None
+
+# Tipos que compensam comprimir (imagens, xlsx e zip já são comprimidos)
+COMPRIMIVEIS = {
+    'application/json', 'text/html', 'text/css', 'text/plain', 'text/csv',
+    'application/javascript', 'text/javascript', 'image/svg+xml',
+}
+
+# Abaixo disso o cabeçalho e o custo de CPU não compensam
+TAMANHO_MINIMO = 1024
+
+
+def escolher_codificacao(accept_encodings):
+    """'br', 'gzip' ou None conforme o Accept-Encoding do cliente (br só se o módulo estiver instalado)."""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+def comprimir(dados, codificacao, maximo=False):
+    """
+    Comprime `dados` (bytes). Respostas dinâmicas usam níveis rápidos; `maximo` é para conteúdo
+    que fica em cache (arquivos estáticos), comprimido uma vez por versão.
+    """
+    if codificacao == 'br':
+        return brotli.compress(dados, quality=11 if maximo else 5)
+    return gzip.compress(dados, compresslevel=9 if maximo else 6, mtime=0)
+
+
+class CompressaoRespostas:
+    """
+    Compressão negociada (Accept-Encoding) das respostas do Flask, aplicada num after_request.
+
+    JSON, HTML e o CSV/JS/CSS pequenos são comprimidos na hora. Os arquivos de /static são
+    comprimidos com nível máximo uma única vez por (arquivo, ETag, codificação) e guardados num
+    cache LRU limitado por bytes. Respostas em streaming, parciais (Range), 304 e as que já têm
+    Content-Encoding passam direto. A ETag das respostas comprimidas vira fraca: o 304 continua
+    funcionando (If-None-Match usa comparação fraca) sem afirmar igualdade byte a byte.
+    """
+
+    def __init__(self, max_bytes_cache=8 * 1024 * 1024):
+        self._max_bytes = max_bytes_cache
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # (caminho, etag, codificacao) -> bytes
+        self._bytes = 0
+
+    def _do_cache(self, chave):
+        with self._lock:
+            dados = self._cache.get(chave)
+            if dados is not None:
+                self._cache.move_to_end(chave)
+            return dados
+
+    def _guardar(self, chave, dados):
+        with self._lock:
+            if chave in self._cache or len(dados) > self._max_bytes:
+                return
+            self._cache[chave] = dados
+            self._bytes += len(dados)
+            while self._bytes > self._max_bytes:
+                _, antigo = self._cache.popitem(last=False)
+                self._bytes -= len(antigo)
+
+    def aplicar(self, request, response, estatico=False):
+        if request.method == 'HEAD' or response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return response
+        if response.mimetype not in COMPRIMIVEIS or response.is_streamed and not estatico:
+            return response
+        if response.direct_passthrough and not estatico:
+            # send_file de relatórios: arquivo entregue como está
+            return response
+        if 'Range' in request.headers:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        codificacao = escolher_codificacao(request.accept_encodings)
+        if codificacao is None:
+            return response
+        if response.content_length is not None and response.content_length < TAMANHO_MINIMO:
+            return response
+
+        etag, fraca = response.get_etag()
+        chave = (request.path, etag, codificacao) if estatico and etag else None
+        comprimido = self._do_cache(chave) if chave else None
+        if comprimido is None:
+            response.direct_passthrough = False
+            dados = response.get_data()
+            if len(dados) < TAMANHO_MINIMO:
+                return response
+            comprimido = comprimir(dados, codificacao, maximo=chave is not None)
+            if chave:
+                self._guardar(chave, comprimido)
+        else:
+            # Cache: o arquivo aberto pelo send_file não chega a ser lido
+            if hasattr(response.response, 'close'):
+                response.response.close()
+            response.direct_passthrough = False
+
+        response.set_data(comprimido)
+        response.headers['Content-Encoding'] = codificacao
+        if etag and not fraca:
+            response.set_etag(etag, weak=True)
+        return response
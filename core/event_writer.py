@@ -0,0 +1,115 @@
+import time
+import queue
+import threading
+
+
+class EventWriter:
+    """
+    Gravação assíncrona de eventos (log de atividade, log de depuração) fora do tempo da requisição.
+
+    As rotas chamam `enfileirar(destino, evento)` e seguem; uma thread de fundo junta o que chegou
+    numa janela de `janela` segundos (até `lote` eventos) e entrega cada destino de uma vez ao seu
+    gravador (`registrar_destino`), então uma rajada de logins vira uma única escrita em disco.
+    A fila é limitada: cheia, o evento é gravado na própria thread (nenhum evento é descartado).
+    `flush()` espera os eventos já enfileirados serem gravados (leituras que precisam vê-los e o
+    atexit): ele põe um marcador na fila que encerra a janela em andamento na hora, então a leitura
+    não paga os `janela` segundos; `close()` grava o restante e encerra a thread.
+    """
+    _ACORDAR = object()  # marcador do flush: fecha o lote atual sem esperar o fim da janela
+
+    def __init__(self, max_fila=10000, lote=500, janela=0.2):
+        self._fila = queue.Queue(maxsize=max_fila)
+        self._lote = lote
+        self._janela = janela
+        self._gravadores = {}
+        self._cond = threading.Condition()
+        self._enfileirados = 0
+        self._gravados = 0
+        self._thread = None
+        self._fechado = False
+
+    def registrar_destino(self, destino, gravar):
+        """`gravar(eventos)` recebe a lista de eventos do destino, na ordem em que foram enfileirados."""
+        self._gravadores[destino] = gravar
+
+    def enfileirar(self, destino, evento):
+        with self._cond:
+            if self._fechado:
+                direto = True
+            else:
+                try:
+                    self._fila.put_nowait((destino, evento))
+                    self._enfileirados += 1
+                    direto = False
+                except queue.Full:
+                    direto = True
+                if not direto and self._thread is None:
+                    self._thread = threading.Thread(target=self._executar, name='event-writer', daemon=True)
+                    self._thread.start()
+        if direto:
+            # Fila cheia (ou já encerrada): grava na thread da requisição
+            self._gravar({destino: [evento]})
+
+    def _gravar(self, por_destino):
+        for destino, eventos in por_destino.items():
+            try:
+                self._gravadores[destino](eventos)
+            except Exception as e:
+                print(f"[EVENTOS] Falha ao gravar {len(eventos)} evento(s) em {destino}: {e}")
+
+    def _executar(self):
+        while True:
+            item = self._fila.get()
+            if item is None:
+                return
+            if item is self._ACORDAR:
+                # Flush sem nada pendente (o lote já foi gravado)
+                continue
+            itens = [item]
+            limite = time.monotonic() + self._janela
+            parar = False
+            while len(itens) < self._lote:
+                try:
+                    proximo = self._fila.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+                if proximo is None:
+                    parar = True
+                    break
+                if proximo is self._ACORDAR:
+                    # Tudo que foi enfileirado antes do flush já está no lote (a fila é FIFO)
+                    break
+                itens.append(proximo)
+            por_destino = {}
+            for destino, evento in itens:
+                por_destino.setdefault(destino, []).append(evento)
+            self._gravar(por_destino)
+            with self._cond:
+                self._gravados += len(itens)
+                self._cond.notify_all()
+            if parar:
+                return
+
+    def flush(self, timeout=10):
+        """Espera a gravação de tudo que foi enfileirado até agora. False se o tempo acabou."""
+        with self._cond:
+            alvo = self._enfileirados
+            if self._gravados >= alvo:
+                return True
+            if self._thread is not None and not self._fechado:
+                try:
+                    self._fila.put_nowait(self._ACORDAR)
+                except queue.Full:
+                    # Fila cheia: os lotes já fecham pelo tamanho, sem esperar a janela
+                    pass
+            return self._cond.wait_for(lambda: self._gravados >= alvo, timeout)
+
+    def close(self, timeout=10):
+        with self._cond:
+            if self._fechado:
+                return
+            self._fechado = True
+            thread = self._thread
+        if thread is not None:
+            self._fila.put(None)
+            thread.join(timeout)
@@ -144,3 +144,44 @@ class ExcelService:
             import traceback
             traceback.print_exc()
             return False, f"Erro ao processar recursos: {str(e)}"
+
+    @staticmethod
+    def escrever_relatorio_xlsx(destino, colunas, linhas, sheet_name='Relatório'):
+        """
+        Grava as linhas (iterável de tuplas, consumido sob demanda) numa planilha write-only:
+        o openpyxl descarrega as células em disco enquanto escreve, sem montar a planilha em memória.
+        """
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font
+
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(sheet_name)
+        cabecalho = []
+        for nome in colunas:
+            cell = WriteOnlyCell(ws, value=nome)
+            cell.font = Font(bold=True)
+            cabecalho.append(cell)
+        ws.append(cabecalho)
+        for linha in linhas:
+            ws.append(linha)
+        wb.save(destino)
+
+    @staticmethod
+    def gerar_relatorio_csv(colunas, linhas, linhas_por_bloco=500):
+        """Gera o CSV (UTF-8 com BOM, separador ';' para o Excel pt-BR) em blocos de bytes para streaming."""
+        import csv
+        import io
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=';')
+        buffer.write('﻿')
+        writer.writerow(colunas)
+        for i, linha in enumerate(linhas, 1):
+            writer.writerow(linha)
+            if i % linhas_por_bloco == 0:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
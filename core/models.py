@@ -1,9 +1,19 @@
 import os
+import re
 import json
+import hashlib
+import pickle
+import threading
 import portalocker
 import shutil
 from datetime import datetime, timedelta
 from core.security import SecretManager
+from core.storage import SQLiteStore, apply_delta, diff_objetos
+from core.agenda_index import AgendaIndex, AgendaCalendario
+from core.agenda_stats import AgendaStats
+from core.user_directory import DiretorioUsuarios
+from core.activity_log import ActivityLog
+from core.event_writer import EventWriter
 # Prioriza variável de ambiente (Shared Data) vinda do Orquestrador
 DATA_DIR = os.environ.get('EDU_DATA_PATH')
 
@@ -11,16 +21,73 @@ if not DATA_DIR:
     # Fallback para o layout de pasta único (desenvolvimento)
     DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 
+# Backend de armazenamento: 'json' (padrão, um arquivo por entidade) ou 'sqlite' (DATA_DIR/eduagenda.db).
+# Pode vir do Orquestrador ou do .env compartilhado. Use migrate_sqlite.py para importar os JSONs existentes.
+STORAGE_BACKEND = os.environ.get('EDU_STORAGE_BACKEND', 'json').strip().lower()
+
+# Criptografia por registro: os campos sensíveis de cada agendamento são selados num único token
+# (campo `_enc`) em vez de um token por campo. Registros no formato antigo continuam legíveis e
+# são convertidos quando forem regravados.
+RECORD_ENCRYPTION = os.environ.get('EDU_RECORD_ENCRYPTION', '').strip().lower() in ('1', 'true', 'sim')
+
 # Exportar para outros módulos
 __all__ = [
-    'DATA_DIR', 'get_professores', 'save_professores', 'get_turmas', 'save_turmas',
-    'get_agendamentos', 'save_agendamentos', 'update_agendamentos', 'get_recursos',
-    'save_recursos', 'get_usuarios', 'save_usuarios', 'update_usuarios',
+    'DATA_DIR', 'STORAGE_BACKEND', 'RECORD_ENCRYPTION', 'get_professores', 'save_professores', 'get_turmas', 'save_turmas',
+    'get_agendamentos', 'save_agendamentos', 'update_agendamentos', 'get_agenda_index', 'get_agenda_stats', 'get_agenda_calendario', 'versao_agendamentos', 'get_recursos',
+    'save_recursos', 'get_usuarios', 'get_diretorio_usuarios', 'save_usuarios', 'update_usuarios',
     'get_config', 'save_config', 'update_config', 'get_logs', 'update_logs',
+    'registrar_atividade', 'get_contadores_login', 'versao_atividade', 'event_writer',
+    'exportar_logs', 'importar_logs',
     'get_full_database_decrypted', 'restore_full_database_encrypted'
 ]
 
 class DataManager:
+    # Cache em processo compartilhado pelas threads do Waitress.
+    # {filename: {"sig": assinatura do arquivo, "blob": dados brutos (pickle),
+    #             "decoded": {decoder: pickle}, "views": {builder: objeto},
+    #             "advance": {builder: função que avança a view após uma escrita}}}
+    _cache = {}
+    _cache_lock = threading.Lock()
+    _store = None
+
+    # Versões por arquivo: {filename: (assinatura, contador)}. Sempre que a assinatura muda (escrita deste
+    # processo ou alteração externa) o arquivo recebe o próximo valor de um contador global, então uma
+    # entrada descartada (limite MAX_VERSOES) nunca volta com um número já usado; EPOCA distingue as
+    # execuções do processo.
+    _versoes = {}
+    _ultima_versao = 0
+    MAX_VERSOES = 1024
+    EPOCA = os.urandom(4).hex()
+
+    # Arquivos internos dos backends de armazenamento (não devem ser copiados em backups/restaurações)
+    STORAGE_SUFFIXES = ('.db', '.db-wal', '.db-shm', '.tmp', '.journal', '.migrado')
+
+    # Backend JSON: arquivos cujas alterações vão para um journal append-only (<arquivo>.journal)
+    # em vez de regravar o arquivo inteiro. O journal é compactado no snapshot em segundo plano.
+    # Contrato: registros reaproveitados (mesmo objeto) são considerados inalterados e os alterados são
+    # objetos novos. _secure_update o garante por construção; para os demais callbacks, update() o impõe
+    # (ver _com_contrato).
+    JOURNALED = ('agendamentos.json', 'agendamentos_')  # nomes ou prefixos (partições)
+    JOURNAL_SUFFIX = '.journal'
+    JOURNAL_MAX_BYTES = int(os.environ.get('EDU_JOURNAL_MAX_BYTES', str(2 * 1024 * 1024)))
+
+    @staticmethod
+    def is_storage_file(name):
+        return name.endswith(DataManager.STORAGE_SUFFIXES)
+
+    @staticmethod
+    def _backend():
+        """Retorna o SQLiteStore quando EDU_STORAGE_BACKEND=sqlite; None para os arquivos JSON."""
+        if STORAGE_BACKEND != 'sqlite':
+            return None
+        if DataManager._store is None:
+            with DataManager._cache_lock:
+                if DataManager._store is None:
+                    if not os.path.exists(DATA_DIR):
+                        os.makedirs(DATA_DIR)
+                    DataManager._store = SQLiteStore(DATA_DIR)
+        return DataManager._store
+
     @staticmethod
     def _get_path(filename):
         if not os.path.exists(DATA_DIR):
@@ -28,10 +95,107 @@ class DataManager:
         return os.path.join(DATA_DIR, filename)
 
     @staticmethod
-    def load(filename):
-        path = DataManager._get_path(filename)
-        if not os.path.exists(path):
-            return []
+    def _signature(path):
+        """Assinatura barata (os.stat) usada para revalidar o cache: mtime_ns + tamanho + inode."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    @staticmethod
+    def _file_signature(filename, path):
+        """Assinatura do arquivo; para arquivos com journal, combina snapshot + journal."""
+        sig = DataManager._signature(path)
+        if sig is None or not filename.startswith(DataManager.JOURNALED):
+            return sig
+        return (sig, DataManager._signature(path + DataManager.JOURNAL_SUFFIX))
+
+    @staticmethod
+    def _remember(filename, sig, data, views=None, advance=None):
+        """Grava no cache o conteúdo que acabamos de ler/escrever (write-through)."""
+        if sig is None:
+            DataManager.invalidate(filename)
+            return
+        entry = {
+            "sig": sig,
+            "blob": pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL),
+            "decoded": {},
+            "views": views or {},
+            "advance": advance or {}
+        }
+        with DataManager._cache_lock:
+            DataManager._cache[filename] = entry
+
+    @staticmethod
+    def _remember_write(filename, sig_lido, antes, sig, data):
+        """
+        _remember após uma escrita deste processo. As views registradas com `advance` na versão lida
+        (sig_lido) são avançadas com (antes, depois) em vez de reconstruídas do zero.
+        """
+        with DataManager._cache_lock:
+            anterior = DataManager._cache.get(filename)
+        views, advance = {}, {}
+        if anterior is not None and anterior["sig"] == sig_lido and antes is not None:
+            for builder, avancar in anterior["advance"].items():
+                obj = anterior["views"].get(builder)
+                if obj is None:
+                    continue
+                try:
+                    views[builder] = avancar(obj, antes, data)
+                    advance[builder] = avancar
+                except Exception as e:
+                    # A view é reconstruída na próxima leitura
+                    print(f"[CACHE] Falha ao atualizar view de {filename}: {e}")
+        DataManager._remember(filename, sig, data, views, advance)
+
+    @staticmethod
+    def invalidate(filename=None):
+        """Descarta o cache de um arquivo (ou de todos, se filename for None)."""
+        with DataManager._cache_lock:
+            if filename is None:
+                DataManager._cache.clear()
+            else:
+                DataManager._cache.pop(filename, None)
+
+    @staticmethod
+    def _cached_data(filename, sig):
+        """Cópia dos dados em cache se ainda correspondem à assinatura informada."""
+        with DataManager._cache_lock:
+            entry = DataManager._cache.get(filename)
+        if entry is not None and entry["sig"] == sig:
+            return pickle.loads(entry["blob"])
+        return None
+
+    @staticmethod
+    def _entry(filename):
+        """Retorna a entrada de cache válida para o arquivo, relendo o disco apenas se ele mudou."""
+        store = DataManager._backend()
+        if store is not None:
+            sig = store.signature(filename)
+        else:
+            path = DataManager._get_path(filename)
+            sig = DataManager._file_signature(filename, path)
+        if sig is None:
+            return None
+
+        with DataManager._cache_lock:
+            entry = DataManager._cache.get(filename)
+        if entry is not None and entry["sig"] == sig:
+            return entry
+
+        data = store.read(filename) if store is not None else DataManager._read(path, filename)
+        if data is None:
+            return None
+        # Se o arquivo mudar durante a leitura, a assinatura nova força uma releitura na próxima chamada
+        DataManager._remember(filename, sig, data)
+        with DataManager._cache_lock:
+            return DataManager._cache.get(filename)
+
+    @staticmethod
+    def _read(path, filename):
+        if filename.startswith(DataManager.JOURNALED):
+            return DataManager._read_journaled(path, filename)
         try:
             with open(path, 'r', encoding='utf-8') as f:
                 # portalocker.lock no Windows pode falhar com timeout se usado diretamente assim
@@ -42,10 +206,337 @@ class DataManager:
                 return data
         except portalocker.exceptions.LockException:
             print(f"LOCK ERROR: Tempo esgotado ao tentar ler {filename}")
-            return []
+            return None
+        except Exception as e:
+            print(f"Erro ao carregar {filename}: {e}")
+            return None
+
+    @staticmethod
+    def _open_journal(path):
+        # 'a+' cria o journal se necessário; ele nunca é substituído, só truncado, então serve de lock
+        return open(path + DataManager.JOURNAL_SUFFIX, 'a+b')
+
+    @staticmethod
+    def _read_journaled(path, filename):
+        try:
+            with DataManager._open_journal(path) as jf:
+                portalocker.lock(jf, portalocker.LOCK_SH)
+                try:
+                    return DataManager._replay(path, jf, filename)
+                finally:
+                    portalocker.unlock(jf)
+        except portalocker.exceptions.LockException:
+            print(f"LOCK ERROR: Tempo esgotado ao tentar ler {filename}")
+            return None
         except Exception as e:
             print(f"Erro ao carregar {filename}: {e}")
+            return None
+
+    @staticmethod
+    def _replay(path, jf, filename):
+        """Snapshot + operações do journal. Deve ser chamado com o journal travado."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            st = os.fstat(f.fileno())
+
+        jf.seek(0)
+        linhas = jf.read().decode('utf-8', errors='replace').splitlines()
+        if not linhas:
+            return data
+        if not DataManager._journal_base_ok(linhas[0], st):
+            print(f"[JOURNAL] Journal de {filename} não corresponde ao snapshot atual; ignorado.")
+            return data
+
+        for n, linha in enumerate(linhas[1:], start=2):
+            try:
+                data = apply_delta(data, json.loads(linha))
+            except ValueError as e:
+                # Última linha incompleta (queda durante o append) ou journal corrompido
+                print(f"[JOURNAL] {filename}: linha {n} ignorada ({e})")
+                break
+        return data
+
+    @staticmethod
+    def _journal_base_ok(cabecalho, st):
+        """
+        O cabeçalho do journal guarda (mtime_ns, tamanho) do snapshot sobre o qual ele foi escrito.
+        Se não bater (ex: compactação interrompida após substituir o arquivo), as operações já estão no snapshot.
+        """
+        try:
+            base = json.loads(cabecalho).get('base')
+        except (ValueError, AttributeError):
+            return False
+        return base == [st.st_mtime_ns, st.st_size]
+
+    @staticmethod
+    def _journal_op(data, delta):
+        """Rótulo da operação registrada (informativo: a reaplicação usa só set/del/add)."""
+        if delta['del'] and not delta['add']:
+            return 'delete'
+        if delta['add'] and not delta['set']:
+            return 'create'
+        for pos, novo in delta['set']:
+            antigo = data[pos]
+            if novo.get('locked') != antigo.get('locked'):
+                return 'lock'
+            if novo.get('excecoes') != antigo.get('excecoes'):
+                return 'exception'
+            if novo.get('semana_fim') != antigo.get('semana_fim'):
+                return 'end_series'
+        return 'update'
+
+    @staticmethod
+    def _journal_delta(data, new_data):
+        """
+        Delta entre a lista atual e a nova (diff_objetos, o mesmo casamento do SQLite),
+        ou None quando é preciso regravar o snapshot.
+        """
+        if not isinstance(data, list) or not isinstance(new_data, list):
+            return None
+        if not all(isinstance(r, dict) for r in new_data):
+            return None
+        diff = diff_objetos(data, new_data)
+        if diff is None:
+            return None
+        destino, removidos = diff
+        delta = {"set": [], "del": removidos, "add": []}
+        for r, alvo in zip(new_data, destino):
+            if alvo is None:
+                delta['add'].append(r)
+            elif alvo[1]:
+                delta['set'].append([alvo[0], r])
+        return delta
+
+    @staticmethod
+    def _com_contrato(callback):
+        """
+        Impõe o contrato de JOURNALED a um callback de update: registros alterados in-place são trocados
+        por cópias e o original volta ao conteúdo anterior, então entram no delta como alterados em vez de
+        serem descartados como intactos. Callbacks marcados com `contrato_journal` (_secure_update) já o
+        garantem e não pagam a cópia dos registros.
+        """
+        if getattr(callback, 'contrato_journal', False):
+            return callback
+
+        def verificado(data):
+            if not isinstance(data, list):
+                return callback(data)
+            # `antes` mantém os objetos vivos (ids não são reaproveitados); a cópia é um único pickle
+            antes = list(data)
+            copia = pickle.dumps(antes, pickle.HIGHEST_PROTOCOL)
+            new_data = callback(data)
+            if not isinstance(new_data, list):
+                return new_data
+            originais = pickle.loads(copia)
+            # Os originais são o "antes" do delta e das views incrementais, inclusive os removidos:
+            # o conteúdo alterado segue num objeto novo
+            alterados = {}
+            for r, original in zip(antes, originais):
+                if isinstance(r, dict) and r != original:
+                    alterados[id(r)] = dict(r)
+                    r.clear()
+                    r.update(original)
+            if not alterados:
+                return new_data
+            return [alterados.get(id(r), r) for r in new_data]
+        return verificado
+
+    @staticmethod
+    def _write_snapshot(path, data):
+        temp_path = f"{path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as tf:
+                json.dump(data, tf, indent=4, ensure_ascii=False)
+            return DataManager._safe_replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                try: os.remove(temp_path)
+                except: pass
+
+    @staticmethod
+    def _update_journaled(filename, path, callback):
+        if not os.path.exists(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump([], f)
+
+        with DataManager._open_journal(path) as jf:
+            portalocker.lock(jf, portalocker.LOCK_EX)
+            try:
+                sig = DataManager._file_signature(filename, path)
+                data = DataManager._cached_data(filename, sig)
+                if data is None:
+                    data = DataManager._replay(path, jf, filename)
+                    DataManager._remember(filename, sig, data)
+                atual = list(data)
+                new_data = callback(data)
+                if new_data is None:
+                    return None
+
+                jf.seek(0)
+                cabecalho = jf.readline()
+                if cabecalho and not DataManager._journal_base_ok(cabecalho, os.stat(path)):
+                    jf.truncate(0)
+                tamanho = jf.seek(0, os.SEEK_END)
+                if tamanho:
+                    jf.seek(-1, os.SEEK_END)
+                    # Append anterior interrompido no meio: regrava o snapshot para não emendar a linha
+                    integro = jf.read(1) == b'\n'
+                else:
+                    integro = True
+                delta = None
+                if integro and tamanho < DataManager.JOURNAL_MAX_BYTES:
+                    delta = DataManager._journal_delta(atual, new_data)
+
+                if delta is None:
+                    # Reordenação ou journal grande: grava o snapshot completo e zera o journal
+                    if DataManager._write_snapshot(path, new_data):
+                        jf.truncate(0)
+                        DataManager._remember_write(filename, sig, atual, DataManager._file_signature(filename, path), new_data)
+                    else:
+                        DataManager.invalidate(filename)
+                    return new_data
+
+                if not (delta['set'] or delta['del'] or delta['add']):
+                    return new_data
+
+                linhas = []
+                if tamanho == 0:
+                    st = os.stat(path)
+                    linhas.append(json.dumps({"base": [st.st_mtime_ns, st.st_size]}))
+                entrada = {"op": DataManager._journal_op(atual, delta), "ts": datetime.now().isoformat(timespec='seconds')}
+                entrada.update(delta)
+                linhas.append(json.dumps(entrada, ensure_ascii=False))
+                jf.write(('\n'.join(linhas) + '\n').encode('utf-8'))
+                jf.flush()
+                os.fsync(jf.fileno())
+                DataManager._remember_write(filename, sig, atual, DataManager._file_signature(filename, path), new_data)
+                return new_data
+            finally:
+                portalocker.unlock(jf)
+
+    @staticmethod
+    def compact(filename=None):
+        """
+        Incorpora o journal ao snapshot (<arquivo>.json) e o esvazia. Chamado pelo agendador
+        e no encerramento; no backend SQLite não há nada a fazer.
+        """
+        if DataManager._backend() is not None:
+            return
+        if filename:
+            nomes = [filename]
+        elif os.path.exists(DATA_DIR):
+            sufixo = DataManager.JOURNAL_SUFFIX
+            nomes = sorted(n[:-len(sufixo)] for n in os.listdir(DATA_DIR) if n.endswith(sufixo))
+        else:
+            nomes = []
+        for nome in nomes:
+            path = DataManager._get_path(nome)
+            jpath = path + DataManager.JOURNAL_SUFFIX
+            if not os.path.exists(path) or not os.path.exists(jpath) or os.path.getsize(jpath) == 0:
+                continue
+            try:
+                with DataManager._open_journal(path) as jf:
+                    portalocker.lock(jf, portalocker.LOCK_EX)
+                    try:
+                        sig = DataManager._file_signature(nome, path)
+                        data = DataManager._cached_data(nome, sig)
+                        if data is None:
+                            data = DataManager._replay(path, jf, nome)
+                        if DataManager._write_snapshot(path, data):
+                            jf.truncate(0)
+                            DataManager._remember(nome, DataManager._file_signature(nome, path), data)
+                        else:
+                            DataManager.invalidate(nome)
+                    finally:
+                        portalocker.unlock(jf)
+            except Exception as e:
+                print(f"[JOURNAL] Falha ao compactar {nome}: {e}")
+
+    @staticmethod
+    def load(filename, decoder=None):
+        """
+        Lê um arquivo JSON através do cache em processo. Cada chamada recebe uma cópia própria.
+        Se `decoder` for informado (ex: descriptografia), o resultado decodificado também fica em cache.
+        """
+        entry = DataManager._entry(filename)
+        if entry is None:
             return []
+        if decoder is None:
+            return pickle.loads(entry["blob"])
+
+        blob = entry["decoded"].get(decoder)
+        if blob is None:
+            decoded = decoder(pickle.loads(entry["blob"]))
+            blob = pickle.dumps(decoded, protocol=pickle.HIGHEST_PROTOCOL)
+            entry["decoded"][decoder] = blob
+        return pickle.loads(blob)
+
+    @staticmethod
+    def view(filename, builder, advance=None):
+        """
+        Retorna um objeto derivado (ex: índice) construído por `builder` a partir dos dados do arquivo.
+        O objeto é compartilhado entre as threads e reconstruído só quando o arquivo muda: somente leitura.
+
+        Com `advance(obj, antes, depois)`, as escritas feitas por este processo derivam o novo objeto
+        do anterior (ex: contadores incrementais). `antes`/`depois` são as listas brutas; registros
+        inalterados são os mesmos objetos nas duas (contrato de _secure_update).
+        """
+        entry = DataManager._entry(filename)
+        if entry is None:
+            return builder([])
+
+        obj = entry["views"].get(builder)
+        if obj is None:
+            obj = builder(pickle.loads(entry["blob"]))
+            entry["views"][builder] = obj
+            if advance is not None:
+                entry["advance"][builder] = advance
+        return obj
+
+    @staticmethod
+    def version(filename):
+        """
+        Versão monotônica do arquivo neste processo (avança a cada mudança da assinatura; 0 para um
+        arquivo que não existe e ainda não foi visto). Custa só um stat (ou uma consulta à tabela meta no SQLite): não lê nem decodifica os dados.
+        Usada como chave de caches derivados e nas ETags, sempre junto com EPOCA.
+        """
+        store = DataManager._backend()
+        if store is not None:
+            sig = store.signature(filename)
+        else:
+            sig = DataManager._file_signature(filename, DataManager._get_path(filename))
+        with DataManager._cache_lock:
+            atual = DataManager._versoes.get(filename)
+            if atual is not None and atual[0] == sig:
+                return atual[1]
+            if atual is None and sig is None:
+                # Arquivo inexistente e nunca visto: não ocupa entrada (ex: ?recurso= arbitrário)
+                return 0
+            DataManager._ultima_versao += 1
+            contador = DataManager._ultima_versao
+            DataManager._versoes.pop(filename, None)
+            DataManager._versoes[filename] = (sig, contador)
+            while len(DataManager._versoes) > DataManager.MAX_VERSOES:
+                del DataManager._versoes[next(iter(DataManager._versoes))]
+        return contador
+
+    @staticmethod
+    def etag(versoes):
+        """ETag forte para um conteúdo derivado das versões informadas (ex: [DataManager.version(f), ...])."""
+        return f"{DataManager.EPOCA}-" + '.'.join(str(v) for v in versoes)
+
+    @staticmethod
+    def list_files(prefix):
+        """Nomes das entidades gravadas (ex: partições) que começam com `prefix`, em ordem."""
+        store = DataManager._backend()
+        if store is not None:
+            return store.list_files(prefix)
+        if not os.path.exists(DATA_DIR):
+            return []
+        return sorted(
+            n for n in os.listdir(DATA_DIR)
+            if n.startswith(prefix) and n.endswith('.json') and os.path.isfile(os.path.join(DATA_DIR, n))
+        )
 
     @staticmethod
     def _safe_replace(src, dst):
@@ -70,25 +561,46 @@ class DataManager:
 
     @staticmethod
     def update(filename, callback):
+        store = DataManager._backend()
+        if store is not None:
+            lido = {}
+
+            def lookup(sig):
+                lido['sig'] = sig
+                return DataManager._cached_data(filename, sig)
+
+            def remember(sig, data):
+                lido['sig'] = sig
+                DataManager._remember(filename, sig, data)
+
+            # O SQLite grava só as linhas devolvidas como objetos novos: vale o contrato para todos os arquivos
+            callback = DataManager._com_contrato(callback)
+
+            def registrar(data):
+                lido['antes'] = list(data) if isinstance(data, list) else None
+                return callback(data)
+
+            try:
+                new_data, sig = store.update(filename, registrar, lookup=lookup, remember=remember)
+            except BaseException:
+                # Updates aninhados (várias partições) lembram versões que o rollback desfez
+                DataManager.invalidate()
+                raise
+            if new_data is not None:
+                DataManager._remember_write(filename, lido.get('sig'), lido.get('antes'), sig, new_data)
+            return new_data
+
         path = DataManager._get_path(filename)
+        if filename.startswith(DataManager.JOURNALED):
+            return DataManager._update_journaled(filename, path, DataManager._com_contrato(callback))
+
         temp_path = f"{path}.tmp"
         
-        # Se o arquivo não existir, o estado inicial depende do nome/tipo
-        # mas por segurança, começaremos com o que callback precisar.
-        # Se carregar falhar por falta de arquivo, passaremos None ou empty adequado.
-        
-        if not os.path.exists(path):
-            data = {} if filename == 'config.json' else []
-        else:
-            with open(path, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                except:
-                    data = {} if filename == 'config.json' else []
-        
         # Lock de leitura/escrita
         # (Nota: O arquivo PRECISA existir para o portalocker funcionar no modo 'r')
+        # Se o arquivo não existir, o estado inicial depende do nome/tipo
         if not os.path.exists(path):
+            data = {} if filename == 'config.json' else []
             with open(path, 'w', encoding='utf-8') as f:
                 json.dump(data, f)
 
@@ -96,14 +608,23 @@ class DataManager:
         try:
             # Lock exclusivo
             portalocker.lock(f, portalocker.LOCK_EX)
-            data = json.load(f)
+            sig = DataManager._signature(path)
+            # Arquivo não mudou desde a última leitura: evita o parse sob o lock
+            data = DataManager._cached_data(filename, sig)
+            if data is None:
+                data = json.load(f)
+                DataManager._remember(filename, sig, data)
+            antes = list(data) if isinstance(data, list) else None
             new_data = callback(data)
             if new_data is not None:
                 with open(temp_path, 'w', encoding='utf-8') as tf:
                     json.dump(new_data, tf, indent=4, ensure_ascii=False)
                 
                 f.close() 
-                DataManager._safe_replace(temp_path, path)
+                if DataManager._safe_replace(temp_path, path):
+                    DataManager._remember_write(filename, sig, antes, DataManager._signature(path), new_data)
+                else:
+                    DataManager.invalidate(filename)
             return new_data
         finally:
             try: f.close() 
@@ -114,7 +635,26 @@ class DataManager:
 
     @staticmethod
     def save(filename, data):
+        if DataManager._backend() is not None:
+            DataManager.update(filename, lambda _: data)
+            return True
+
         path = DataManager._get_path(filename)
+        if filename.startswith(DataManager.JOURNALED):
+            # Substitui o conteúdo inteiro: snapshot novo e journal zerado, sob o lock do journal
+            with DataManager._open_journal(path) as jf:
+                portalocker.lock(jf, portalocker.LOCK_EX)
+                try:
+                    if not DataManager._write_snapshot(path, data):
+                        print(f"ERROR: Could not save {filename} (safe_replace failed)")
+                        DataManager.invalidate(filename)
+                        return False
+                    jf.truncate(0)
+                    DataManager._remember(filename, DataManager._file_signature(filename, path), data)
+                    return True
+                finally:
+                    portalocker.unlock(jf)
+
         temp_path = f"{path}.tmp"
         
         if not os.path.exists(os.path.dirname(path)):
@@ -130,191 +670,398 @@ class DataManager:
             # Por isso, DataManager.update é PREFERIDO.
             if not DataManager._safe_replace(temp_path, path):
                 print(f"ERROR: Could not save {filename} (safe_replace failed)")
+                DataManager.invalidate(filename)
                 return False
+            DataManager._remember(filename, DataManager._signature(path), data)
             return True
         finally:
             if os.path.exists(temp_path):
                 try: os.remove(temp_path)
                 except: pass
 
-def get_professores():
-    """Retorna lista de objetos {"id": "...", "nome": "..."}"""
-    data = DataManager.load('professores.json')
+def _secure_update(filename, callback, decrypt_rows, encrypt_rows):
+    """
+    Executa `callback` sobre os registros descriptografados e recriptografa só o que mudou.
+    Registros intactos mantêm o token original, então o backend grava apenas as linhas alteradas.
+    `decrypt_rows`/`encrypt_rows` recebem listas e devolvem listas de objetos novos, na mesma ordem.
+    """
+    def secure_callback(rows):
+        originais = {}
+        plain = decrypt_rows(rows)
+        for raw, p in zip(rows, plain):
+            if isinstance(p, dict):
+                # O decrypt faz cópias rasas: listas (ex: excecoes) alteradas in-place pelo callback
+                # mudariam também o registro bruto, que é o "antes" das views incrementais
+                for k, v in p.items():
+                    if isinstance(v, list):
+                        p[k] = list(v)
+            if isinstance(raw, dict) and not _migrado(raw, p):
+                originais[id(p)] = (raw, _copia_registro(p))
+
+        new_rows = callback(plain)
+        if new_rows is None:
+            return None
+
+        result = []
+        alterados = []
+        for p in new_rows:
+            original = originais.get(id(p))
+            if original is not None and p == original[1]:
+                result.append(original[0])
+            else:
+                alterados.append(len(result))
+                result.append(p)
+        # Recriptografa as linhas alteradas num único lote
+        for pos, row in zip(alterados, encrypt_rows([result[i] for i in alterados])):
+            result[pos] = row
+        return result
+    # Intactos voltam como o objeto bruto original e alterados como objetos novos (contrato de JOURNALED)
+    secure_callback.contrato_journal = True
+    return DataManager.update(filename, secure_callback)
+
+def _migrado(raw, plain):
+    """
+    Migrações on-the-fly do decrypt (ex: id gerado) mudam as chaves e forçam a regravação.
+    Um registro selado abre os campos sensíveis de `_enc`: basta manter as demais chaves do bruto.
+    """
+    if not isinstance(plain, dict):
+        return True
+    if SEALED_FIELD in raw:
+        return not raw.keys() - {SEALED_FIELD} <= plain.keys()
+    return plain.keys() != raw.keys()
+
+def _copia_registro(registro):
+    """Cópia para comparar depois de um callback: listas (ex: excecoes) também são copiadas."""
+    return {k: (list(v) if isinstance(v, list) else v) for k, v in registro.items()}
+
+def _crypt_columns(rows, fields, func):
+    """Aplica `func` (encrypt_many/decrypt_many) coluna a coluna, in-place, sobre cópias já feitas."""
+    for field in fields:
+        presentes = [r for r in rows if field in r]
+        if presentes:
+            valores = func([r[field] for r in presentes])
+            for r, v in zip(presentes, valores):
+                r[field] = v
+    return rows
+
+def _decrypt_professores(data):
     if data and isinstance(data, list):
-        for i in range(len(data)):
+        rows = []
+        for p in data:
             # Se for formato antigo (string), converte para objeto (migração on-the-fly)
-            if isinstance(data[i], str):
+            if isinstance(p, str):
                 import uuid
-                nome_limpo = SecretManager.decrypt(data[i])
-                data[i] = {"id": str(uuid.uuid4())[:8], "nome": nome_limpo}
+                rows.append({"id": str(uuid.uuid4())[:8], "nome": p})
             else:
-                if 'nome' in data[i]:
-                    data[i]['nome'] = SecretManager.decrypt(data[i]['nome'])
+                rows.append(dict(p))
+        return _crypt_columns(rows, ['nome'], SecretManager.decrypt_many)
     return data
 
+def _encrypt_professores(data):
+    return _crypt_columns([dict(p) for p in data], ['nome'], SecretManager.encrypt_many)
+
+def get_professores():
+    """Retorna lista de objetos {"id": "...", "nome": "..."}"""
+    return DataManager.load('professores.json', _decrypt_professores)
+
 def save_professores(data):
-    data_to_save = []
-    for p in data:
-        p_copy = p.copy()
-        if 'nome' in p_copy and not SecretManager.is_encrypted(p_copy['nome']):
-            p_copy['nome'] = SecretManager.encrypt(p_copy['nome'])
-        data_to_save.append(p_copy)
-    DataManager.save('professores.json', data_to_save)
+    DataManager.save('professores.json', _encrypt_professores(data))
 
-def get_turmas():
-    """Retorna lista de objetos {"id": "...", "turma": "...", "turno": "..."}"""
-    data = DataManager.load('turmas.json')
+def _decrypt_turmas(data):
     if data and isinstance(data, list):
+        rows = []
         for t in data:
+            t = dict(t)
             if 'id' not in t:
                 import uuid
                 t['id'] = str(uuid.uuid4())[:8]
-            if 'turma' in t: 
-                t['turma'] = SecretManager.decrypt(t['turma'])
+            rows.append(t)
+        return _crypt_columns(rows, ['turma'], SecretManager.decrypt_many)
     return data
 
+def _encrypt_turmas(data):
+    return _crypt_columns([dict(t) for t in data], ['turma'], SecretManager.encrypt_many)
+
+def get_turmas():
+    """Retorna lista de objetos {"id": "...", "turma": "...", "turno": "..."}"""
+    return DataManager.load('turmas.json', _decrypt_turmas)
+
 def save_turmas(data):
-    data_to_save = []
-    for t in data:
-        t_copy = t.copy()
-        if 'turma' in t_copy and not SecretManager.is_encrypted(t_copy['turma']):
-            t_copy['turma'] = SecretManager.encrypt(t_copy['turma'])
-        data_to_save.append(t_copy)
-    DataManager.save('turmas.json', data_to_save)
-
-def get_agendamentos():
-    data = DataManager.load('agendamentos.json')
+    DataManager.save('turmas.json', _encrypt_turmas(data))
+
+AGENDAMENTO_SENSITIVE = ['professor', 'turma', 'recurso_nome', 'motivo', 'professor_id', 'turma_id']
+
+# Campo que guarda os campos sensíveis selados no modo RECORD_ENCRYPTION
+SEALED_FIELD = '_enc'
+
+def _open_records(rows):
+    """Abre (in-place) os registros selados em `_enc`, devolvendo os campos sensíveis ao registro."""
+    selados = [r for r in rows if SEALED_FIELD in r]
+    if selados:
+        for r, blob in zip(selados, SecretManager.decrypt_many([r.pop(SEALED_FIELD) for r in selados])):
+            try:
+                r.update(json.loads(blob))
+            except (TypeError, ValueError):
+                print(f"[SECURITY ERROR] Registro selado ilegível (id={r.get('id')})")
+    return rows
+
+def _seal_records(rows, fields):
+    """Move (in-place) os campos sensíveis de cada registro para um único token em `_enc`."""
+    blobs = []
+    for r in rows:
+        sensiveis = {f: SecretManager.decrypt(r.pop(f)) for f in fields if f in r}
+        blobs.append(json.dumps(sensiveis, ensure_ascii=False, separators=(',', ':')))
+    for r, token in zip(rows, SecretManager.encrypt_many(blobs)):
+        r[SEALED_FIELD] = token
+    return rows
+
+def _decrypt_agendamentos(data):
     if data and isinstance(data, list):
-        sensitive = ['professor', 'turma', 'recurso_nome', 'motivo', 'professor_id', 'turma_id']
-        for a in data:
-            for field in sensitive:
-                if field in a: a[field] = SecretManager.decrypt(a[field])
+        rows = _open_records([dict(a) for a in data])
+        return _crypt_columns(rows, AGENDAMENTO_SENSITIVE, SecretManager.decrypt_many)
     return data
 
+def _encrypt_agendamentos(data):
+    rows = [dict(a) for a in data]
+    if RECORD_ENCRYPTION:
+        return _seal_records(rows, AGENDAMENTO_SENSITIVE)
+    return _crypt_columns(rows, AGENDAMENTO_SENSITIVE, SecretManager.encrypt_many)
+
+# Agendamentos particionados por recurso (agendamentos_<recurso>.json): escritas em recursos
+# diferentes não disputam o mesmo lock nem regravam os dados umas das outras.
+AGENDAMENTOS_LEGADO = 'agendamentos.json'
+AGENDAMENTOS_PREFIXO = 'agendamentos_'
+_particoes_lock = threading.Lock()
+_particoes_prontas = False
+
+def _arquivo_agendamentos(recurso_id):
+    """Partição do recurso. Ids fora do padrão seguro para nome de arquivo/tabela usam um hash."""
+    recurso_id = recurso_id or 'lab1'
+    if re.fullmatch(r'[a-z0-9_]{1,48}', recurso_id):
+        return f"{AGENDAMENTOS_PREFIXO}{recurso_id}.json"
+    return f"{AGENDAMENTOS_PREFIXO}x{hashlib.sha1(recurso_id.encode()).hexdigest()[:16]}.json"
+
+def _agrupar_por_arquivo(rows):
+    grupos = {}
+    for a in rows:
+        grupos.setdefault(_arquivo_agendamentos(a.get('recurso_id', 'lab1')), []).append(a)
+    return grupos
+
+def _migrar_agendamentos():
+    """
+    Migração única do agendamentos.json legado para as partições por recurso.
+    Idempotente (mescla por id): pode ser repetida se for interrompida no meio.
+    """
+    global _particoes_prontas
+    if _particoes_prontas:
+        return
+    with _particoes_lock:
+        if _particoes_prontas:
+            return
+        legado = DataManager.load(AGENDAMENTOS_LEGADO)
+        if legado:
+            for arquivo, rows in _agrupar_por_arquivo(legado).items():
+                def mesclar(atuais, rows=rows):
+                    ids = {a.get('id') for a in atuais}
+                    return atuais + [a for a in rows if a.get('id') is None or a.get('id') not in ids]
+                DataManager.update(arquivo, mesclar)
+
+            if DataManager._backend() is not None:
+                DataManager.save(AGENDAMENTOS_LEGADO, [])
+            else:
+                # Mantém o arquivo original como cópia de segurança (ignorado pelos backups)
+                DataManager.compact(AGENDAMENTOS_LEGADO)
+                path = DataManager._get_path(AGENDAMENTOS_LEGADO)
+                os.replace(path, path + '.migrado')
+                journal = path + DataManager.JOURNAL_SUFFIX
+                if os.path.exists(journal):
+                    os.remove(journal)
+                DataManager.invalidate(AGENDAMENTOS_LEGADO)
+            print(f"📦 {len(legado)} agendamentos migrados para partições por recurso.")
+        _particoes_prontas = True
+
+def _arquivos_agendamentos():
+    _migrar_agendamentos()
+    return DataManager.list_files(AGENDAMENTOS_PREFIXO)
+
+def get_agendamentos(recurso_id=None):
+    """Agendamentos de um recurso (só a partição dele) ou, sem recurso_id, de todos."""
+    if recurso_id:
+        _migrar_agendamentos()
+        return DataManager.load(_arquivo_agendamentos(recurso_id), _decrypt_agendamentos)
+    resultado = []
+    for arquivo in _arquivos_agendamentos():
+        resultado.extend(DataManager.load(arquivo, _decrypt_agendamentos))
+    return resultado
+
+def _build_agenda_index(data):
+    return AgendaIndex(_decrypt_agendamentos(data))
+
+def get_agenda_index(recurso_id):
+    """
+    Índice de recorrência da partição do recurso (compartilhado, somente leitura), reconstruído
+    apenas quando ela muda. Só para leituras: dentro de um callback de update_agendamentos use
+    AgendaIndex(lista recebida), cujas posições já correspondem à lista.
+    """
+    _migrar_agendamentos()
+    return DataManager.view(_arquivo_agendamentos(recurso_id), _build_agenda_index)
+
+def _advance_agendamentos(obj, antes, depois):
+    # Registros reaproveitados pelo _secure_update são os mesmos objetos: só o delta é descriptografado
+    ids_depois = {id(a) for a in depois}
+    ids_antes = {id(a) for a in antes}
+    removidos = [a for a in antes if id(a) not in ids_depois]
+    adicionados = [a for a in depois if id(a) not in ids_antes]
+    return obj.aplicar(_decrypt_agendamentos(removidos), _decrypt_agendamentos(adicionados))
+
+def _views_agendamentos(recurso_id, builder):
+    """Uma view incremental (aplicar(removidos, adicionados)) por partição: só a do recurso ou todas."""
+    if recurso_id:
+        _migrar_agendamentos()
+        arquivos = [_arquivo_agendamentos(recurso_id)]
+    else:
+        arquivos = _arquivos_agendamentos()
+    return [DataManager.view(arquivo, builder, _advance_agendamentos) for arquivo in arquivos]
+
+def _build_agenda_stats(data):
+    return AgendaStats(_decrypt_agendamentos(data))
+
+def get_agenda_stats(recurso_id=None):
+    """
+    Contadores do dashboard (AgendaStats) por partição: só a do recurso ou todas.
+    Mantidos incrementalmente pelas escritas em vez de recalculados a cada leitura.
+    """
+    return _views_agendamentos(recurso_id, _build_agenda_stats)
+
+def _build_agenda_calendario(data):
+    return AgendaCalendario(_decrypt_agendamentos(data))
+
+def get_agenda_calendario(recurso_id=None):
+    """Calendário por dia (AgendaCalendario) de cada partição, para relatórios por período."""
+    return _views_agendamentos(recurso_id, _build_agenda_calendario)
+
+def versao_agendamentos(recurso_id=None):
+    """Versão dos agendamentos (só a partição do recurso ou todas): tupla de (arquivo, versão)."""
+    if recurso_id:
+        _migrar_agendamentos()
+        arquivos = [_arquivo_agendamentos(recurso_id)]
+    else:
+        arquivos = _arquivos_agendamentos()
+    return tuple((arquivo, DataManager.version(arquivo)) for arquivo in arquivos)
+
 def save_agendamentos(data):
-    data_to_save = json.loads(json.dumps(data))
-    sensitive = ['professor', 'turma', 'recurso_nome', 'motivo', 'professor_id', 'turma_id']
-    for a in data_to_save:
-        for field in sensitive:
-            if field in a and not SecretManager.is_encrypted(a[field]):
-                a[field] = SecretManager.encrypt(a[field])
-    DataManager.save('agendamentos.json', data_to_save)
+    grupos = _agrupar_por_arquivo(data)
+    # Partições ausentes em `data` são esvaziadas: save substitui o conjunto inteiro
+    for arquivo in sorted(set(_arquivos_agendamentos()) | set(grupos)):
+        DataManager.save(arquivo, _encrypt_agendamentos(grupos.get(arquivo, [])))
 
 def update_professores(callback):
-    def secure_callback(profs):
-        # 1. Preparar profs para o callback (descriptografar)
-        for i in range(len(profs)):
-            if isinstance(profs[i], str):
-                import uuid
-                nome = SecretManager.decrypt(profs[i])
-                profs[i] = {"id": str(uuid.uuid4())[:8], "nome": nome}
-            elif 'nome' in profs[i]:
-                profs[i]['nome'] = SecretManager.decrypt(profs[i]['nome'])
-        
-        # 2. Executar lógica
-        new_profs = callback(profs)
-        
-        # 3. Criptografar para salvar
-        if new_profs is not None:
-            for i in range(len(new_profs)):
-                if 'nome' in new_profs[i] and not SecretManager.is_encrypted(new_profs[i]['nome']):
-                    new_profs[i]['nome'] = SecretManager.encrypt(new_profs[i]['nome'])
-        return new_profs
-    return DataManager.update('professores.json', secure_callback)
+    return _secure_update('professores.json', callback, _decrypt_professores, _encrypt_professores)
 
 def update_turmas(callback):
-    def secure_callback(turmas):
-        for t in turmas:
-            if 'id' not in t: 
-                import uuid
-                t['id'] = str(uuid.uuid4())[:8]
-            if 'turma' in t: 
-                t['turma'] = SecretManager.decrypt(t['turma'])
-        
-        new_turmas = callback(turmas)
-        
-        if new_turmas is not None:
-            for t in new_turmas:
-                if 'turma' in t and not SecretManager.is_encrypted(t['turma']):
-                    t['turma'] = SecretManager.encrypt(t['turma'])
-        return new_turmas
-    return DataManager.update('turmas.json', secure_callback)
-
-def update_agendamentos(callback):
-    def secure_callback(agends):
-        sensitive = ['professor', 'turma', 'recurso_nome', 'motivo', 'professor_id', 'turma_id']
-        for a in agends:
-            for field in sensitive:
-                if field in a: a[field] = SecretManager.decrypt(a[field])
-        new_agends = callback(agends)
-        if new_agends is not None:
-            for a in new_agends:
-                for field in sensitive:
-                    if field in a and not SecretManager.is_encrypted(a[field]):
-                        a[field] = SecretManager.encrypt(a[field])
-        return new_agends
-    return DataManager.update('agendamentos.json', secure_callback)
+    return _secure_update('turmas.json', callback, _decrypt_turmas, _encrypt_turmas)
 
-def get_recursos():
-    data = DataManager.load('recursos.json')
+def update_agendamentos(callback, recurso_id=None):
+    """
+    Com recurso_id, o callback recebe apenas a partição do recurso e só ela é travada/regravada.
+    O callback roda com a partição travada: não deve ler agendamentos do disco nem views do
+    DataManager (get_agenda_index, get_agendamentos...), só a lista que recebe.
+    Sem recurso_id, recebe todos os agendamentos (todas as partições travadas) e o resultado
+    é redistribuído por recurso.
+    """
+    if not recurso_id:
+        return _update_todas_particoes(callback)
+
+    arquivo = _arquivo_agendamentos(recurso_id)
+    def conferir(rows):
+        novos = callback(rows)
+        if novos is not None:
+            for a in novos:
+                if a.get('recurso_id', 'lab1') != recurso_id:
+                    raise ValueError(f"Agendamento de outro recurso ({a.get('recurso_id')}) na partição de {recurso_id}")
+        return novos
+
+    if arquivo not in _arquivos_agendamentos() and recurso_id not in {r.get('id') for r in get_recursos()}:
+        # Recurso não cadastrado e sem partição: o callback roda sobre a lista vazia e nada é gravado,
+        # para que ids arbitrários (delete/lock de um recurso inventado) não criem partições
+        novos = conferir([])
+        if novos:
+            raise ValueError(f"Recurso não cadastrado: {recurso_id}")
+        return novos
+    return _secure_update(arquivo, conferir, _decrypt_agendamentos, _encrypt_agendamentos)
+
+def _update_todas_particoes(callback):
+    # Trava as partições sempre na mesma ordem (evita deadlock) aninhando os updates;
+    # o callback roda no nível mais interno, com todas as listas em mãos
+    arquivos = _arquivos_agendamentos()
+    lidos = []
+    estado = {"resultado": None, "grupos": {}}
+
+    def nivel(i):
+        if i == len(arquivos):
+            resultado = callback([a for rows in lidos for a in rows])
+            estado["resultado"] = resultado
+            if resultado is not None:
+                estado["grupos"] = _agrupar_por_arquivo(resultado)
+            return
+
+        def particao(rows):
+            lidos.append(rows)
+            nivel(i + 1)
+            if estado["resultado"] is None:
+                return None
+            return estado["grupos"].pop(arquivos[i], [])
+        _secure_update(arquivos[i], particao, _decrypt_agendamentos, _encrypt_agendamentos)
+
+    nivel(0)
+    # Recursos que ainda não tinham partição
+    for arquivo, rows in estado["grupos"].items():
+        _secure_update(arquivo, lambda atuais, rows=rows: atuais + rows, _decrypt_agendamentos, _encrypt_agendamentos)
+    return estado["resultado"]
+
+def _decrypt_recursos(data):
     if data and isinstance(data, list):
-        for rec in data:
-            if 'nome' in rec: rec['nome'] = SecretManager.decrypt(rec['nome'])
+        _crypt_columns(data, ['nome'], SecretManager.decrypt_many)
     return data
 
+def get_recursos():
+    return DataManager.load('recursos.json', _decrypt_recursos)
+
 def save_recursos(data):
     def secure_callback(current_recursos):
         data_to_save = json.loads(json.dumps(data))
-        for rec in data_to_save:
-            if 'nome' in rec and not SecretManager.is_encrypted(rec['nome']):
-                rec['nome'] = SecretManager.encrypt(rec['nome'])
-        return data_to_save
+        return _crypt_columns(data_to_save, ['nome'], SecretManager.encrypt_many)
     
     return DataManager.update('recursos.json', secure_callback)
 
-def update_usuarios(callback):
-    def secure_callback(users):
-        for user in users:
-            if 'username' in user: user['username'] = SecretManager.decrypt(user['username'])
-            if 'nome' in user: user['nome'] = SecretManager.decrypt(user['nome'])
-            if 'role' in user: user['role'] = SecretManager.decrypt(user['role'])
-        
-        new_users = callback(users)
-        
-        if new_users is not None:
-            for user in new_users:
-                if 'username' in user and not SecretManager.is_encrypted(user['username']):
-                    user['username'] = SecretManager.encrypt(user['username'])
-                if 'nome' in user and not SecretManager.is_encrypted(user['nome']):
-                    user['nome'] = SecretManager.encrypt(user['nome'])
-                if 'role' in user and not SecretManager.is_encrypted(user['role']):
-                    user['role'] = SecretManager.encrypt(user['role'])
-        return new_users
-    return DataManager.update('usuarios.json', secure_callback)
+USUARIO_SENSITIVE = ['username', 'nome', 'role']
 
-def get_usuarios():
-    data = DataManager.load('usuarios.json')
+def _decrypt_usuarios(data):
     if data and isinstance(data, list):
-        for user in data:
-            if 'username' in user:
-                user['username'] = SecretManager.decrypt(user['username'])
-            if 'nome' in user:
-                user['nome'] = SecretManager.decrypt(user['nome'])
-            if 'role' in user:
-                user['role'] = SecretManager.decrypt(user['role'])
+        return _crypt_columns([dict(user) for user in data], USUARIO_SENSITIVE, SecretManager.decrypt_many)
     return data
 
+def _encrypt_usuarios(data):
+    return _crypt_columns([dict(user) for user in data], USUARIO_SENSITIVE, SecretManager.encrypt_many)
+
+def update_usuarios(callback):
+    return _secure_update('usuarios.json', callback, _decrypt_usuarios, _encrypt_usuarios)
+
+def get_usuarios():
+    return DataManager.load('usuarios.json', _decrypt_usuarios)
+
 def save_usuarios(data):
-    # Cópia profunda simples para evitar mutar o original
-    data_to_save = json.loads(json.dumps(data))
-    for user in data_to_save:
-        if 'username' in user and not SecretManager.is_encrypted(user['username']):
-            user['username'] = SecretManager.encrypt(user['username'])
-        if 'nome' in user and not SecretManager.is_encrypted(user['nome']):
-            user['nome'] = SecretManager.encrypt(user['nome'])
-        if 'role' in user and not SecretManager.is_encrypted(user['role']):
-            user['role'] = SecretManager.encrypt(user['role'])
-    DataManager.save('usuarios.json', data_to_save)
+    DataManager.save('usuarios.json', _encrypt_usuarios(data))
+
+def _build_diretorio_usuarios(data):
+    return DiretorioUsuarios(_decrypt_usuarios(data))
+
+def get_diretorio_usuarios():
+    """
+    Índice de usuários por username/professor_id (compartilhado, somente leitura), reconstruído
+    apenas quando usuarios.json muda. Para alterar usuários continue usando update_usuarios.
+    """
+    return DataManager.view('usuarios.json', _build_diretorio_usuarios)
 
 def update_config(callback):
     def secure_callback(cfg):
@@ -355,10 +1102,9 @@ def update_config(callback):
         
     return DataManager.update('config.json', secure_callback)
 
-def get_config():
-    data = DataManager.load('config.json')
+def _decrypt_config(data):
     if not data or isinstance(data, list):
-        return {"nome_escola": "EduAgenda", "logo_url": None}
+        return data
     
     # Lista de campos que devem ser descriptografados automaticamente ao carregar
     sensitive_fields = [
@@ -379,6 +1125,12 @@ def get_config():
             
     return data
 
+def get_config():
+    data = DataManager.load('config.json', _decrypt_config)
+    if not data or isinstance(data, list):
+        return {"nome_escola": "EduAgenda", "logo_url": None}
+    return data
+
 def save_config(data):
     # Lista de campos que devem ser criptografados antes de salvar
     sensitive_fields = [
@@ -406,17 +1158,87 @@ def save_config(data):
                 
     DataManager.save('config.json', data_to_save)
 
+# Log de atividade em segmentos diários (DATA_DIR/atividade/*.jsonl). Substitui o logs.json, que era
+# regravado inteiro (e cortado em 1000 registros) a cada login. EDU_LOG_RETENCAO_DIAS=0 guarda tudo.
+LOGS_LEGADO = 'logs.json'
+_atividade = ActivityLog(
+    os.path.join(DATA_DIR, 'atividade'),
+    retencao_dias=int(os.environ.get('EDU_LOG_RETENCAO_DIAS', '0'))
+)
+_atividade_lock = threading.Lock()
+_atividade_pronta = False
+
+def _log_atividade():
+    """Log de atividade, migrando o logs.json legado para os segmentos na primeira chamada."""
+    global _atividade_pronta
+    if _atividade_pronta:
+        return _atividade
+    with _atividade_lock:
+        if not _atividade_pronta:
+            legado = DataManager.load(LOGS_LEGADO)
+            if legado and _atividade.vazio():
+                _atividade.substituir(legado)
+                print(f"📦 {len(legado)} registros de log migrados para {_atividade.diretorio}.")
+            if legado:
+                if DataManager._backend() is not None:
+                    DataManager.save(LOGS_LEGADO, [])
+                else:
+                    # Mantém o arquivo original como cópia de segurança (ignorado pelos backups)
+                    path = DataManager._get_path(LOGS_LEGADO)
+                    os.replace(path, path + '.migrado')
+                    DataManager.invalidate(LOGS_LEGADO)
+            _atividade_pronta = True
+    return _atividade
+
+# Eventos são gravados em lote por uma thread de fundo; quem lê o log espera os pendentes (flush).
+# O atexit do app chama event_writer.close() para gravar o que ainda estiver na fila.
+event_writer = EventWriter()
+event_writer.registrar_destino('atividade', lambda eventos: _log_atividade().registrar(eventos))
+
 def get_logs():
-    return DataManager.load('logs.json')
+    """Eventos mais recentes (até 1000), do mais antigo para o mais novo."""
+    event_writer.flush()
+    return _log_atividade().recentes()
 
 def update_logs(callback):
-    return DataManager.update('logs.json', callback)
+    """
+    Substituição em bloco do log: callback(eventos recentes) -> lista que passa a ser o histórico
+    inteiro (restauração de backup). Para registrar eventos use registrar_atividade.
+    """
+    eventos = callback(get_logs())
+    if eventos is not None:
+        _log_atividade().substituir(eventos)
+    return eventos
+
+def exportar_logs(destino):
+    """Copia o histórico completo do log (segmentos diários) para a pasta `destino` de um backup."""
+    event_writer.flush()
+    _log_atividade().exportar(destino)
+
+def importar_logs(origem):
+    """Mescla os segmentos de um backup (pasta) ao log atual, sem apagar os dias que o backup não tem."""
+    event_writer.flush()
+    _log_atividade().importar(origem)
+
+def registrar_atividade(evento):
+    """Enfileira um evento para o log; a gravação (append no segmento do dia) é feita em segundo plano."""
+    event_writer.enfileirar('atividade', evento)
+
+def get_contadores_login():
+    """(total, {nome: logins}) de todo o histórico, mantidos em memória a cada login."""
+    event_writer.flush()
+    return _log_atividade().logins()
+
+def versao_atividade():
+    event_writer.flush()
+    return _log_atividade().versao
 
 
 def get_full_database_decrypted():
     """
     Retorna todo o conteúdo do banco de dados em formato limpo (descriptografado).
-    Ideal para criação de backups portáteis.
+    Ideal para criação de backups portáteis. `logs` traz só os eventos recentes (compatibilidade):
+    o histórico completo vai para o backup pelos segmentos (exportar_logs).
     """
     return {
         "professores": get_professores(),
@@ -448,7 +1270,9 @@ def restore_full_database_encrypted(data):
         if "config" in data:
             save_config(data["config"])
         if "logs" in data:
-            update_logs(lambda _: data["logs"])
+            # Backups antigos só têm os eventos recentes: mescla, sem descartar o histórico atual
+            event_writer.flush()
+            _log_atividade().mesclar(data["logs"])
         return True
     except Exception as e:
         print(f"Erro ao restaurar banco criptografado: {e}")
@@ -0,0 +1,99 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HasherOcupado(RuntimeError):
+    """Há `max_fila` hashes em andamento: a requisição é recusada em vez de esperar na fila."""
+
+
+class PasswordHasher:
+    """
+    Hash/verificação de senhas (scrypt) num pool pequeno e limitado de threads.
+
+    O scrypt do hashlib libera o GIL, então o pool roda em paralelo de verdade, mas no máximo
+    `max_workers` hashes ao mesmo tempo (cada um usa ~32 MB e um núcleo inteiro): uma leva de
+    logins espera na fila do pool em vez de tomar a CPU das outras requisições.
+    Quem espera é a thread da requisição (bloqueada em `.result()`), então a fila também é limitada:
+    com `max_fila` operações em andamento (executando + esperando) a próxima levanta HasherOcupado
+    na hora (a rota responde 503 com Retry-After). Um `max_fila` menor que o número de threads do
+    servidor garante que uma rajada de logins nunca ocupa todas elas; em troca, logins além desse
+    limite precisam ser repetidos pelo cliente.
+    `hash_padrao()` devolve um hash único da senha padrão, calculado uma vez por processo, para
+    provisionamento em lote (importar 200 professores não custa 200 scrypts).
+    `metricas()` expõe contadores de tempo por operação (execução e espera na fila).
+    """
+    SENHA_PADRAO = '@Senha123456'
+
+    def __init__(self, max_workers=2, max_fila=8):
+        self.max_fila = max(max_workers, max_fila)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hash')
+        self._lock = threading.Lock()
+        self._lock_padrao = threading.Lock()
+        self._padrao = None
+        self._em_andamento = 0
+        self._recusados = 0
+        self._metricas = {op: {'chamadas': 0, 'total': 0.0, 'maximo': 0.0, 'espera': 0.0}
+                          for op in ('gerar', 'verificar')}
+
+    def _executar(self, op, funcao, *args):
+        enviado = time.perf_counter()
+
+        def medir():
+            inicio = time.perf_counter()
+            try:
+                return funcao(*args)
+            finally:
+                duracao = time.perf_counter() - inicio
+                with self._lock:
+                    m = self._metricas[op]
+                    m['chamadas'] += 1
+                    m['total'] += duracao
+                    m['maximo'] = max(m['maximo'], duracao)
+                    m['espera'] += inicio - enviado
+
+        with self._lock:
+            if self._em_andamento >= self.max_fila:
+                self._recusados += 1
+                raise HasherOcupado(f"{self._em_andamento} hashes de senha em andamento")
+            self._em_andamento += 1
+        try:
+            return self._pool.submit(medir).result()
+        finally:
+            with self._lock:
+                self._em_andamento -= 1
+
+    def gerar(self, senha):
+        return self._executar('gerar', generate_password_hash, senha)
+
+    def verificar(self, senha_hash, senha):
+        if not senha_hash:
+            return False
+        return self._executar('verificar', check_password_hash, senha_hash, senha)
+
+    def hash_padrao(self):
+        """Hash compartilhado da SENHA_PADRAO (mesmo sal para todos os usuários provisionados em lote)."""
+        if self._padrao is None:
+            with self._lock_padrao:
+                if self._padrao is None:
+                    self._padrao = self.gerar(self.SENHA_PADRAO)
+        return self._padrao
+
+    def metricas(self):
+        with self._lock:
+            resultado = {'em_andamento': self._em_andamento, 'max_fila': self.max_fila,
+                         'recusados': self._recusados}
+            for op, m in self._metricas.items():
+                n = m['chamadas']
+                resultado[op] = {
+                    'chamadas': n,
+                    'media_ms': round(m['total'] / n * 1000, 1) if n else 0.0,
+                    'maximo_ms': round(m['maximo'] * 1000, 1),
+                    'espera_media_ms': round(m['espera'] / n * 1000, 1) if n else 0.0,
+                }
+            return resultado
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
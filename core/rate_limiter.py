@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import threading
+
+
+class RateLimiter:
+    """
+    Token buckets em memória, por tipo de chave (ex: 'ip', 'usuario').
+
+    Cada regra é (capacidade, segundos por ficha): o balde começa cheio, cada tentativa consome
+    uma ficha e as fichas voltam continuamente até a capacidade. Sem ficha, a tentativa é recusada
+    na hora com o tempo de espera (Retry-After) — nada de dormir na thread do Waitress.
+    Baldes cheios equivalem a baldes inexistentes e são os primeiros descartados quando o número
+    de chaves passa de `max_chaves`. Com `arquivo`, o estado é carregado na criação e gravado em
+    `salvar()` (o relógio é o de parede, então o reabastecimento continua valendo após reiniciar).
+    """
+
+    def __init__(self, regras, max_chaves=10000, arquivo=None):
+        self.regras = dict(regras)
+        self.max_chaves = max_chaves
+        self.arquivo = arquivo
+        self._lock = threading.Lock()
+        self._baldes = {}  # (tipo, chave) -> [fichas, instante da última atualização]
+        if arquivo:
+            self._carregar()
+
+    def _atual(self, tipo, chave, agora):
+        capacidade, intervalo = self.regras[tipo]
+        balde = self._baldes.get((tipo, chave))
+        if balde is None:
+            return [float(capacidade), agora]
+        balde[0] = min(capacidade, balde[0] + max(0.0, agora - balde[1]) / intervalo)
+        balde[1] = agora
+        return balde
+
+    def espera(self, tipo, chave):
+        """Segundos até haver uma ficha para a chave (0 se já pode tentar). Não consome."""
+        with self._lock:
+            fichas = self._atual(tipo, chave, time.time())[0]
+            return 0.0 if fichas >= 1 else (1 - fichas) * self.regras[tipo][1]
+
+    def consumir(self, tipo, chave):
+        """Consome uma ficha. Retorna 0 se consumiu ou os segundos de espera se o balde está vazio."""
+        with self._lock:
+            agora = time.time()
+            balde = self._atual(tipo, chave, agora)
+            if balde[0] < 1:
+                return (1 - balde[0]) * self.regras[tipo][1]
+            balde[0] -= 1
+            self._baldes[(tipo, chave)] = balde
+            if len(self._baldes) > self.max_chaves:
+                self._podar(agora)
+            return 0.0
+
+    def liberar(self, tipo, chave):
+        """Esquece a chave (ex: login bem-sucedido zera as falhas do usuário)."""
+        with self._lock:
+            self._baldes.pop((tipo, chave), None)
+
+    def _podar(self, agora):
+        for (tipo, chave) in list(self._baldes):
+            if self._atual(tipo, chave, agora)[0] >= self.regras[tipo][0]:
+                del self._baldes[(tipo, chave)]
+        excedente = len(self._baldes) - self.max_chaves
+        if excedente > 0:
+            # Ainda cheio de chaves ativas: descarta as atualizadas há mais tempo
+            antigas = sorted(self._baldes, key=lambda k: self._baldes[k][1])[:excedente]
+            for k in antigas:
+                del self._baldes[k]
+
+    def _carregar(self):
+        try:
+            with open(self.arquivo, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+        except (OSError, ValueError):
+            return
+        for tipo, chave, fichas, instante in dados:
+            if tipo in self.regras:
+                self._baldes[(tipo, chave)] = [float(fichas), float(instante)]
+
+    def salvar(self):
+        if not self.arquivo:
+            return
+        with self._lock:
+            agora = time.time()
+            self._podar(agora)
+            dados = [[tipo, chave, fichas, instante] for (tipo, chave), (fichas, instante) in self._baldes.items()]
+        temp = f"{self.arquivo}.tmp"
+        try:
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump(dados, f)
+            os.replace(temp, self.arquivo)
+        except OSError as e:
+            print(f"[LOGIN] Falha ao gravar o estado do limitador: {e}")
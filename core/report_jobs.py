@@ -0,0 +1,118 @@
+import os
+import time
+import uuid
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ReportJobs:
+    """
+    Relatórios pesados (estatísticas do BI, exportações) executados num pool pequeno de threads,
+    fora das threads do Waitress. O cliente submete, consulta o progresso e baixa o resultado.
+
+    Jobs são identificados pela chave (tipo, parâmetros, versão dos dados): submeter de novo a mesma
+    chave reaproveita o job em andamento ou o resultado pronto. Quando os dados mudam a versão muda,
+    e um novo job é criado. Guarda no máximo `max_jobs` jobs concluídos (LRU); arquivos de resultado
+    descartados são apagados.
+    """
+    PENDENTE, EXECUTANDO, CONCLUIDO, ERRO = 'pendente', 'executando', 'concluido', 'erro'
+
+    def __init__(self, max_workers=2, max_jobs=20):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='relatorio')
+        self._max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # job_id -> job (ordem de uso)
+        self._por_chave = {}        # chave -> job_id
+
+    def submit(self, chave, funcao):
+        """
+        Agenda funcao(job) e retorna o estado do job. A função recebe o dict do job para reportar
+        progresso via `progresso(job, feito, total)` e retorna (resultado, arquivo) — `arquivo` é o
+        caminho de um arquivo temporário (exportações) ou None.
+        """
+        with self._lock:
+            job_id = self._por_chave.get(chave)
+            job = self._jobs.get(job_id) if job_id else None
+            if job is not None and job['estado'] != self.ERRO:
+                self._jobs.move_to_end(job_id)
+                return self._publico(job)
+            job_id = uuid.uuid4().hex
+            job = {
+                'id': job_id, 'chave': chave, 'estado': self.PENDENTE, 'progresso': 0.0,
+                'criado_em': time.time(), 'concluido_em': None,
+                'resultado': None, 'arquivo': None, 'erro': None
+            }
+            self._jobs[job_id] = job
+            self._por_chave[chave] = job_id
+            self._descartar_excedentes()
+        self._pool.submit(self._executar, job, funcao)
+        return self._publico(job)
+
+    def _executar(self, job, funcao):
+        job['estado'] = self.EXECUTANDO
+        try:
+            resultado, arquivo = funcao(job)
+        except Exception as e:
+            print(f"[RELATORIO] Falha no job {job['id']}: {e}")
+            job['erro'] = str(e)
+            job['estado'] = self.ERRO
+        else:
+            job['resultado'], job['arquivo'] = resultado, arquivo
+            job['progresso'] = 1.0
+            job['estado'] = self.CONCLUIDO
+        job['concluido_em'] = time.time()
+
+    @staticmethod
+    def progresso(job, feito, total):
+        if total:
+            job['progresso'] = min(0.99, feito / total)
+
+    @staticmethod
+    def novo_arquivo(sufixo):
+        """Arquivo temporário para o resultado de uma exportação (apagado quando o job é descartado)."""
+        fd, caminho = tempfile.mkstemp(prefix='eduagenda_relatorio_', suffix=sufixo)
+        os.close(fd)
+        return caminho
+
+    def _descartar_excedentes(self):
+        concluidos = [j for j in self._jobs.values() if j['estado'] in (self.CONCLUIDO, self.ERRO)]
+        for job in concluidos[:max(0, len(concluidos) - self._max_jobs)]:
+            self._jobs.pop(job['id'], None)
+            if self._por_chave.get(job['chave']) == job['id']:
+                del self._por_chave[job['chave']]
+            if job['arquivo']:
+                try:
+                    os.remove(job['arquivo'])
+                except OSError:
+                    # Ainda aberto por um download em andamento (Windows): fica para o sistema limpar
+                    pass
+
+    @staticmethod
+    def _publico(job):
+        return {k: job[k] for k in ('id', 'estado', 'progresso', 'erro')}
+
+    def status(self, job_id):
+        """Estado do job (sem o resultado) ou None se ele não existe/expirou."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._publico(job) if job else None
+
+    def get(self, job_id):
+        """Job completo (inclui resultado/arquivo) ou None."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._jobs.move_to_end(job_id)
+            return job
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            for job in self._jobs.values():
+                if job['arquivo']:
+                    try:
+                        os.remove(job['arquivo'])
+                    except OSError:
+                        pass
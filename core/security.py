@@ -1,6 +1,11 @@
 import os
 import base64
 import hashlib
+import re
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.fernet import Fernet
 from dotenv import load_dotenv
 
@@ -21,9 +26,27 @@ else:
 
 load_dotenv(DOTENV_PATH, override=True)
 
+# Formato do token Fernet: base64url de 0x80 | timestamp(8) | IV(16) | ciphertext(16*k) | HMAC(32).
+# O prefixo "gAAAAA" corresponde à versão 0x80 seguida dos bytes altos (zerados) do timestamp.
+_FERNET_PREFIX = 'gAAAAA'
+_FERNET_CHARS = re.compile(r'[A-Za-z0-9_-]+={0,2}')
+_FERNET_MIN_BYTES = 1 + 8 + 16 + 16 + 32
+
+# Lotes a partir deste tamanho são divididos entre threads (restaurações de backups grandes)
+_BULK_PARALLEL_MIN = int(os.getenv('EDU_CRYPTO_PARALLEL_MIN', '2000'))
+_BULK_CHUNK = 1000
+
 class SecretManager:
     _fernet = None
 
+    # Cache LRU token -> texto claro. Tokens Fernet são imutáveis, então o resultado de um
+    # decrypt só muda se a chave mudar (reload_key limpa o cache).
+    _decrypt_cache = OrderedDict()
+    _cache_lock = threading.Lock()
+    _cache_max = int(os.getenv('EDU_DECRYPT_CACHE_SIZE', '50000'))
+    _cache_hits = 0
+    _cache_misses = 0
+
     @classmethod
     def _get_fernet(cls):
         if cls._fernet is None:
@@ -41,8 +64,46 @@ class SecretManager:
         """Recarrega a chave de criptografia do arquivo .env atual."""
         load_dotenv(DOTENV_PATH, override=True)
         cls._fernet = None
+        cls.clear_cache()
         print("🔐 Chave de criptografia recarregada com sucesso.")
 
+    @classmethod
+    def clear_cache(cls):
+        """Descarta o cache de descriptografia (obrigatório quando a chave muda)."""
+        with cls._cache_lock:
+            cls._decrypt_cache.clear()
+
+    @classmethod
+    def cache_stats(cls):
+        with cls._cache_lock:
+            return {
+                "size": len(cls._decrypt_cache),
+                "max_size": cls._cache_max,
+                "hits": cls._cache_hits,
+                "misses": cls._cache_misses
+            }
+
+    @classmethod
+    def _cache_get(cls, token):
+        with cls._cache_lock:
+            plain = cls._decrypt_cache.get(token)
+            if plain is None:
+                cls._cache_misses += 1
+                return None
+            cls._decrypt_cache.move_to_end(token)
+            cls._cache_hits += 1
+            return plain
+
+    @classmethod
+    def _cache_put(cls, token, plain):
+        if cls._cache_max <= 0:
+            return
+        with cls._cache_lock:
+            cls._decrypt_cache[token] = plain
+            cls._decrypt_cache.move_to_end(token)
+            while len(cls._decrypt_cache) > cls._cache_max:
+                cls._decrypt_cache.popitem(last=False)
+
     @classmethod
     def encrypt(cls, text: str) -> str:
         """Criptografa um texto e retorna uma string base64."""
@@ -61,24 +122,116 @@ class SecretManager:
         """Descriptografa uma string base64. Retorna o original se não estiver criptografado."""
         if not encrypted_text:
             return ""
+
+        # Texto simples (dados legados ainda não migrados) não passa pela criptografia
+        if not cls.is_encrypted(encrypted_text):
+            return encrypted_text
+
+        cached = cls._cache_get(encrypted_text)
+        if cached is not None:
+            return cached
         
-        # Heurística simples: se não começar com os padrões do Fernet ou falhar, retorna o original
-        # Isso permite migração suave de tokens em texto simples
+        # Token com formato válido mas que não abre com a chave atual (ex: chave trocada):
+        # retorna o original, como antes
         try:
             f = cls._get_fernet()
             decrypted_bytes = f.decrypt(encrypted_text.encode())
-            return decrypted_bytes.decode()
+            plain = decrypted_bytes.decode()
         except Exception:
-            # Se falhar, assumimos que o token ainda está em texto simples (transição)
-            return encrypted_text
+            plain = encrypted_text
+        cls._cache_put(encrypted_text, plain)
+        return plain
+
+    @staticmethod
+    def _map_chunks(func, items):
+        """Aplica `func` (lista -> lista) em blocos, usando threads apenas para lotes grandes."""
+        workers = min(4, os.cpu_count() or 1)
+        if len(items) < _BULK_PARALLEL_MIN or workers < 2:
+            return func(items)
+        blocos = [items[i:i + _BULK_CHUNK] for i in range(0, len(items), _BULK_CHUNK)]
+        resultado = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crypto') as pool:
+            for parte in pool.map(func, blocos):
+                resultado.extend(parte)
+        return resultado
+
+    @classmethod
+    def encrypt_many(cls, values):
+        """
+        Criptografa uma coluna de valores de uma vez. Vazios viram "" e valores que já são tokens
+        são mantidos. Cada valor ainda recebe IV e HMAC próprios (exigência do formato Fernet);
+        o ganho vem de reutilizar o cipher e dividir lotes grandes entre threads.
+        """
+        values = list(values)
+        resultado = [v if v else "" for v in values]
+        pendentes = [i for i, v in enumerate(values) if v and not cls.is_encrypted(v)]
+        if not pendentes:
+            return resultado
+        f = cls._get_fernet()
+
+        def processar(indices):
+            agora = int(time.time())
+            saida = []
+            for i in indices:
+                try:
+                    saida.append(f.encrypt_at_time(values[i].encode(), agora).decode())
+                except Exception as e:
+                    print(f"[SECURITY ERROR] Falha ao criptografar: {e}")
+                    saida.append(values[i])
+            return saida
+
+        for i, token in zip(pendentes, cls._map_chunks(processar, pendentes)):
+            resultado[i] = token
+        return resultado
+
+    @classmethod
+    def decrypt_many(cls, values):
+        """Descriptografa uma coluna de valores, consultando o cache antes e tokens repetidos uma só vez."""
+        values = list(values)
+        resultado = []
+        faltando = {}
+        for i, v in enumerate(values):
+            if not v:
+                resultado.append("")
+            elif not cls.is_encrypted(v):
+                resultado.append(v)
+            else:
+                plain = cls._cache_get(v)
+                if plain is None:
+                    faltando.setdefault(v, []).append(i)
+                resultado.append(plain)
+        if not faltando:
+            return resultado
+        f = cls._get_fernet()
+
+        def processar(tokens):
+            saida = []
+            for token in tokens:
+                try:
+                    saida.append(f.decrypt(token.encode()).decode())
+                except Exception:
+                    saida.append(token)
+            return saida
+
+        tokens = list(faltando)
+        for token, plain in zip(tokens, cls._map_chunks(processar, tokens)):
+            cls._cache_put(token, plain)
+            for i in faltando[token]:
+                resultado[i] = plain
+        return resultado
 
     @classmethod
     def is_encrypted(cls, text: str) -> bool:
-        """Verifica se o texto parece estar criptografado."""
-        if not text: return False
-        try:
-            f = cls._get_fernet()
-            f.decrypt(text.encode())
-            return True
-        except:
+        """
+        Verifica se o texto tem o formato de um token Fernet, sem executar criptografia.
+        Valores salvos por versões anteriores já são tokens Fernet, então não há migração:
+        texto simples legado continua sendo reconhecido e criptografado no próximo save.
+        """
+        if not text or not isinstance(text, str):
+            return False
+        if not text.startswith(_FERNET_PREFIX) or len(text) % 4 != 0:
+            return False
+        if not _FERNET_CHARS.fullmatch(text):
             return False
+        tamanho = len(text) // 4 * 3 - (len(text) - len(text.rstrip('=')))
+        return tamanho >= _FERNET_MIN_BYTES and (tamanho - _FERNET_MIN_BYTES) % 16 == 0
@@ -0,0 +1,322 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+
+
+def diff_objetos(antes, depois):
+    """
+    Casa a lista devolvida por um callback de update com a lista que ele recebeu, sem serializar registros.
+
+    Registros devolvidos como o mesmo objeto contam como inalterados (contrato de JOURNALED do
+    DataManager); os demais são casados pelo id com uma posição anterior ainda livre ou são novos.
+
+    Retorna (destino, removidos):
+      destino   -> destino[i] = (posição anterior, alterado) ou None para um registro novo
+      removidos -> posições anteriores que não estão mais na lista, em ordem
+    ou None quando a ordem relativa mudou (ex: sort) ou um registro novo não está no final,
+    e é preciso regravar tudo.
+    """
+    por_objeto = {id(r): pos for pos, r in enumerate(antes)}
+    usadas = set()
+    destino = [None] * len(depois)
+    pendentes = []
+    for i, r in enumerate(depois):
+        pos = por_objeto.get(id(r))
+        if pos is not None and pos not in usadas:
+            usadas.add(pos)
+            destino[i] = (pos, False)
+        elif isinstance(r, dict):
+            pendentes.append(i)
+
+    if pendentes:
+        # Índice por id só quando há registros novos/alterados (o caso comum é um ou dois)
+        por_id = {}
+        for pos, r in enumerate(antes):
+            if pos not in usadas and isinstance(r, dict) and r.get('id') is not None:
+                por_id.setdefault(r['id'], []).append(pos)
+        for i in pendentes:
+            for pos in por_id.get(depois[i].get('id'), []):
+                if pos not in usadas:
+                    usadas.add(pos)
+                    destino[i] = (pos, True)
+                    break
+
+    novos = False
+    ultima = -1
+    for alvo in destino:
+        if alvo is None:
+            novos = True
+            continue
+        if novos or alvo[0] < ultima:
+            return None
+        ultima = alvo[0]
+
+    if len(usadas) == len(antes):
+        return destino, []
+    return destino, [pos for pos in range(len(antes)) if pos not in usadas]
+
+
+def apply_delta(rows, delta):
+    """
+    Reaplica sobre `rows` um delta no formato do journal (posições relativas à lista anterior):
+      {"set": [[posicao, registro], ...], "del": [posicao, ...], "add": [registro, ...]}
+    Retorna a nova lista. Lança ValueError se o delta não corresponder à lista.
+    """
+    rows = list(rows)
+    for pos, registro in delta.get('set', []):
+        if not 0 <= pos < len(rows):
+            raise ValueError(f"posição {pos} fora da lista ({len(rows)} registros)")
+        rows[pos] = registro
+    removidos = set(delta.get('del', []))
+    if removidos:
+        if max(removidos) >= len(rows) or min(removidos) < 0:
+            raise ValueError("remoção fora da lista")
+        rows = [r for i, r in enumerate(rows) if i not in removidos]
+    rows.extend(delta.get('add', []))
+    return rows
+
+
+def _dump(record):
+    return json.dumps(record, ensure_ascii=False)
+
+
+class SQLiteStore:
+    """
+    Backend opcional em SQLite (modo WAL) com a mesma semântica de "arquivo" do DataManager.
+
+    Cada arquivo JSON vira uma tabela (agendamentos.json -> agendamentos) com um registro por linha.
+    Os updates casam a lista devolvida pelo callback com a recebida (diff_objetos) e gravam só as
+    linhas alteradas: criar/travar/remover um agendamento não relê nem serializa a tabela inteira.
+    As chaves (`ordem`) das linhas de cada tabela ficam em memória para a versão lida (meta.versao);
+    se outro processo gravar, a versão muda e elas são relidas.
+    """
+    DB_NAME = 'eduagenda.db'
+    ARQUIVOS = [
+        'config.json', 'professores.json', 'turmas.json', 'recursos.json',
+        'usuarios.json', 'agendamentos.json', 'logs.json'
+    ]
+    # Arquivos particionados (ex: agendamentos_<recurso>.json), importados junto com ARQUIVOS
+    PARTICIONADOS = ('agendamentos_',)
+    # Colunas extraídas do documento para consulta/índice (campos não criptografados).
+    # Vale também para as partições (agendamentos_<recurso>).
+    INDEXADAS = {'agendamentos': ['recurso_id', 'semana_inicio']}
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, self.DB_NAME)
+        self._local = threading.local()
+        self._tabelas = set()
+        self._schema_lock = threading.Lock()
+        self._chaves = {}  # tabela -> (versao, [ordem das linhas, na ordem da lista])
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: controlamos as transações com BEGIN explícito
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS meta ('
+                'entidade TEXT PRIMARY KEY, versao INTEGER NOT NULL, tipo TEXT NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _tabela(filename):
+        nome = os.path.splitext(filename)[0]
+        if not re.fullmatch(r'[a-z][a-z0-9_]*', nome):
+            raise ValueError(f"Nome de entidade inválido para o SQLite: {filename}")
+        return nome
+
+    def _garantir_tabela(self, conn, tabela):
+        if tabela in self._tabelas:
+            return
+        with self._schema_lock:
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {tabela} ('
+                'ordem INTEGER PRIMARY KEY, id TEXT, recurso_id TEXT, semana_inicio TEXT, doc TEXT NOT NULL)'
+            )
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabela}_id ON {tabela}(id)')
+            for coluna in self.INDEXADAS.get(tabela.split('_', 1)[0], []):
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{tabela}_{coluna} ON {tabela}({coluna})')
+            self._tabelas.add(tabela)
+
+    def _meta(self, conn, tabela):
+        return conn.execute('SELECT versao, tipo FROM meta WHERE entidade = ?', (tabela,)).fetchone()
+
+    def signature(self, filename):
+        """Versão persistida da entidade (incrementada a cada escrita) ou None se ela não existir."""
+        meta = self._meta(self._conn(), self._tabela(filename))
+        return ('sqlite', meta[0]) if meta else None
+
+    def list_files(self, prefix):
+        """Entidades existentes cujo nome de arquivo começa com `prefix` (ex: partições)."""
+        # substr em vez de LIKE: '_' é curinga no LIKE
+        linhas = self._conn().execute(
+            'SELECT entidade FROM meta WHERE substr(entidade, 1, ?) = ? ORDER BY entidade',
+            (len(prefix), prefix)
+        ).fetchall()
+        return [f"{entidade}.json" for (entidade,) in linhas]
+
+    def _linhas(self, conn, tabela):
+        return conn.execute(f'SELECT ordem, id, doc FROM {tabela} ORDER BY ordem').fetchall()
+
+    @staticmethod
+    def _montar(tipo, linhas):
+        if tipo == 'dict':
+            return json.loads(linhas[0][2]) if linhas else {}
+        return [json.loads(doc) for _, _, doc in linhas]
+
+    def read(self, filename):
+        """Lê a entidade inteira (lista ou dict). Retorna None se ela ainda não existe."""
+        tabela = self._tabela(filename)
+        conn = self._conn()
+        self._garantir_tabela(conn, tabela)
+        # Dentro de um update (mesma thread) a leitura já faz parte da transação aberta
+        propria = not conn.in_transaction
+        if propria:
+            conn.execute('BEGIN')
+        try:
+            meta = self._meta(conn, tabela)
+            if not meta:
+                return None
+            linhas = self._linhas(conn, tabela)
+            if propria:
+                # Dentro de um update a versão vista pode ainda ser desfeita por um rollback
+                self._chaves[tabela] = (meta[0], [ordem for ordem, _, _ in linhas])
+            return self._montar(meta[1], linhas)
+        finally:
+            if propria:
+                conn.execute('COMMIT')
+
+    def update(self, filename, callback, lookup=None, remember=None):
+        """
+        Read-modify-write atômico (BEGIN IMMEDIATE). Retorna (novos_dados, assinatura).
+
+        lookup(sig) -> dados em cache para a versão atual (evita decodificar as linhas);
+        remember(sig, dados) -> avisa o cache sobre o estado lido dentro da transação.
+        """
+        tabela = self._tabela(filename)
+        conn = self._conn()
+        self._garantir_tabela(conn, tabela)
+        # Update aninhado (ex: várias partições na mesma operação) participa da transação externa
+        propria = not conn.in_transaction
+        if propria:
+            conn.execute('BEGIN IMMEDIATE')
+        try:
+            meta = self._meta(conn, tabela)
+            chaves = None
+            if meta:
+                versao, tipo = meta
+                sig = ('sqlite', versao)
+                data = lookup(sig) if lookup else None
+                em_cache = self._chaves.get(tabela)
+                if em_cache is not None and em_cache[0] == versao:
+                    chaves = em_cache[1]
+                if data is None:
+                    linhas = self._linhas(conn, tabela)
+                    chaves = [ordem for ordem, _, _ in linhas]
+                    data = self._montar(tipo, linhas)
+                    if remember:
+                        remember(sig, data)
+                elif chaves is None:
+                    # Dados em cache, chaves não (outro processo gravou): só as chaves são lidas
+                    chaves = [ordem for (ordem,) in conn.execute(f'SELECT ordem FROM {tabela} ORDER BY ordem')]
+            else:
+                versao = 0
+                data = {} if filename == 'config.json' else []
+                chaves = []
+            antes = list(data) if isinstance(data, list) else None
+
+            new_data = callback(data)
+            if new_data is None:
+                if propria:
+                    conn.execute('COMMIT')
+                return None, ('sqlite', versao) if meta else None
+
+            chaves = self._gravar(conn, tabela, chaves, antes, new_data)
+            versao += 1
+            conn.execute(
+                'INSERT OR REPLACE INTO meta (entidade, versao, tipo) VALUES (?, ?, ?)',
+                (tabela, versao, 'dict' if isinstance(new_data, dict) else 'list')
+            )
+            if propria:
+                conn.execute('COMMIT')
+                self._chaves[tabela] = (versao, chaves)
+            else:
+                # A transação externa ainda pode ser desfeita: a próxima escrita relê as chaves
+                self._chaves.pop(tabela, None)
+            return new_data, ('sqlite', versao)
+        except BaseException:
+            self._chaves.pop(tabela, None)
+            if propria:
+                conn.execute('ROLLBACK')
+            raise
+
+    def _gravar(self, conn, tabela, chaves, antes, new_data):
+        """Grava só as linhas alteradas. Retorna as chaves (ordem) das linhas da nova lista."""
+        registros = [new_data] if isinstance(new_data, dict) else list(new_data)
+        diff = diff_objetos(antes, registros) if antes is not None else None
+        if diff is None:
+            # Ordem alterada (ex: lista reordenada) ou dict (config): regrava a tabela inteira
+            conn.execute(f'DELETE FROM {tabela}')
+            destino, removidos, proxima = [None] * len(registros), [], 1
+        else:
+            destino, removidos = diff
+            proxima = max(chaves) + 1 if chaves else 1
+
+        def colunas(r):
+            rid = r.get('id') if isinstance(r, dict) else None
+            extra = [r.get(c) if isinstance(r, dict) else None for c in ('recurso_id', 'semana_inicio')]
+            return [str(rid) if rid is not None else None] + extra + [_dump(r)]
+
+        novas_chaves, updates, inserts = [], [], []
+        for r, alvo in zip(registros, destino):
+            if alvo is None:
+                # Novos sempre no final: ordem maior que a de todas as linhas existentes
+                inserts.append([proxima] + colunas(r))
+                novas_chaves.append(proxima)
+                proxima += 1
+                continue
+            pos, alterado = alvo
+            if alterado:
+                updates.append(colunas(r) + [chaves[pos]])
+            novas_chaves.append(chaves[pos])
+
+        if removidos:
+            conn.executemany(f'DELETE FROM {tabela} WHERE ordem = ?', [(chaves[pos],) for pos in removidos])
+        if updates:
+            conn.executemany(
+                f'UPDATE {tabela} SET id = ?, recurso_id = ?, semana_inicio = ?, doc = ? WHERE ordem = ?', updates
+            )
+        if inserts:
+            conn.executemany(
+                f'INSERT INTO {tabela} (ordem, id, recurso_id, semana_inicio, doc) VALUES (?, ?, ?, ?, ?)', inserts
+            )
+        return novas_chaves
+
+    def import_json(self, data_dir, force=False):
+        """
+        Migração única: importa os arquivos JSON existentes (já criptografados) para o banco.
+        Entidades que já existem no SQLite são ignoradas, a menos que force=True.
+        Retorna {arquivo: quantidade de registros importados}.
+        """
+        resultado = {}
+        particoes = sorted(
+            f for f in os.listdir(data_dir)
+            if f.startswith(self.PARTICIONADOS) and f.endswith('.json')
+        ) if os.path.isdir(data_dir) else []
+        for filename in self.ARQUIVOS + particoes:
+            path = os.path.join(data_dir, filename)
+            if not os.path.exists(path):
+                continue
+            if not force and self.signature(filename) is not None:
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.update(filename, lambda _: data)
+            resultado[filename] = 1 if isinstance(data, dict) else len(data)
+        return resultado
@@ -0,0 +1,37 @@
+class DiretorioUsuarios:
+    """
+    Índice dos usuários (já descriptografados) para autenticação e autorização.
+
+    Busca por username (case-insensitive) e por professor_id em O(1), em vez de descriptografar
+    e varrer a lista a cada requisição. Mantido como view do DataManager sobre usuarios.json:
+    compartilhado entre threads (somente leitura) e reconstruído quando o arquivo muda
+    (update_usuarios/save_usuarios ou alteração externa). Em nomes repetidos vale o primeiro
+    registro, como no `next(...)` que ele substitui; `status_por_nome` segue o dict por nome
+    (o último registro vence).
+    """
+    __slots__ = ('_usuarios', '_por_username', '_por_professor', 'status_por_nome')
+
+    def __init__(self, usuarios=()):
+        self._usuarios = list(usuarios)
+        self._por_username = {}
+        self._por_professor = {}
+        self.status_por_nome = {}
+        for u in self._usuarios:
+            self._por_username.setdefault(str(u.get('username', '')).lower(), u)
+            if u.get('professor_id'):
+                self._por_professor.setdefault(u['professor_id'], u)
+            if 'nome' in u:
+                self.status_por_nome[u['nome']] = u.get('active', True)
+
+    def __len__(self):
+        return len(self._usuarios)
+
+    def por_username(self, username):
+        """Cópia do usuário com esse username (sem diferenciar maiúsculas) ou None."""
+        u = self._por_username.get(str(username or '').lower())
+        return dict(u) if u is not None else None
+
+    def por_professor(self, professor_id):
+        """Cópia do usuário vinculado ao professor ou None."""
+        u = self._por_professor.get(professor_id) if professor_id else None
+        return dict(u) if u is not None else None
@@ -0,0 +1,41 @@
+import os
+import sys
+from core.models import DATA_DIR, STORAGE_BACKEND, DataManager
+from core.storage import SQLiteStore
+
+def migrate_sqlite(force=False):
+    print("[*] Migrando arquivos JSON para o backend SQLite...")
+    print(f"[i] Pasta de dados: {DATA_DIR}")
+
+    if not os.path.exists(DATA_DIR):
+        print("[X] Pasta de dados não encontrada. Nada a migrar.")
+        sys.exit(1)
+
+    # Operações ainda no journal (backend JSON) precisam estar nos arquivos antes da importação
+    if STORAGE_BACKEND == 'sqlite':
+        pendentes = [f for f in os.listdir(DATA_DIR) if f.endswith(DataManager.JOURNAL_SUFFIX) and os.path.getsize(os.path.join(DATA_DIR, f))]
+        if pendentes:
+            print(f"[X] Journals pendentes ({', '.join(pendentes)}). Rode a migração com o backend JSON ativo.")
+            sys.exit(1)
+    else:
+        DataManager.compact()
+
+    try:
+        store = SQLiteStore(DATA_DIR)
+        resultado = store.import_json(DATA_DIR, force=force)
+    except Exception as e:
+        print(f"[X] Erro ao migrar para SQLite: {e}")
+        sys.exit(1)
+
+    if not resultado:
+        print("[i] Nenhuma entidade importada (banco já populado? use --force para reimportar).")
+    for filename, total in resultado.items():
+        print(f"[+] {filename}: {total} registro(s) importado(s)")
+
+    # Os JSONs originais são mantidos intactos como cópia de segurança
+    print(f"[OK] Banco criado em {store.path}")
+    if STORAGE_BACKEND != 'sqlite':
+        print("[!] Defina EDU_STORAGE_BACKEND=sqlite (ambiente ou .env) para ativar o novo backend.")
+
+if __name__ == "__main__":
+    migrate_sqlite(force='--force' in sys.argv)
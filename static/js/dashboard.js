@@ -96,29 +96,13 @@ const DashboardAdmin = {
             `;
         }
 
-        // Safety net: Timeout de 8 segundos para não travar a tela
-        const safetyNet = setTimeout(() => {
-            if (this.isLoading && loader) {
-                console.warn("[BI] Timeout de carregamento atingido. Forçando encerramento.");
-                this.isLoading = false;
-                loader.style.display = 'none';
-            }
-        }, 8000);
-
         try {
             console.time("BI-Fetch");
-            // Cache Busting: Força o navegador a buscar dados novos do servidor
-            const uniqueRequest = Date.now() + Math.random().toString(36).substring(7);
-            const res = await fetch('/api/admin/dashboard/stats?v=' + uniqueRequest);
-
-            if (res.status === 403) {
-                console.error("[BI] Acesso Negado pelo servidor. Sessão pode ter expirado.");
-                alert("Sessão expirada. Por favor, faça login novamente.");
-                window.location.reload();
-                return;
-            }
-
-            const data = await res.json();
+            // Processado em segundo plano no servidor: o loader mostra o progresso em vez de desistir após um timeout
+            const data = await this.runReport({ tipo: 'stats' }, (p) => {
+                const label = loader && loader.querySelector('span');
+                if (label) label.innerText = `Processando Inteligência... ${Math.round(p * 100)}%`;
+            });
             console.timeEnd("BI-Fetch");
 
             if (data.error) throw new Error(data.error);
@@ -189,7 +173,6 @@ const DashboardAdmin = {
                 loader.innerHTML = `<span style="color:#ef4444; padding:20px; text-align:center;">⚠️ Erro de Dados: ${e.message}</span>`;
             }
         } finally {
-            clearTimeout(safetyNet);
             this.isLoading = false;
             if (loader) {
                 setTimeout(() => {
@@ -528,8 +511,7 @@ const DashboardAdmin = {
         btn.innerText = "Processando...";
 
         try {
-            const res = await fetch(`/api/admin/dashboard/stats?start_date=${start}&end_date=${end}&recurso_id=${recurso}`);
-            const data = await res.json();
+            const data = await this.runReport({ tipo: 'stats', start_date: start, end_date: end, recurso_id: recurso });
 
             if (data.error) throw new Error(data.error);
 
@@ -606,9 +588,9 @@ const DashboardAdmin = {
         if (!start || !end) return alert("Selecione o intervalo de datas");
 
         try {
-            const res = await fetch(`/api/admin/dashboard/export?start_date=${start}&end_date=${end}&recurso_id=${recurso}`);
-            if (!res.ok) throw new Error("Erro ao gerar planilha");
-
+            const res = await this.runReport(
+                { tipo: 'export', start_date: start, end_date: end, recurso_id: recurso, formato: 'xlsx' }, null, true
+            );
             const blob = await res.blob();
             const url = window.URL.createObjectURL(blob);
             const a = document.createElement('a');
@@ -623,6 +605,45 @@ const DashboardAdmin = {
         }
     },
 
+    /**
+     * Submete um relatório ao servidor (/api/admin/dashboard/jobs), acompanha o progresso e retorna o resultado:
+     * o JSON (stats) ou, com raw=true, a Response do download (planilhas).
+     */
+    async runReport(params, onProgress, raw = false) {
+        const submit = await fetch('/api/admin/dashboard/jobs', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(params)
+        });
+        if (submit.status === 403) {
+            console.error("[BI] Acesso Negado pelo servidor. Sessão pode ter expirado.");
+            alert("Sessão expirada. Por favor, faça login novamente.");
+            window.location.reload();
+            throw new Error("Sessão expirada");
+        }
+        let job = await submit.json();
+        if (!submit.ok) throw new Error(job.error || "Erro ao iniciar relatório");
+
+        let espera = 250;
+        while (job.estado !== 'concluido') {
+            if (job.estado === 'erro') throw new Error(job.erro || "Falha ao gerar relatório");
+            if (onProgress) onProgress(job.progresso || 0);
+            await new Promise(r => setTimeout(r, espera));
+            espera = Math.min(espera * 2, 2000);
+            const res = await fetch(`/api/admin/dashboard/jobs/${job.id}`);
+            job = await res.json();
+            if (!res.ok) throw new Error(job.error || "Relatório expirado");
+        }
+        if (onProgress) onProgress(1);
+
+        const res = await fetch(`/api/admin/dashboard/jobs/${job.id}/download`);
+        if (!res.ok) {
+            const erro = await res.json().catch(() => ({}));
+            throw new Error(erro.error || "Erro ao baixar relatório");
+        }
+        return raw ? res : res.json();
+    },
+
     createChart(id, options) {
         const el = document.getElementById(id);
         if (!el) return null;
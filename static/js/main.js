@@ -397,8 +397,9 @@ async function loadSchedule() {
     updateHeaderDates(semana);
     setLoading(true);
     try {
-        const res = await fetch(`/api/agendamentos?semana=${semana}&recurso=${window.currentResource}`);
+        const res = await fetch(`/api/agendamentos?semana=${semana}&recurso=${window.currentResource}&compacto=1`);
         window.currentSchedule = await res.json();
+        watchScheduleChanges(semana, window.currentResource, res.headers.get('X-Feed-Seq'), res.headers.get('X-Feed-Epoca'));
     } catch (e) {
         showToast("Erro ao carregar agenda", "error");
     } finally {
@@ -407,6 +408,50 @@ async function loadSchedule() {
     updateGridUI(window.currentSchedule.filter(a => a.turno === turno));
 }
 
+// Acompanha as alterações da semana exibida (long-poll em /api/agendamentos/changes) e aplica os patches
+// no grid, sem recarregar a semana inteira. Uma nova chamada (troca de semana/recurso) cancela a anterior.
+function watchScheduleChanges(semana, recurso, seq, epoca) {
+    if (window.scheduleFeed) window.scheduleFeed.abort();
+    if (seq === null || !epoca) return;
+    const feed = new AbortController();
+    window.scheduleFeed = feed;
+    const sleep = (ms) => new Promise(r => setTimeout(r, ms));
+
+    (async () => {
+        let since = seq;
+        while (!feed.signal.aborted) {
+            try {
+                const res = await fetch(`/api/agendamentos/changes?recurso=${recurso}&semana=${semana}&since=${since}&epoca=${epoca}&compacto=1`, { signal: feed.signal, cache: 'no-store' });
+                if (res.status === 429) {
+                    await sleep((parseInt(res.headers.get('Retry-After')) || 10) * 1000);
+                    continue;
+                }
+                if (!res.ok) {
+                    await sleep(5000);
+                    continue;
+                }
+                const d = await res.json();
+                if (feed.signal.aborted) return;
+                if (d.reset) {
+                    loadSchedule();
+                    return;
+                }
+                since = d.seq;
+                if (d.removidos.length || d.upserts.length) applySchedulePatch(d);
+            } catch (e) {
+                if (feed.signal.aborted) return;
+                await sleep(5000);
+            }
+        }
+    })();
+}
+
+function applySchedulePatch(patch) {
+    const trocados = new Set(patch.removidos.concat(patch.upserts.map(a => a.id)));
+    window.currentSchedule = (window.currentSchedule || []).filter(a => !trocados.has(a.id)).concat(patch.upserts);
+    updateGridUI(window.currentSchedule.filter(a => a.turno === window.currentShift));
+}
+
 function updateGridUI(agendamentos) {
     const semana = document.getElementById('semanaSelect')?.value || '';
     const turno = window.currentShift;
@@ -437,7 +482,8 @@ function updateGridUI(agendamentos) {
         if (a.locked) slot.classList.add('locked');
         slot.classList.add('filled');
 
-        const isOwner = a.criado_por === window.currentUser;
+        // Projeção compacta: a posse vem em `meu` (criado_por não é enviado)
+        const isOwner = a.meu || a.criado_por === window.currentUser;
         const isAssigned = window.currentProfessorId && a.professor_id === window.currentProfessorId;
 
         const profNome = window.professoresMap[a.professor_id] || a.professor_id;
@@ -523,8 +569,9 @@ async function onSlotClick(dia, periodo) {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ semana_inicio: semana, periodo, dia, turno, turma_id: turma, professor_id: prof, recurso_id: window.currentResource, tipo, frequencia: document.getElementById('freqSelect').value })
     });
-    if ((await res.json()).success) loadSchedule();
-    else showToast("Erro ao agendar", "error");
+    const d = await res.json();
+    if (d.success) loadSchedule();
+    else showToast(d.error || "Erro ao agendar", "error");
 }
 
 async function deleteSlot(e, id, dia, periodo, turmaId, turnoId, frequencia) {
@@ -0,0 +1,108 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from core import models
+from core.models import DataManager
+from core.agenda_index import AgendaCalendario, _ordinal
+from core.agenda_stats import AgendaStats
+
+RECURSO = 'lab1'
+INICIO = date(2030, 1, 7)
+SEMANAS = [(INICIO + timedelta(weeks=k)).strftime('%Y-%m-%d') for k in range(12)]
+DIAS = ['Segunda', 'Terça', 'Quarta']
+
+
+@pytest.fixture(autouse=True, params=['json', 'sqlite'])
+def backend(request, tmp_path, monkeypatch):
+    monkeypatch.setattr(models, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(models, 'STORAGE_BACKEND', request.param)
+    monkeypatch.setattr(DataManager, '_store', None)
+    DataManager.invalidate()
+    yield request.param
+    DataManager.invalidate()
+
+
+def _serie(i, semana=SEMANAS[0], dia='Segunda'):
+    return {'id': f's{i}', 'recurso_id': RECURSO, 'semana_inicio': semana, 'dia': dia,
+            'turno': 'Matutino', 'periodo': f'Aula {i % 6}', 'professor_id': f'p{i % 3}',
+            'turma_id': f't{i % 4}', 'frequencia': 'semanal'}
+
+
+def _intervalo():
+    return _ordinal(SEMANAS[0]), _ordinal(SEMANAS[-1]) + 6
+
+
+def _conferir():
+    """Views incrementais (após as escritas) iguais às reconstruídas do zero a partir dos dados."""
+    inicio, fim = _intervalo()
+    stats = models.get_agenda_stats(RECURSO)[0]
+    calendario = models.get_agenda_calendario(RECURSO)[0]
+    agendamentos = models.get_agendamentos(RECURSO)
+    esperado = AgendaStats(agendamentos)
+    assert stats.contagens() == esperado.contagens()
+    assert stats.contagens(inicio, fim) == esperado.contagens(inicio, fim)
+
+    def ocorrencias(cal):
+        return sorted((d, a['id'], tuple(a.get('excecoes') or ())) for d, a in cal.intervalo(inicio, fim))
+    assert ocorrencias(calendario) == ocorrencias(AgendaCalendario(agendamentos))
+
+
+def _excluir_semana(rid, semana):
+    """Como o 'unico' do DELETE: acrescenta a exceção na lista existente (in-place)."""
+    def excluir(agendamentos):
+        for a in agendamentos:
+            if a['id'] == rid:
+                if 'excecoes' not in a:
+                    a['excecoes'] = []
+                a['excecoes'].append(semana)
+        return agendamentos
+    models.update_agendamentos(excluir, RECURSO)
+
+
+def test_excecoes_in_place_nao_desviam_as_views():
+    models.save_agendamentos([_serie(0)])
+    _conferir()
+    _excluir_semana('s0', SEMANAS[2])
+    _conferir()
+    _excluir_semana('s0', SEMANAS[3])
+    _conferir()
+
+    inicio, fim = _intervalo()
+    assert models.get_agenda_stats(RECURSO)[0].contagens(inicio, fim)[('p', RECURSO, 'p0')] == len(SEMANAS) - 2
+
+
+def test_escritas_aleatorias_mantem_views_iguais_a_reconstrucao():
+    rnd = random.Random(11)
+    models.save_agendamentos([_serie(i, rnd.choice(SEMANAS[:4]), rnd.choice(DIAS)) for i in range(6)])
+    for passo in range(40):
+        ids = [a['id'] for a in models.get_agendamentos(RECURSO)]
+        op = rnd.choice(['excecao', 'excecao', 'setdefault', 'fim', 'novo', 'remover'])
+        alvo = rnd.choice(ids) if ids else None
+        semana = rnd.choice(SEMANAS)
+        if op == 'excecao' and alvo:
+            _excluir_semana(alvo, semana)
+        elif op == 'setdefault' and alvo:
+            # Como a substituição de uma ocorrência no POST: setdefault + append na lista existente
+            def substituir(agendamentos):
+                for a in agendamentos:
+                    if a['id'] == alvo:
+                        excecoes = a.setdefault('excecoes', [])
+                        if semana not in excecoes:
+                            excecoes.append(semana)
+                return agendamentos
+            models.update_agendamentos(substituir, RECURSO)
+        elif op == 'fim' and alvo:
+            def encerrar(agendamentos):
+                for a in agendamentos:
+                    if a['id'] == alvo:
+                        a['semana_fim'] = semana
+                return agendamentos
+            models.update_agendamentos(encerrar, RECURSO)
+        elif op == 'novo':
+            nova = _serie(100 + passo, semana, rnd.choice(DIAS))
+            models.update_agendamentos(lambda agendamentos: agendamentos + [nova], RECURSO)
+        elif op == 'remover' and alvo:
+            models.update_agendamentos(lambda agendamentos: [a for a in agendamentos if a['id'] != alvo], RECURSO)
+        _conferir()
@@ -0,0 +1,49 @@
+import pytest
+
+import app as eduagenda
+from core import models
+from core.models import DataManager
+
+SEMANA = '2030-01-07'
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(models, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(models, 'STORAGE_BACKEND', 'json')
+    DataManager.invalidate()
+    yield tmp_path
+    DataManager.invalidate()
+
+
+@pytest.fixture
+def client():
+    return eduagenda.app.test_client()
+
+
+def _cadastrar(n):
+    ids = [f'lab{i}' for i in range(n)]
+    models.save_recursos([{'id': rid, 'nome': rid.upper()} for rid in ids])
+    models.save_agendamentos([{'id': 'a1', 'recurso_id': ids[-1], 'semana_inicio': SEMANA, 'dia': 'Segunda',
+                               'turno': 'Matutino', 'periodo': 'Aula 1', 'professor': 'Ana'}])
+    return ids
+
+
+def test_batch_all_cobre_todos_os_recursos(client):
+    ids = _cadastrar(eduagenda.BATCH_MAX_RECURSOS + 4)
+    resp = client.get(f'/api/agendamentos/batch?recursos=all&semanas={SEMANA}')
+    assert resp.status_code == 200
+    dados = resp.get_json()
+    assert sorted(dados) == sorted(ids)
+    assert [a['id'] for a in dados[ids[-1]][SEMANA]] == ['a1']
+
+    # Sem o parâmetro também é "todos"
+    assert sorted(client.get(f'/api/agendamentos/batch?semanas={SEMANA}').get_json()) == sorted(ids)
+
+
+def test_batch_lista_explicita_respeita_o_limite(client):
+    ids = _cadastrar(eduagenda.BATCH_MAX_RECURSOS + 1)
+    resp = client.get(f"/api/agendamentos/batch?recursos={','.join(ids)}&semanas={SEMANA}")
+    assert resp.status_code == 400
+    resp = client.get(f"/api/agendamentos/batch?recursos={','.join(ids[:2])}&semanas={SEMANA}")
+    assert resp.status_code == 200 and sorted(resp.get_json()) == ids[:2]
@@ -0,0 +1,149 @@
+import os
+import json
+
+import pytest
+
+from core import models
+from core.models import DataManager
+
+ARQUIVO = 'agendamentos_lab1.json'
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(models, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(models, 'STORAGE_BACKEND', 'json')
+    DataManager.invalidate()
+    yield tmp_path
+    DataManager.invalidate()
+
+
+def _registros(n):
+    return [{'id': f'a{i}', 'recurso_id': 'lab1', 'semana_inicio': '2030-01-07', 'locked': False} for i in range(n)]
+
+
+def _journal(data_dir):
+    with open(data_dir / (ARQUIVO + DataManager.JOURNAL_SUFFIX), 'r', encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def _snapshot(data_dir):
+    with open(data_dir / ARQUIVO, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _travar(rows, rid):
+    return [dict(r, locked=True) if r['id'] == rid else r for r in rows]
+
+
+def _reler():
+    """Descarta o cache: a próxima leitura reaplica snapshot + journal do disco."""
+    DataManager.invalidate()
+    return DataManager.load(ARQUIVO)
+
+
+def test_replay_reaplica_o_journal(data_dir):
+    DataManager.save(ARQUIVO, _registros(3))
+    DataManager.update(ARQUIVO, lambda rows: rows + [{'id': 'a3', 'recurso_id': 'lab1'}])
+    DataManager.update(ARQUIVO, lambda rows: _travar(rows, 'a1'))
+    DataManager.update(ARQUIVO, lambda rows: [r for r in rows if r['id'] != 'a0'])
+
+    # Cabeçalho + uma linha por operação; o snapshot continua o original
+    linhas = _journal(data_dir)
+    assert len(linhas) == 4
+    assert [json.loads(l)['op'] for l in linhas[1:]] == ['create', 'lock', 'delete']
+    assert [r['id'] for r in _snapshot(data_dir)] == ['a0', 'a1', 'a2']
+
+    dados = _reler()
+    assert [r['id'] for r in dados] == ['a1', 'a2', 'a3']
+    assert dados[0]['locked'] is True
+
+    DataManager.compact(ARQUIVO)
+    assert _journal(data_dir) == []
+    assert _snapshot(data_dir) == dados
+
+
+def test_ultima_linha_truncada_e_ignorada(data_dir):
+    DataManager.save(ARQUIVO, _registros(2))
+    DataManager.update(ARQUIVO, lambda rows: _travar(rows, 'a0'))
+    # Queda de energia no meio do append seguinte
+    with open(data_dir / (ARQUIVO + DataManager.JOURNAL_SUFFIX), 'ab') as f:
+        f.write(b'{"op": "lock", "set": [[1, {"id": "a1", "lo')
+
+    dados = _reler()
+    assert [r['locked'] for r in dados] == [True, False]
+
+    # A escrita seguinte não emenda na linha incompleta: regrava o snapshot e zera o journal
+    DataManager.update(ARQUIVO, lambda rows: _travar(rows, 'a1'))
+    assert _journal(data_dir) == []
+    assert [r['locked'] for r in _snapshot(data_dir)] == [True, True]
+    assert [r['locked'] for r in _reler()] == [True, True]
+
+
+def test_compactacao_interrompida_nao_reaplica_o_journal(data_dir):
+    DataManager.save(ARQUIVO, _registros(2))
+    DataManager.update(ARQUIVO, lambda rows: rows + [{'id': 'a2', 'recurso_id': 'lab1'}])
+    DataManager.update(ARQUIVO, lambda rows: [r for r in rows if r['id'] != 'a0'])
+    esperado = _reler()
+
+    # Compactação interrompida entre a troca do snapshot e o truncamento do journal
+    path = DataManager._get_path(ARQUIVO)
+    assert DataManager._write_snapshot(path, esperado)
+    assert len(_journal(data_dir)) == 3
+
+    # O cabeçalho aponta para o snapshot anterior: o journal é ignorado (add/del não são aplicados duas vezes)
+    assert _reler() == esperado
+
+    DataManager.update(ARQUIVO, lambda rows: _travar(rows, 'a2'))
+    linhas = _journal(data_dir)
+    st = os.stat(path)
+    assert json.loads(linhas[0]) == {'base': [st.st_mtime_ns, st.st_size]}
+    assert len(linhas) == 2
+    assert [(r['id'], r['locked']) for r in _reler()] == [('a1', False), ('a2', True)]
+
+
+def test_registro_alterado_in_place_entra_no_journal(data_dir):
+    DataManager.save(ARQUIVO, _registros(2))
+
+    def travar_in_place(rows):
+        rows[1]['locked'] = True
+        return rows
+    DataManager.update(ARQUIVO, travar_in_place)
+
+    assert json.loads(_journal(data_dir)[1])['set'] == [[1, {**_registros(2)[1], 'locked': True}]]
+    assert [r['locked'] for r in _reler()] == [False, True]
+
+
+def test_registro_reaproveitado_via_secure_update(data_dir):
+    DataManager.save(ARQUIVO, models._encrypt_agendamentos(_registros(3)))
+    models.update_agendamentos(lambda rows: _travar(rows, 'a2'), 'lab1')
+
+    delta = json.loads(_journal(data_dir)[1])
+    assert [pos for pos, _ in delta['set']] == [2]
+    assert delta['add'] == [] and delta['del'] == []
+    assert [r['locked'] for r in models.get_agendamentos('lab1')] == [False, False, True]
+
+
+def test_reordenacao_regrava_o_snapshot(data_dir):
+    DataManager.save(ARQUIVO, _registros(3))
+    DataManager.update(ARQUIVO, lambda rows: list(reversed(rows)))
+
+    assert _journal(data_dir) == []
+    assert [r['id'] for r in _snapshot(data_dir)] == ['a2', 'a1', 'a0']
+
+
+def test_registros_selados_intactos_nao_sao_regravados(data_dir, monkeypatch):
+    monkeypatch.setattr(models, 'RECORD_ENCRYPTION', True)
+    rows = [dict(r, professor=f'Prof {i}', turma='1A') for i, r in enumerate(_registros(200))]
+    DataManager.save(ARQUIVO, models._encrypt_agendamentos(rows))
+    selados = DataManager.load(ARQUIVO)
+    assert all(models.SEALED_FIELD in r and 'professor' not in r for r in selados)
+
+    models.update_agendamentos(lambda rows: _travar(rows, 'a7'), 'lab1')
+
+    delta = json.loads(_journal(data_dir)[1])
+    assert [pos for pos, _ in delta['set']] == [7]
+    assert models.SEALED_FIELD in delta['set'][0][1]
+    dados = _reler()
+    assert dados[:7] == selados[:7] and dados[8:] == selados[8:]
+    assert [r['professor'] for r in models.get_agendamentos('lab1')][:8] == [f'Prof {i}' for i in range(8)]